@@ -0,0 +1,454 @@
+import os
+import sys
+import time
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+# the fewest timesteps worth handing to another thread
+MIN_SPLIT_TIMESTEPS = 4096
+
+_executors = dict()
+
+def get_executor(threads):
+	'''
+	The ThreadPoolExecutor of threads threads of this process, shared by all
+	aggregates. It is keyed by process id too, as a forked process inherits
+	the executors of its parent but not their threads.
+	'''
+	key = (os.getpid(), threads)
+	if key not in _executors:
+		_executors[key] = ThreadPoolExecutor(max_workers=threads)
+	return _executors[key]
+
+def get_segment_groups(starts, counts):
+	'''
+	Groups the segments starts[p]:starts[p] + counts[p] by length, as a list
+	of (segments, positions) pairs, positions[i] listing the indices of
+	segment segments[i]. Empty segments are left out.
+	'''
+	groups = list()
+	for length in np.unique(counts).tolist():
+		if length == 0:
+			continue
+		segments = np.nonzero(counts == length)[0]
+		groups.append((segments, starts[segments][:, np.newaxis] + np.arange(length)))
+	return groups
+
+def segment_sums(values, starts, counts):
+	'''
+	Sums values[starts[p]:starts[p] + counts[p]] for every p. The segments of
+	one length are gathered as the rows of a 2D array and reduced along the
+	rows, which gives each the pairwise sum np.sum gives on the segment
+	(np.add.reduceat does not add the values of a segment in a fixed order).
+	'''
+	sums = np.zeros(len(starts), dtype=np.float64)
+	for segments, positions in get_segment_groups(starts, counts):
+		sums[segments] = np.add.reduce(values[positions], axis=1)
+	return sums
+
+class PeriodAggregate:
+	'''
+	Statistics of the watermover type series of one transect (a timesteps x
+	types array) over the periods of a PeriodIndex, as periods x types
+	arrays. totals are added in time order per period from +0.0 with
+	np.add.accumulate (as np.bincount added them); sums, means and the
+	all-type columns are summed like segment_sums over the timesteps grouped
+	by period, the same pairwise sums np.sum and np.mean give on the period's
+	values of each type. all_totals and all_means cover the values of every
+	type in the period together.
+	With threads > 1 the periods are split into runs of whole periods (chunks
+	of the time axis for the daily, monthly and yearly periods), each reduced
+	to its partial period arrays on a thread pool, and the partials are
+	combined at the end. No period is split, so every thread count gives the
+	same values.
+	'''
+	ARRAYS = ['totals', 'sums', 'means', 'all_totals', 'all_means']
+
+	def __init__(self, periods, volumes, threads=1):
+		(timesteps, types) = volumes.shape
+		self.periods = periods
+		self.counts = periods.counts
+		self.totals = np.zeros((len(periods), types), dtype=np.float64)
+		self.sums = np.zeros((len(periods), types), dtype=np.float64)
+		self.means = np.zeros((len(periods), types), dtype=np.float64)
+		self.all_totals = np.zeros(len(periods), dtype=np.float64)
+		self.all_means = np.zeros(len(periods), dtype=np.float64)
+		self.size = 0
+		if types == 0 or len(periods) == 0:
+			return
+		self.size = len(periods)
+		splits = self.get_splits(threads)
+		if len(splits) == 1:
+			partials = [self.reduce(volumes, 0, len(periods))]
+		else:
+			futures = [get_executor(threads).submit(self.reduce, volumes, first, last) for first, last in splits]
+			partials = [future.result() for future in futures]
+		for (first, last), (totals, sums, all_totals) in zip(splits, partials):
+			self.totals[first:last] = totals
+			self.sums[first:last] = sums
+			self.all_totals[first:last] = all_totals
+		self.means = self.sums / self.counts[:, np.newaxis]
+		self.all_means = self.all_totals / (self.counts * types)
+
+	def get_splits(self, threads):
+		'''
+		Splits the periods into up to threads runs of consecutive periods of
+		about equal timesteps, at least MIN_SPLIT_TIMESTEPS each, as (first,
+		last) pairs.
+		'''
+		timesteps = int(self.counts.sum())
+		chunks = max(1, min(threads, timesteps // MIN_SPLIT_TIMESTEPS))
+		if chunks == 1:
+			return [(0, len(self.counts))]
+		bounds = np.searchsorted(self.periods.starts, np.linspace(0, timesteps, chunks + 1)[1:-1])
+		bounds = np.unique(np.concatenate([[0], bounds, [len(self.counts)]]))
+		return list(zip(bounds[:-1].tolist(), bounds[1:].tolist()))
+
+	def reduce(self, volumes, first, last):
+		'''
+		The totals, sums and all_totals of periods first to last - 1, gathered
+		from their timesteps of volumes. The reductions are numpy ufunc loops,
+		which release the GIL.
+		'''
+		start = self.periods.starts[first]
+		stop = self.periods.starts[last - 1] + self.counts[last - 1]
+		values = volumes[self.periods.order[start:stop]]
+		starts = self.periods.starts[first:last] - start
+		counts = self.counts[first:last]
+		types = values.shape[1]
+		totals = np.empty((last - first, types), dtype=np.float64)
+		sums = np.empty((last - first, types), dtype=np.float64)
+		groups = get_segment_groups(starts, counts)
+		for j in range(types):
+			column = np.ascontiguousarray(values[:, j])
+			for segments, positions in groups:
+				rows = column[positions]
+				totals[segments, j] = 0.0 + np.add.accumulate(rows, axis=1)[:, -1]
+				sums[segments, j] = np.add.reduce(rows, axis=1)
+		all_totals = segment_sums(values.ravel(), starts * types, counts * types)
+		return totals, sums, all_totals
+
+	def __len__(self):
+		return self.size
+
+	@staticmethod
+	def from_arrays(periods, arrays):
+		'''
+		The PeriodAggregate over periods whose statistics are the to_arrays()
+		of another, as sent back by a worker process.
+		'''
+		aggregate = object.__new__(PeriodAggregate)
+		aggregate.periods = periods
+		aggregate.counts = periods.counts
+		for name in PeriodAggregate.ARRAYS:
+			setattr(aggregate, name, arrays[name])
+		aggregate.size = 0
+		if aggregate.totals.shape[1] != 0:
+			aggregate.size = len(periods)
+		return aggregate
+
+	def to_arrays(self):
+		'''
+		The statistics without the PeriodIndex, which is as long as the run.
+		'''
+		return dict((name, getattr(self, name)) for name in PeriodAggregate.ARRAYS)
+
+class SeasonAggregate:
+	'''
+	Aggregates of one season from the in-season timesteps of a SeasonIndex:
+	yearly per range year (its sums are the season totals) and season over
+	all range years together (its means are the season averages).
+	'''
+	def __init__(self, season, volumes, threads=1):
+		self.date_range = season.date_range
+		volumes = volumes[season.timesteps]
+		self.yearly = PeriodAggregate(season.yearly, volumes, threads)
+		self.season = PeriodAggregate(season.season, volumes, threads)
+
+	@staticmethod
+	def from_arrays(season, arrays):
+		aggregate = object.__new__(SeasonAggregate)
+		aggregate.date_range = season.date_range
+		aggregate.yearly = PeriodAggregate.from_arrays(season.yearly, arrays['yearly'])
+		aggregate.season = PeriodAggregate.from_arrays(season.season, arrays['season'])
+		return aggregate
+
+	def to_arrays(self):
+		return {'yearly': self.yearly.to_arrays(), 'season': self.season.to_arrays()}
+
+class PeriodAccumulator:
+	'''
+	Running statistics of the watermover type series of one transect over
+	the periods of a PeriodIndex, folded in one time chunk at a time by add()
+	so the raw values need not be kept: memory grows with the number of
+	periods, not timesteps. Counts, totals, mins and maxes are accumulated
+	per period. means and m2 (the sum of squared deviations from the mean)
+	use Welford's update in its batched form, merging the mean and m2 of the
+	chunk's values into the running ones. It has the attributes of a
+	PeriodAggregate, equal to them up to rounding, plus mins, maxs and
+	get_variances().
+	'''
+	ARRAYS = ['counts', 'totals', 'means', 'm2', 'mins', 'maxs', 'all_totals']
+
+	def __init__(self, periods, types, timesteps):
+		self.periods = periods
+		self.codes = periods.codes
+		if periods.timesteps is not None:
+			self.codes = np.full(timesteps, -1, dtype=np.int64)
+			self.codes[periods.timesteps] = periods.codes
+		shape = (len(periods), types)
+		self.counts = np.zeros(len(periods), dtype=np.int64)
+		self.totals = np.zeros(shape, dtype=np.float64)
+		self.means = np.zeros(shape, dtype=np.float64)
+		self.m2 = np.zeros(shape, dtype=np.float64)
+		self.mins = np.full(shape, np.inf)
+		self.maxs = np.full(shape, -np.inf)
+		self.all_totals = np.zeros(len(periods), dtype=np.float64)
+		self.size = 0
+		if types != 0:
+			self.size = len(periods)
+
+	def __len__(self):
+		return self.size
+
+	@property
+	def sums(self):
+		return self.totals
+
+	@property
+	def all_means(self):
+		return self.all_totals / (self.counts * self.totals.shape[1])
+
+	def add(self, start, volumes):
+		'''
+		Folds the volumes of timesteps start, start + 1, ... (a timesteps x
+		types array) into the statistics of their periods.
+		'''
+		codes = self.codes[start:start + len(volumes)]
+		if self.size == 0 or len(codes) == 0:
+			return
+		if codes.min() < 0:
+			volumes = volumes[codes >= 0]
+			codes = codes[codes >= 0]
+		periods = len(self.periods)
+		chunk_counts = np.bincount(codes, minlength=periods)
+		touched = np.nonzero(chunk_counts)[0]
+		counts = self.counts + chunk_counts
+		for j in range(volumes.shape[1]):
+			values = volumes[:, j]
+			chunk_totals = np.bincount(codes, weights=values, minlength=periods)
+			chunk_means = np.zeros(periods, dtype=np.float64)
+			chunk_means[touched] = chunk_totals[touched] / chunk_counts[touched]
+			deviations = values - chunk_means[codes]
+			chunk_m2 = np.bincount(codes, weights=deviations * deviations, minlength=periods)
+			delta = chunk_means[touched] - self.means[touched, j]
+			self.means[touched, j] += delta * chunk_counts[touched] / counts[touched]
+			self.m2[touched, j] += chunk_m2[touched] + delta * delta * self.counts[touched] * chunk_counts[touched] / counts[touched]
+			self.totals[:, j] += chunk_totals
+			np.minimum.at(self.mins[:, j], codes, values)
+			np.maximum.at(self.maxs[:, j], codes, values)
+		self.all_totals += np.bincount(codes, weights=volumes.sum(axis=1), minlength=periods)
+		self.counts = counts
+
+	def get_variances(self, ddof=0):
+		'''
+		Variances of each type in each period, nan where a period has ddof
+		values or fewer.
+		'''
+		divisors = (self.counts - ddof).astype(np.float64)
+		divisors[divisors <= 0] = np.nan
+		return self.m2 / divisors[:, np.newaxis]
+
+	@staticmethod
+	def from_arrays(periods, arrays):
+		'''
+		The PeriodAccumulator over periods whose statistics are the
+		to_arrays() of another, as sent back by a worker process. It has no
+		period codes, so nothing more can be added to it.
+		'''
+		accumulator = object.__new__(PeriodAccumulator)
+		accumulator.periods = periods
+		accumulator.codes = None
+		for name in PeriodAccumulator.ARRAYS:
+			setattr(accumulator, name, arrays[name])
+		accumulator.size = 0
+		if accumulator.totals.shape[1] != 0:
+			accumulator.size = len(periods)
+		return accumulator
+
+	def to_arrays(self):
+		return dict((name, getattr(self, name)) for name in PeriodAccumulator.ARRAYS)
+
+class SeasonAccumulator:
+	'''
+	The PeriodAccumulator counterpart of SeasonAggregate.
+	'''
+	def __init__(self, season, types, timesteps):
+		self.date_range = season.date_range
+		self.yearly = PeriodAccumulator(season.yearly, types, timesteps)
+		self.season = PeriodAccumulator(season.season, types, timesteps)
+
+	def add(self, start, volumes):
+		self.yearly.add(start, volumes)
+		self.season.add(start, volumes)
+
+	@staticmethod
+	def from_arrays(season, arrays):
+		accumulator = object.__new__(SeasonAccumulator)
+		accumulator.date_range = season.date_range
+		accumulator.yearly = PeriodAccumulator.from_arrays(season.yearly, arrays['yearly'])
+		accumulator.season = PeriodAccumulator.from_arrays(season.season, arrays['season'])
+		return accumulator
+
+	def to_arrays(self):
+		return {'yearly': self.yearly.to_arrays(), 'season': self.season.to_arrays()}
+
+def get_accumulators(calendar, periods, seasons, types):
+	'''
+	A PeriodAccumulator for each of periods and a SeasonAccumulator for each
+	date range of seasons, keyed like the aggregates of a TransectResult.
+	'''
+	accumulators = dict()
+	for period in periods:
+		accumulators[period] = PeriodAccumulator(calendar.get_periods(period), types, len(calendar))
+	for date_range in seasons or []:
+		accumulators[date_range] = SeasonAccumulator(calendar.get_season(date_range), types, len(calendar))
+	return accumulators
+
+class TransectResult:
+	'''
+	Result of one transect: its nodelist entry and the in-transect volume of
+	every watermover type, kept as one contiguous float64 series per type
+	(series[j] over the timesteps of the run's CalendarIndex, whose period
+	and season indexes all transects share). daily, monthly, yearly and
+	month_of_year are PeriodAggregate views of the series and get_season()
+	the SeasonAggregate of a date range, each computed on first use. seasons
+	lists the date ranges of the seasonal reports. A result built from
+	accumulators (a dict of PeriodAccumulator by period and SeasonAccumulator
+	by date range) has no series and only the aggregates accumulated.
+	threads is the number of threads each aggregate is computed with.
+	'''
+	__slots__ = ['nodelist', 'calendar', 'watermover_names', 'columns', 'series', 'seasons', 'threads', '_aggregates']
+
+	def __init__(self, nodelist, calendar, watermover_names, volumes, seasons=None, accumulators=None, threads=1):
+		self.nodelist = nodelist
+		self.threads = threads
+		self.calendar = calendar
+		self.watermover_names = watermover_names
+		self.columns = dict((watermover_name, j) for j, watermover_name in enumerate(watermover_names))
+		self.series = None
+		if volumes is not None:
+			volumes = np.asarray(volumes, dtype=np.float64).reshape(len(calendar), len(watermover_names))
+			self.series = np.ascontiguousarray(volumes.T)
+		self.seasons = list()
+		if seasons:
+			self.seasons = list(seasons)
+		self._aggregates = dict()
+		if accumulators:
+			self._aggregates.update(accumulators)
+
+	@property
+	def volumes(self):
+		if self.series is None:
+			return None
+		return self.series.T
+
+	@property
+	def daily(self):
+		return self.get_aggregate('daily')
+
+	@property
+	def monthly(self):
+		return self.get_aggregate('monthly')
+
+	@property
+	def yearly(self):
+		return self.get_aggregate('yearly')
+
+	@property
+	def month_of_year(self):
+		return self.get_aggregate('month_of_year')
+
+	def get_aggregate(self, period):
+		if period not in self._aggregates:
+			self.__check_series(period)
+			self._aggregates[period] = PeriodAggregate(self.calendar.get_periods(period), self.volumes, self.threads)
+		return self._aggregates[period]
+
+	def get_season(self, date_range):
+		if date_range not in self._aggregates:
+			self.__check_series(date_range)
+			self._aggregates[date_range] = SeasonAggregate(self.calendar.get_season(date_range), self.volumes, self.threads)
+		return self._aggregates[date_range]
+
+	def to_arrays(self):
+		'''
+		The statistics of every aggregate computed so far, keyed by period or
+		date range, for TransectResult.from_arrays in another process.
+		'''
+		return dict((key, aggregate.to_arrays()) for key, aggregate in self._aggregates.items())
+
+	@staticmethod
+	def from_arrays(nodelist, calendar, watermover_names, arrays, seasons=None, accumulated=False, threads=1):
+		'''
+		The TransectResult of the to_arrays() of another, with its periods
+		and seasons from calendar. accumulated tells whether they came from
+		accumulators or aggregates.
+		'''
+		aggregates = dict()
+		for key, aggregate_arrays in arrays.items():
+			if isinstance(key, str) and accumulated:
+				aggregates[key] = PeriodAccumulator.from_arrays(calendar.get_periods(key), aggregate_arrays)
+			elif isinstance(key, str):
+				aggregates[key] = PeriodAggregate.from_arrays(calendar.get_periods(key), aggregate_arrays)
+			elif accumulated:
+				aggregates[key] = SeasonAccumulator.from_arrays(calendar.get_season(key), aggregate_arrays)
+			else:
+				aggregates[key] = SeasonAggregate.from_arrays(calendar.get_season(key), aggregate_arrays)
+		return TransectResult(nodelist, calendar, watermover_names, None, seasons, aggregates, threads)
+
+	def __check_series(self, period):
+		if self.series is None:
+			raise ValueError("%s aggregates were not accumulated for this transect" % str(period))
+
+	def get_column(self, watermover_name):
+		return self.columns.get(watermover_name, -1)
+
+	def get_series(self, watermover_name):
+		j = self.get_column(watermover_name)
+		if j < 0 or self.series is None:
+			return None
+		return self.series[j]
+
+if __name__ == "__main__":
+	import argparse
+	from PMGTransect_Calendar import CalendarIndex
+	from PMGTransect_Flux import get_random_volumes
+	program_name = os.path.splitext(os.path.basename(sys.argv[0]))[0]
+	parser = argparse.ArgumentParser(prog=program_name, description='''Times the period aggregates of a
+		random daily series with one thread and with --threads threads, and checks that they are the same.''')
+	parser.add_argument('-d', '--days', action='store', type=int, default=200000, help='Days of the series.')
+	parser.add_argument('-y', '--types', action='store', type=int, default=8, help='Watermover types of the series.')
+	parser.add_argument('--threads', action='store', type=int, default=os.cpu_count(), help='Threads of the split aggregates.')
+	parser.add_argument('-r', '--repeat', action='store', type=int, default=3, help='Timed runs of each; the best is reported.')
+	args = parser.parse_args()
+	calendar = CalendarIndex('1965-01-01', np.arange(args.days))
+	volumes = get_random_volumes((args.days, args.types), 0).astype(np.float64)
+	print('%d days, %d types, %d cores' % (args.days, args.types, os.cpu_count()))
+	failed = False
+	for period in ['daily', 'monthly', 'yearly', 'month_of_year']:
+		periods = calendar.get_periods(period)
+		timings = dict()
+		aggregates = dict()
+		for threads in [1, args.threads]:
+			timings[threads] = list()
+			for i in range(args.repeat):
+				start_time = time.time()
+				aggregates[threads] = PeriodAggregate(periods, volumes, threads)
+				timings[threads].append(time.time() - start_time)
+		same = all([aggregates[1].__dict__[name].tobytes() == aggregates[args.threads].__dict__[name].tobytes() \
+			for name in ['totals', 'sums', 'means', 'all_totals', 'all_means']])
+		failed = failed or not same
+		print('%-14s 1 thread %8.4f s  %d threads %8.4f s  %s' % (period, min(timings[1]), args.threads, min(timings[args.threads]), \
+			'same aggregates' if same else 'DIFFERENT AGGREGATES'))
+	sys.exit(1 if failed else 0)
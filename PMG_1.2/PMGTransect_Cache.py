@@ -0,0 +1,82 @@
+import os
+import hashlib
+import numpy as np
+
+CACHE_DIR_ENV = "PMG_TOPOLOGY_CACHE"
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "pmg_transect")
+DEFAULT_SIZE_LIMIT = 1024 * 1024 * 1024
+HEADER_BYTES = 65536
+FINGERPRINT_FIELD = "fingerprint"
+
+class TopologyCache:
+	'''
+	On-disk cache of the mesh arrays read by Transect_NetCDF.read_topology. Each
+	netCDF file gets one .npz entry in the cache directory holding the file's
+	fingerprint (size, mtime and a hash of the header bytes); an entry whose
+	fingerprint no longer matches the file is discarded and rebuilt. Entries
+	are evicted least recently used first once the directory passes size_limit.
+	'''
+	def __init__(self, cache_dir=None, size_limit=DEFAULT_SIZE_LIMIT):
+		if not cache_dir:
+			cache_dir = os.environ.get(CACHE_DIR_ENV, DEFAULT_CACHE_DIR)
+		self.cache_dir = cache_dir
+		self.size_limit = size_limit
+
+	@staticmethod
+	def get_fingerprint(filename):
+		stat = os.stat(filename)
+		header_hash = hashlib.sha1()
+		with open(filename, 'rb') as netcdf_file:
+			header_hash.update(netcdf_file.read(HEADER_BYTES))
+		return "%d:%d:%s" % (stat.st_size, stat.st_mtime_ns, header_hash.hexdigest())
+
+	def get_path(self, filename):
+		name = hashlib.sha1(os.path.abspath(filename).encode("utf-8")).hexdigest()
+		return os.path.join(self.cache_dir, "%s.npz" % name)
+
+	def load(self, filename):
+		path = self.get_path(filename)
+		if not os.path.isfile(path):
+			return None
+		try:
+			with np.load(path, allow_pickle=False) as entry:
+				if str(entry[FINGERPRINT_FIELD]) != self.get_fingerprint(filename):
+					print("topology cache entry for %s is stale" % filename)
+					os.remove(path)
+					return None
+				topology = dict((name, entry[name]) for name in entry.files if name != FINGERPRINT_FIELD)
+			os.utime(path)
+			return topology
+		except Exception as e:
+			print("unable to read topology cache %s: %s" % (path, e))
+			return None
+
+	def save(self, filename, topology):
+		path = self.get_path(filename)
+		temp_path = "%s.%d.tmp" % (path, os.getpid())
+		try:
+			os.makedirs(self.cache_dir, exist_ok=True)
+			arrays = dict(topology)
+			arrays[FINGERPRINT_FIELD] = np.array(self.get_fingerprint(filename))
+			with open(temp_path, 'wb') as entry:
+				np.savez(entry, **arrays)
+			os.replace(temp_path, path)
+			self.evict()
+		except Exception as e:
+			print("unable to write topology cache %s: %s" % (path, e))
+			if os.path.exists(temp_path):
+				os.remove(temp_path)
+
+	def evict(self):
+		entries = list()
+		for name in os.listdir(self.cache_dir):
+			if name.endswith(".npz"):
+				path = os.path.join(self.cache_dir, name)
+				stat = os.stat(path)
+				entries.append((stat.st_mtime, stat.st_size, path))
+		total_size = sum([size for _, size, _ in entries])
+		for _, size, path in sorted(entries):
+			if total_size <= self.size_limit:
+				break
+			os.remove(path)
+			total_size -= size
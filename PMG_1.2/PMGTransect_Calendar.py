@@ -0,0 +1,148 @@
+import numpy as np
+
+SECS_PER_DAY = 86400
+
+class CalendarIndex:
+	'''
+	Timestamps of a run as a datetime64 array with the matching year, month,
+	day and day-of-year integer arrays, built once so the per-timestep work
+	never goes through datetime or string parsing. The netCDF timestamps are
+	whole days after the base time (fractions are truncated, as before).
+	'''
+	def __init__(self, base_time, timestamps):
+		days = np.trunc(np.asarray(timestamps, dtype=np.float64)).astype(np.int64)
+		self.timestamps = np.datetime64(base_time, 's') + (days * SECS_PER_DAY).astype('timedelta64[s]')
+		dates = self.timestamps.astype('datetime64[D]')
+		first_of_month = dates.astype('datetime64[M]')
+		first_of_year = dates.astype('datetime64[Y]')
+		self.years = first_of_year.astype(np.int64) + 1970
+		self.months = (first_of_month - first_of_year).astype(np.int64) + 1
+		self.days = (dates - first_of_month.astype('datetime64[D]')).astype(np.int64) + 1
+		self.days_of_year = (dates - first_of_year.astype('datetime64[D]')).astype(np.int64) + 1
+		self.__periods = dict()
+		self.__seasons = dict()
+
+	def __len__(self):
+		return len(self.timestamps)
+
+	def get_datetime(self, t):
+		return self.timestamps[t].astype(object)
+
+	def format(self, t, time_fmt):
+		return self.get_datetime(t).strftime(time_fmt)
+
+	def get_periods(self, period):
+		'''
+		Returns the PeriodIndex grouping the timesteps by 'daily', 'monthly',
+		'yearly' or 'month_of_year' periods, built once per calendar.
+		'''
+		if period not in self.__periods:
+			if period == 'daily':
+				period_keys = self.years * 10000 + self.months * 100 + self.days
+			elif period == 'monthly':
+				period_keys = self.years * 100 + self.months
+			elif period == 'yearly':
+				period_keys = self.years
+			elif period == 'month_of_year':
+				period_keys = self.months
+			else:
+				raise ValueError("unknown calendar period %s" % period)
+			self.__periods[period] = PeriodIndex(self, period_keys)
+		return self.__periods[period]
+
+	def get_season(self, date_range):
+		'''
+		Returns the SeasonIndex of a (month1, day1, month2, day2) date range,
+		built once per calendar.
+		'''
+		if date_range not in self.__seasons:
+			self.__seasons[date_range] = SeasonIndex(self, date_range)
+		return self.__seasons[date_range]
+
+class PeriodIndex:
+	'''
+	Grouping of the timesteps of a calendar into periods, numbered in calendar
+	order. codes[t] is the period of timestep t and counts[p] the number of
+	timesteps in period p. order lists the timesteps period by period, in
+	time order within each period, and starts[p] is where period p begins in
+	order. keys holds the period key of each period and years, months and
+	days its first date. When timesteps is given the index covers only those
+	timesteps of the calendar, period_keys holding one key for each, and
+	codes and order refer to positions in timesteps.
+	'''
+	def __init__(self, calendar, period_keys, timesteps=None):
+		(keys, first, codes) = np.unique(period_keys, return_index=True, return_inverse=True)
+		self.timesteps = timesteps
+		if timesteps is not None:
+			first = timesteps[first]
+		self.keys = keys.tolist()
+		self.codes = codes.reshape(-1)
+		self.counts = np.bincount(self.codes, minlength=len(keys))
+		self.order = np.argsort(self.codes, kind='stable')
+		self.starts = np.cumsum(self.counts) - self.counts
+		self.years = calendar.years[first].tolist()
+		self.months = calendar.months[first].tolist()
+		self.days = calendar.days[first].tolist()
+
+	def __len__(self):
+		return len(self.counts)
+
+class SeasonIndex:
+	'''
+	Timesteps of a calendar inside a (month1, day1, month2, day2) season.
+	mask[t] tells whether day t is in the season (see in_range, evaluated
+	once per distinct month and day) and range_years[t] is the year the
+	season containing day t ends in, so a season running over the new year
+	puts November 1999 and February 2000 in range year 2000. timesteps lists
+	the days in the season, yearly groups them by range year and season
+	groups them all into one period.
+	'''
+	def __init__(self, calendar, date_range):
+		(month1, day1, month2, day2) = date_range
+		self.date_range = date_range
+		month_days = calendar.months * 100 + calendar.days
+		(unique_month_days, inverse) = np.unique(month_days, return_inverse=True)
+		inside = np.array([SeasonIndex.in_range(date_range, month_day // 100, month_day % 100) \
+			for month_day in unique_month_days.tolist()], dtype=bool)
+		self.mask = inside[inverse.reshape(-1)]
+		self.range_years = calendar.years.copy()
+		if month1 > month2 or (month1 == month2 and day1 > day2):
+			self.range_years += month_days >= month1 * 100 + day1
+		self.timesteps = np.nonzero(self.mask)[0]
+		self.yearly = PeriodIndex(calendar, self.range_years[self.timesteps], self.timesteps)
+		self.season = PeriodIndex(calendar, np.zeros(len(self.timesteps), dtype=np.int64), self.timesteps)
+
+	@staticmethod
+	def in_range(date_range, month, day):
+		(month1, day1, month2, day2) = date_range
+		if month1 <= month2:
+			if month > month1 and month < month2:
+				return True
+			elif month == month1 and month < month2:
+				if day >= day1:
+					return True
+				else:
+					return False
+			elif month == month1 and month == month2:
+				if day >= day1 and day <= day2:
+					return True
+				elif day1 > day2 and day <= day2:
+					return True
+				else:
+					return False
+			elif month == month2:
+				if day <= day2:
+					return True
+				else:
+					return False
+			else:
+				return False
+		else: # month1 > month2:
+			if month > month1 or month < month2:
+				return True
+			elif month == month1 and day >= day1:
+				return True
+			elif month == month2 and day <= day2:
+				return True
+			else:
+				return False
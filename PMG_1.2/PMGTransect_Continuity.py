@@ -37,40 +37,38 @@ class Transect_Continuity_Process:
 		end_date = netcdf.getEndDate()
 		list_continuity_data = list()
 		for key, value in data.items():
-			nodes = value['nodelist']['node']
-			walls = value['nodelist']['node_pair']
-			watermover_name = sorted(value['nodelist']['watermover_names'].keys())
-			watermovers = sorted(value['nodelist']['watermovers'].keys())
-			years = sorted(value['years'].keys(), key=ProcessData.cmp_to_key(ProcessData.intSort))
+			nodes = value.nodelist['node']
+			walls = value.nodelist['node_pair']
+			watermover_name = sorted(value.nodelist['watermover_names'].keys())
+			watermovers = sorted(value.nodelist['watermovers'].keys())
 			data_dict = dict()
 			data_dict["DATE"] = list()
 			for wm in watermovers:
 				data_dict[wm] = list()
 			total_name = 'TOTAL (%s)' % netcdf._watermovervolume_units
 			data_dict[total_name] = list()
-			for year in years:
-				months = sorted(value['years'][year]['months'].keys(), key=ProcessData.cmp_to_key(ProcessData.intSort))
-				for month in months:
-					date_t = '%d/%d ' % (month, year)
-					data_list = data_dict["DATE"]
-					date = datetime(year, month, 1)
-					data_list.append(date)
-					data_dict["DATE"] = data_list
-					for wm in watermovers:
-						temp_list = data_dict[wm] 
-						if wm in value['years'][year]['months'][month]['values']:
-							temp_list.append(sum(value['years'][year]['months'][month]['values'][wm]))
-						data_dict[wm] = temp_list
-					total_list = data_dict[total_name] 
-					total_list.append(np.sum(value['years'][year]['months'][month]['all']))
-					data_dict[total_name] = total_list
+			monthly = value.monthly
+			for p in range(len(monthly)):
+				(year, month) = (monthly.periods.years[p], monthly.periods.months[p])
+				date_t = '%d/%d ' % (month, year)
+				data_list = data_dict["DATE"]
+				date = datetime(year, month, 1)
+				data_list.append(date)
+				data_dict["DATE"] = data_list
+				for wm in watermovers:
+					temp_list = data_dict[wm] 
+					j = value.get_column(wm)
+					if j >= 0:
+						temp_list.append(monthly.totals[p, j])
+					data_dict[wm] = temp_list
+				total_list = data_dict[total_name] 
+				total_list.append(monthly.all_totals[p])
+				data_dict[total_name] = total_list
 			distance_walls = dict()
 			total_distance = 0
-			if len(netcdf.coordinates.keys()) != 0:
-				total_distance = 0
-				for nodepair in value['nodelist']['node_pair']:
-					distance = ProcessData.get_distance(netcdf, nodepair)
-					total_distance = total_distance + distance
+			if len(netcdf.coordinates) != 0:
+				(wall_distances, total_distance) = ProcessData.get_wall_distances(netcdf, value.nodelist)
+				for nodepair, distance in zip(value.nodelist['node_pair'], wall_distances):
 					distance_walls[distance] = nodepair
 			list_continuity_data.append(Continuity_Data(start_date, end_date, data_dict, distance_walls, watermover_name, walls, nodes, total_distance))
 		return list_continuity_data
@@ -0,0 +1,288 @@
+import os
+import sys
+import time
+import numpy as np
+from PMGTransect_Output import ReportType
+try:
+	import numba
+except ImportError:
+	numba = None
+
+NUMBA_AVAILABLE = numba != None
+KERNELS = ['python', 'numpy', 'sparse', 'numba']
+DEFAULT_KERNEL = 'numpy'
+
+def gather_sum(values, in_columns, out_columns, segment_columns, in_volumes, out_volumes, volumes):
+	'''
+	The numba kernel: for each row of values, adds the in columns to
+	in_volumes and volumes, the out columns to out_volumes and from volumes,
+	and the segment columns to volumes, in that order. It is compiled with
+	numba.njit when numba is installed.
+	'''
+	for t in range(values.shape[0]):
+		in_volume = 0.0
+		out_volume = 0.0
+		volume = 0.0
+		for i in range(len(in_columns)):
+			watermovervolume = np.float64(values[t, in_columns[i]])
+			in_volume += watermovervolume
+			volume += watermovervolume
+		for i in range(len(out_columns)):
+			watermovervolume = np.float64(values[t, out_columns[i]])
+			out_volume += watermovervolume
+			volume -= watermovervolume
+		for i in range(len(segment_columns)):
+			volume += np.float64(values[t, segment_columns[i]])
+		in_volumes[t] = in_volume
+		out_volumes[t] = out_volume
+		volumes[t] = volume
+
+if NUMBA_AVAILABLE:
+	gather_sum = numba.njit(nogil=True)(gather_sum)
+
+class TransectFlux:
+	'''
+	In, out and net volumes crossing one transect for a range of timesteps, as
+	timesteps x watermover type arrays with the types in sorted order, and the
+	net total over all types. Segment movers are added to the ManningCircle
+	net volume. compute() fills them from a volume block with the python,
+	numpy or numba kernel (which needs numba installed), TransectIncidence
+	from its product with a volume block. Every kernel
+	adds the watermovers in the order of the original per-timestep loop, so
+	all give identical volumes.
+	'''
+	def __init__(self, start, watermover_names, in_volumes, out_volumes, volumes):
+		self.start = start
+		self.stop = start + len(volumes)
+		self.watermover_names = watermover_names
+		self.in_volumes = in_volumes
+		self.out_volumes = out_volumes
+		self.volumes = volumes
+		self.total = np.zeros(len(volumes), dtype=np.float64)
+		for j in range(len(watermover_names)):
+			self.total += volumes[:, j]
+
+	@staticmethod
+	def get_segment_movers(watermover_name, segment_watermovers):
+		report_type = ReportType()
+		if watermover_name == report_type.manning_circle and segment_watermovers:
+			return segment_watermovers
+		return []
+
+	@staticmethod
+	def compute(volume_block, watermovers, segment_watermovers=None, kernel=DEFAULT_KERNEL):
+		watermover_names = sorted(watermovers.keys())
+		shape = (volume_block.stop - volume_block.start, len(watermover_names))
+		in_volumes = np.zeros(shape, dtype=np.float64)
+		out_volumes = np.zeros(shape, dtype=np.float64)
+		volumes = np.zeros(shape, dtype=np.float64)
+		for j in range(len(watermover_names)):
+			watermover_name = watermover_names[j]
+			segments = TransectFlux.get_segment_movers(watermover_name, segment_watermovers)
+			kernel_function = TransectFlux.get_kernel(kernel)
+			kernel_function(volume_block, watermovers[watermover_name], segments, in_volumes[:, j], out_volumes[:, j], volumes[:, j])
+		return TransectFlux(volume_block.start, watermover_names, in_volumes, out_volumes, volumes)
+
+	@staticmethod
+	def get_kernel(kernel):
+		if kernel == 'python':
+			return TransectFlux.python_kernel
+		if kernel == 'numba':
+			if not NUMBA_AVAILABLE:
+				raise ValueError('the numba kernel needs numba, which is not installed')
+			return TransectFlux.numba_kernel
+		return TransectFlux.numpy_kernel
+
+	@staticmethod
+	def python_kernel(volume_block, watermover, segments, in_volumes, out_volumes, volumes):
+		for t in range(volume_block.start, volume_block.stop):
+			in_volume = 0.0
+			out_volume = 0.0
+			volume = 0.0
+			for k in watermover['in']:
+				watermovervolume = volume_block.get_volume(t, k)
+				in_volume += watermovervolume
+				volume += watermovervolume
+			for k in watermover['out']:
+				watermovervolume = volume_block.get_volume(t, k)
+				out_volume += watermovervolume
+				volume -= watermovervolume
+			for k in segments:
+				volume += volume_block.get_volume(t, k)
+			in_volumes[t - volume_block.start] = in_volume
+			out_volumes[t - volume_block.start] = out_volume
+			volumes[t - volume_block.start] = volume
+
+	@staticmethod
+	def numpy_kernel(volume_block, watermover, segments, in_volumes, out_volumes, volumes):
+		in_columns = volume_block.values[:, volume_block.get_columns(watermover['in'])].astype(np.float64)
+		out_columns = volume_block.values[:, volume_block.get_columns(watermover['out'])].astype(np.float64)
+		segment_columns = volume_block.values[:, volume_block.get_columns(segments)].astype(np.float64)
+		for i in range(in_columns.shape[1]):
+			in_volumes += in_columns[:, i]
+			volumes += in_columns[:, i]
+		for i in range(out_columns.shape[1]):
+			out_volumes += out_columns[:, i]
+			volumes -= out_columns[:, i]
+		for i in range(segment_columns.shape[1]):
+			volumes += segment_columns[:, i]
+
+	@staticmethod
+	def numba_kernel(volume_block, watermover, segments, in_volumes, out_volumes, volumes):
+		gather_sum(np.asarray(volume_block.values), volume_block.get_columns(watermover['in']), \
+			volume_block.get_columns(watermover['out']), volume_block.get_columns(segments), in_volumes, out_volumes, volumes)
+
+	def get_row(self, t):
+		return self.in_volumes[t - self.start].tolist(), self.out_volumes[t - self.start].tolist(), \
+			self.volumes[t - self.start].tolist()
+
+	def format_row(self, t, timestamp):
+		'''
+		Returns the time series report lines of timestep t, one per type.
+		'''
+		(in_volumes, out_volumes, volumes) = self.get_row(t)
+		lines = list()
+		for j in range(len(self.watermover_names)):
+			if j == 0:
+				lines.append("%s,  %-15s,  %20.5f,  %20.5f,  %20.5f" % (timestamp, self.watermover_names[j], in_volumes[j], out_volumes[j], volumes[j]))
+			else:
+				lines.append('                   ,  %-15s,  %20.5f,  %20.5f,  %20.5f' % (self.watermover_names[j], in_volumes[j], out_volumes[j], volumes[j]))
+		return lines
+
+class TransectIncidence:
+	'''
+	Signed incidence matrix of a set of transects in CSR form, one column per
+	watermover and three rows per transect and watermover type: the in row
+	(+1 for each in mover), the out row (+1 for each out mover) and the net
+	row (+1 in, -1 out, +1 segment movers). multiply() gives the flux series
+	of every row from one pass over a volume block. Each row is summed in CSR
+	order, so the volumes match the per-transect kernels exactly.
+	'''
+	def __init__(self, transects):
+		row_watermovers = list()
+		row_signs = list()
+		self.watermover_names = list()
+		self.first_rows = list()
+		for watermovers, segment_watermovers in transects:
+			watermover_names = sorted(watermovers.keys())
+			self.watermover_names.append(watermover_names)
+			self.first_rows.append(len(row_watermovers))
+			for watermover_name in watermover_names:
+				ins = list(watermovers[watermover_name]['in'])
+				outs = list(watermovers[watermover_name]['out'])
+				segments = list(TransectFlux.get_segment_movers(watermover_name, segment_watermovers))
+				row_watermovers += [ins, outs, ins + outs + segments]
+				row_signs += [[1.0] * len(ins), [1.0] * len(outs), [1.0] * len(ins) + [-1.0] * len(outs) + [1.0] * len(segments)]
+		lengths = np.array([len(row) for row in row_watermovers], dtype=np.int64)
+		self.indptr = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+		entries = np.array([k for row in row_watermovers for k in row], dtype=np.int64)
+		(self.watermovers, self.indices) = np.unique(entries, return_inverse=True)
+		self.indices = self.indices.reshape(-1)
+		self.signs = np.array([sign for row in row_signs for sign in row], dtype=np.float64)
+		self.rows = len(lengths)
+		self.positions = list()
+		for k in range(int(lengths.max()) if self.rows else 0):
+			rows = np.nonzero(lengths > k)[0]
+			self.positions.append((rows, self.indptr[rows] + k))
+
+	def multiply(self, volume_block):
+		'''
+		The rows x timesteps product of the matrix with volume_block. The
+		watermover columns are gathered once, as rows, then the k-th entry of
+		every row long enough is added with its sign for k = 0, 1, ..., so each
+		row is summed from +0.0 in CSR order, as the per-transect kernels add
+		its watermovers. (np.add.reduceat does not keep that order.)
+		'''
+		columns = volume_block.get_columns(self.watermovers)
+		volumes = np.ascontiguousarray(volume_block.values[:, columns].T, dtype=np.float64)
+		product = np.zeros((self.rows, volume_block.stop - volume_block.start), dtype=np.float64)
+		for rows, entries in self.positions:
+			product[rows] += self.signs[entries, np.newaxis] * volumes[self.indices[entries]]
+		return product
+
+	def get_fluxes(self, volume_block):
+		'''
+		One TransectFlux per transect over the timesteps of volume_block (the
+		whole run or one window of it), as views of its product.
+		'''
+		product = self.multiply(volume_block)
+		fluxes = list()
+		for watermover_names, first_row in zip(self.watermover_names, self.first_rows):
+			last_row = first_row + 3 * len(watermover_names)
+			fluxes.append(TransectFlux(volume_block.start, watermover_names, product[first_row:last_row:3].T, \
+				product[first_row + 1:last_row:3].T, product[first_row + 2:last_row:3].T))
+		return fluxes
+
+def get_kernel_fluxes(volume_block, transects, kernel):
+	if kernel == 'sparse':
+		return TransectIncidence(transects).get_fluxes(volume_block)
+	return [TransectFlux.compute(volume_block, watermovers, segment_watermovers, kernel) for watermovers, segment_watermovers in transects]
+
+def same_volumes(volumes, expected):
+	'''
+	True when two volume arrays are the same bit for bit, so that -0.0, which
+	the reports print as -0.00000, does not pass for 0.0.
+	'''
+	return volumes.shape == expected.shape and np.ascontiguousarray(volumes).tobytes() == np.ascontiguousarray(expected).tobytes()
+
+def get_random_volumes(shape, seed):
+	'''
+	Random float32 volumes over twelve orders of magnitude, whose float64
+	sums depend on the order they are added in.
+	'''
+	random = np.random.default_rng(seed)
+	return (random.normal(0.0, 1.0, shape) * 10.0 ** random.uniform(-6.0, 6.0, shape)).astype(np.float32)
+
+def get_random_transects(watermovers, transects, seed):
+	'''
+	Transects of random in and out watermovers of the types of a seepage
+	report, with segment watermovers added to the ManningCircle.
+	'''
+	report_type = ReportType()
+	watermover_names = [report_type.darcy_circle, report_type.manning_circle, report_type.marsh_to_dry, report_type.marsh_to_seg]
+	random = np.random.default_rng(seed)
+	random_transects = list()
+	for i in range(transects):
+		transect_watermovers = dict()
+		for watermover_name in watermover_names:
+			transect_watermovers[watermover_name] = {'in': random.choice(watermovers, random.integers(0, 12)).tolist(), \
+				'out': random.choice(watermovers, random.integers(0, 12)).tolist()}
+		random_transects.append((transect_watermovers, random.choice(watermovers, 3).tolist()))
+	return random_transects
+
+if __name__ == "__main__":
+	import argparse
+	from PMGTransect_NETCDF import WaterMoverVolumeBlock
+	program_name = os.path.splitext(os.path.basename(sys.argv[0]))[0]
+	parser = argparse.ArgumentParser(prog=program_name, description='''Checks that every kernel gives
+		the volumes of the python kernel on random transects of a random volume block, and times each.''')
+	parser.add_argument('-t', '--timesteps', action='store', type=int, default=20000, help='Timesteps of the volume block.')
+	parser.add_argument('-w', '--watermovers', action='store', type=int, default=5000, help='Watermovers of the volume block.')
+	parser.add_argument('-n', '--transects', action='store', type=int, default=20, help='Number of random transects.')
+	parser.add_argument('-r', '--repeat', action='store', type=int, default=3, help='Timed runs of each kernel; the best is reported.')
+	parser.add_argument('-s', '--seed', action='store', type=int, default=0, help='Seed of the random volumes and transects.')
+	args = parser.parse_args()
+	watermovers = np.arange(args.watermovers, dtype=np.int64)
+	volume_block = WaterMoverVolumeBlock(watermovers, get_random_volumes((args.timesteps, args.watermovers), args.seed))
+	transects = get_random_transects(watermovers, args.transects, args.seed)
+	expected = get_kernel_fluxes(volume_block, transects, 'python')
+	failed = False
+	for kernel in KERNELS:
+		if kernel == 'numba' and not NUMBA_AVAILABLE:
+			print('%-8s skipped, numba is not installed' % kernel)
+			continue
+		if kernel == 'numba':
+			start_time = time.time()
+			get_kernel_fluxes(WaterMoverVolumeBlock(watermovers, volume_block.values[:1]), transects, kernel)
+			print('%-8s compiled in %.3f s' % (kernel, time.time() - start_time))
+		timings = list()
+		for i in range(args.repeat):
+			start_time = time.time()
+			fluxes = get_kernel_fluxes(volume_block, transects, kernel)
+			timings.append(time.time() - start_time)
+		same = all([same_volumes(flux.in_volumes, expected_flux.in_volumes) and same_volumes(flux.out_volumes, expected_flux.out_volumes) \
+			and same_volumes(flux.volumes, expected_flux.volumes) for flux, expected_flux in zip(fluxes, expected)])
+		failed = failed or not same
+		print('%-8s %10.4f s  %8.2f Mtimestep-transects/s  %s' % (kernel, min(timings), \
+			args.timesteps * args.transects / min(timings) / 1e6, 'same volumes' if same else 'DIFFERENT VOLUMES'))
+	sys.exit(1 if failed else 0)
@@ -1,78 +1,272 @@
+import os
+import struct
 import statistics
 import numpy as np
 import netCDF4 
 import PMG_Utilities as util
 import datetime
+from PMGTransect_Topology import MeshTopology, WaterMoverIndex
+from PMGTransect_Calendar import CalendarIndex
+from PMGTransect_Cache import TopologyCache
 EXTERNAL_CELL_ID_MINIMUM = 500000000
 CANAL_MINIMUM = 300000
 CANAL_MAXIMUM = 399999
+WATERMOVER_VARIABLES = ["waterMoverMap", "waterMoverType", "waterMoverName"]
+HYPERSLAB_GAP = 16
+CHUNK_CACHE_LIMIT = 256 * 1024 * 1024
+MEGABYTE = 1024.0 * 1024.0
+STORE_SUFFIX = ".wmv"
+STORE_MAGIC = b"PMGWMV"
+STORE_VERSION = 1
+STORE_ALIGNMENT = 4096
+# magic, version, dtype, watermovers, timesteps, source size, source mtime (ns), data offset
+STORE_HEADER = struct.Struct("<8sI8sqqqqq")
+
+class WaterMoverVolumeBlock:
+	def __init__(self, watermovers, values, start=0):
+		self.watermovers = watermovers
+		self.values = values
+		self.start = start
+		self.stop = start + len(values)
+		self._columns = dict((int(k), i) for i, k in enumerate(watermovers))
+
+	def get_column(self, watermover):
+		return self._columns[watermover]
+
+	def get_columns(self, watermovers):
+		'''
+		Columns of watermovers in values, by binary search in the sorted
+		watermovers of the block. Like get_column, raises KeyError for
+		watermovers the block does not hold.
+		'''
+		watermovers = np.asarray(watermovers, dtype=np.int64)
+		columns = np.searchsorted(self.watermovers, watermovers)
+		found = columns < len(self.watermovers)
+		found[found] = self.watermovers[columns[found]] == watermovers[found]
+		if not found.all():
+			raise KeyError("watermovers %s are not in the volume block" % watermovers[~found].tolist())
+		return columns
+
+	def get_volume(self, t, watermover):
+		return float(self.values[t - self.start, self._columns[watermover]])
+
+class ReadPlan:
+	'''
+	Read order for a set of column hyperslabs of a chunked (netCDF4/HDF5)
+	variable. The time axis is cut into bands aligned to the time chunking and
+	every hyperslab is read band by band, with the variable's chunk cache
+	sized to hold all chunks one band touches; each chunk is then
+	decompressed once however many hyperslabs share it. Bands span as many
+	time chunks as fit in CHUNK_CACHE_LIMIT. Contiguous variables are read in
+	one band without touching the cache.
+	'''
+	def __init__(self, variable, hyperslabs, start, stop, columns_used):
+		itemsize = np.dtype(variable.dtype).itemsize
+		chunking = variable.chunking()
+		self.cache_size = None
+		self.cache_nelems = None
+		self.bytes_used = columns_used * (stop - start) * itemsize
+		if chunking in (None, 'contiguous') or len(hyperslabs) == 0:
+			self.bands = [(start, stop)]
+			self.bytes_read = sum([last - first for first, last in hyperslabs]) * (stop - start) * itemsize
+			return
+		(time_chunk, column_chunk) = chunking
+		column_chunks = set()
+		for first, last in hyperslabs:
+			column_chunks.update(range(first // column_chunk, (last - 1) // column_chunk + 1))
+		chunk_bytes = time_chunk * column_chunk * itemsize
+		band_chunks = max(1, CHUNK_CACHE_LIMIT // (len(column_chunks) * chunk_bytes))
+		band_length = band_chunks * time_chunk
+		first_band = start - start % time_chunk
+		self.bands = [(max(band, start), min(band + band_length, stop)) for band in range(first_band, stop, band_length)]
+		time_chunks = (stop - 1) // time_chunk - start // time_chunk + 1
+		self.cache_nelems = len(column_chunks) * min(band_chunks, time_chunks)
+		self.cache_size = self.cache_nelems * chunk_bytes
+		self.bytes_read = len(column_chunks) * time_chunks * chunk_bytes
+
+	def apply(self, variable):
+		if self.cache_size == None:
+			return
+		(size, nelems, preemption) = variable.get_var_chunk_cache()
+		variable.set_var_chunk_cache(size=max(size, self.cache_size), nelems=max(nelems, 10 * self.cache_nelems), \
+			preemption=preemption)
+
+class WaterMoverVolume:
+	'''
+	Lazy accessor for the WaterMoverVolume (or FMWatermovers) variable. Nothing
+	is read until the watermover indices a transect needs are known, then only
+	those columns are pulled from the file.
+	'''
+	def __init__(self, filename, variable):
+		self.filename = filename
+		self.variable_name = variable.name
+		self.shape = variable.shape
+		self.dtype = variable.dtype
+		self.bytes_read = 0
+		self.bytes_used = 0
+
+	def get_hyperslabs(self, watermovers):
+		'''
+		Splits sorted watermover indices into [first, last) column ranges. Indices
+		closer than HYPERSLAB_GAP share one range, the few unused columns are
+		cheaper to read than another pass over the time axis.
+		'''
+		if len(watermovers) == 0:
+			return []
+		breaks = np.nonzero(np.diff(watermovers) > HYPERSLAB_GAP)[0] + 1
+		return [(int(run[0]), int(run[-1]) + 1) for run in np.split(watermovers, breaks)]
+
+	def __read_block(self, variable, watermovers, start, stop):
+		values = np.zeros((stop - start, len(watermovers)), dtype=self.dtype)
+		hyperslabs = list()
+		column = 0
+		for first, last in self.get_hyperslabs(watermovers):
+			selected = watermovers[(watermovers >= first) & (watermovers < last)] - first
+			hyperslabs.append((first, last, selected, column))
+			column += len(selected)
+		read_plan = ReadPlan(variable, [(first, last) for first, last, _, _ in hyperslabs], start, stop, len(watermovers))
+		read_plan.apply(variable)
+		for band_start, band_stop in read_plan.bands:
+			for first, last, selected, column in hyperslabs:
+				hyperslab = np.ma.filled(variable[band_start:band_stop, first:last], 0)
+				values[band_start - start:band_stop - start, column:column + len(selected)] = hyperslab[:, selected]
+		self.bytes_read += read_plan.bytes_read
+		self.bytes_used += read_plan.bytes_used
+		return WaterMoverVolumeBlock(watermovers, values, start)
+
+	def report(self):
+		print('%s: %s read %.1f MB for %.1f MB of watermover volumes used' % (util.get_current_time(), \
+			self.variable_name, self.bytes_read / MEGABYTE, self.bytes_used / MEGABYTE))
+
+	def read_columns(self, watermovers, start=0, stop=None):
+		watermovers = np.unique(np.asarray(watermovers, dtype=np.int64))
+		if stop == None:
+			stop = self.shape[0]
+		self.bytes_read = 0
+		self.bytes_used = 0
+		water_budget_nc = netCDF4.Dataset(self.filename, 'r')
+		try:
+			return self.__read_block(water_budget_nc.variables[self.variable_name], watermovers, start, stop)
+		finally:
+			water_budget_nc.close()
+			self.report()
+
+	def iter_chunks(self, watermovers, chunk_length):
+		'''
+		Yields the watermover columns in windows of chunk_length timesteps so the
+		memory held at any time is bounded by the window, not the run length.
+		'''
+		watermovers = np.unique(np.asarray(watermovers, dtype=np.int64))
+		self.bytes_read = 0
+		self.bytes_used = 0
+		water_budget_nc = netCDF4.Dataset(self.filename, 'r')
+		try:
+			variable = water_budget_nc.variables[self.variable_name]
+			for start in range(0, self.shape[0], chunk_length):
+				yield self.__read_block(variable, watermovers, start, min(start + chunk_length, self.shape[0]))
+		finally:
+			water_budget_nc.close()
+			self.report()
+
+class WaterMoverStore:
+	'''
+	Reader for the watermover-major copy of the volume variable written by
+	PMGTransect_Store.py. After the header comes an int64 index of the byte
+	offset of every watermover's time series, then the series themselves, so
+	any watermover is one contiguous run of the file, read through np.memmap.
+	'''
+	def __init__(self, store_filename):
+		self.filename = store_filename
+		with open(store_filename, 'rb') as store_file:
+			header = STORE_HEADER.unpack(store_file.read(STORE_HEADER.size))
+		(magic, version, dtype, watermovers, timesteps, self.source_size, self.source_mtime, data_offset) = header
+		if magic.rstrip(b"\0") != STORE_MAGIC or version != STORE_VERSION:
+			raise ValueError("%s is not a watermover store" % store_filename)
+		self.dtype = np.dtype(dtype.rstrip(b"\0").decode("ascii"))
+		self.shape = (timesteps, watermovers)
+		self.offsets = np.fromfile(store_filename, dtype='<i8', count=watermovers, offset=STORE_HEADER.size)
+		if watermovers and self.offsets[0] != data_offset:
+			raise ValueError("%s has an inconsistent offset index" % store_filename)
+		self.__map = np.memmap(store_filename, dtype=np.uint8, mode='r')
+		self.__column_bytes = timesteps * self.dtype.itemsize
+		self.data = self.__map[data_offset:data_offset + watermovers * self.__column_bytes].view(self.dtype).reshape(watermovers, timesteps)
+
+	@staticmethod
+	def get_store_filename(filename):
+		return filename + STORE_SUFFIX
+
+	@staticmethod
+	def find(filename):
+		'''
+		Returns the store next to a netCDF file, or None when there is none or
+		it was written from a different version of the file.
+		'''
+		store_filename = WaterMoverStore.get_store_filename(filename)
+		if not os.path.isfile(store_filename):
+			return None
+		try:
+			store = WaterMoverStore(store_filename)
+		except (ValueError, OSError, struct.error) as e:
+			print("ignoring watermover store %s: %s" % (store_filename, e))
+			return None
+		stat = os.stat(filename)
+		if store.source_size != stat.st_size or store.source_mtime != stat.st_mtime_ns:
+			print("ignoring stale watermover store %s" % store_filename)
+			return None
+		return store
+
+	def get_column(self, watermover):
+		offset = int(self.offsets[watermover])
+		return self.__map[offset:offset + self.__column_bytes].view(self.dtype)
+
+	def read_columns(self, watermovers, start=0, stop=None):
+		'''
+		The volumes of watermovers over timesteps start to stop - 1. Only a
+		consecutive range of watermovers comes back without copying, as a view
+		of the map. Any other selection (as for most transects) is gathered
+		into a new watermovers x timesteps array, copying len(watermovers) x
+		(stop - start) values, each watermover one contiguous read of the file.
+		'''
+		watermovers = np.unique(np.asarray(watermovers, dtype=np.int64))
+		if stop == None:
+			stop = self.shape[0]
+		if len(watermovers) and watermovers[-1] - watermovers[0] + 1 == len(watermovers):
+			values = self.data[watermovers[0]:watermovers[-1] + 1, start:stop].T
+		else:
+			values = self.data[watermovers, start:stop].T
+		return WaterMoverVolumeBlock(watermovers, values, start)
+
+	def iter_chunks(self, watermovers, chunk_length):
+		for start in range(0, self.shape[0], chunk_length):
+			yield self.read_columns(watermovers, start, min(start + chunk_length, self.shape[0]))
+
 class Transect_NetCDF:
+	__coordinates = dict()
 
-	def __init__(self, filename):
+	def __init__(self, filename, topology_cache=None, coordinates_file=None):
 		water_budget_nc = None
 		water_budget_nc = netCDF4.Dataset(filename, 'r',format="NETCDF4_CLASSIC")
-		locations = list(water_budget_nc.variables['locations'])
-		self.coordinates = dict((int(i)-1, self.get_state_plane_coordinates(locations[int(j)])) \
-			for i,j in water_budget_nc.variables['meshNodeMap'][:])
-		tricons = list(water_budget_nc.variables['tricons'])
-		self._tricons_concat = list()
-		for i in range(len(tricons)):
-				self._tricons_concat.append([tricons[i][0], tricons[i][1], tricons[i][2], tricons[i][0], tricons[i][1], tricons[i][2]])
-		try:
-			self._waterbodymap = list(water_budget_nc.variables['waterBodyMap'])
-			waterMoverMap_Main = list()
-			waterMoverMap_Main = list(water_budget_nc.variables['waterMoverMap'])
-			self._watermovermap = {}
-			self._external_cell_id_left = {}
-			self._external_cell_id_right = {}
-			for i in range(len( waterMoverMap_Main)):
-						if int( waterMoverMap_Main[i][0]) >= EXTERNAL_CELL_ID_MINIMUM:
-							key = int(waterMoverMap_Main[i][1])
-							if key < EXTERNAL_CELL_ID_MINIMUM:
-								if key not in self._external_cell_id_right:
-									self._external_cell_id_right[key] = []
-								self._external_cell_id_right[key].append(i)
-						elif int( waterMoverMap_Main[i][1]) >= EXTERNAL_CELL_ID_MINIMUM:
-							key = int(waterMoverMap_Main[i][0])
-							if key < EXTERNAL_CELL_ID_MINIMUM:
-								if key not in self._external_cell_id_left:
-									self._external_cell_id_left[key] = []
-								self._external_cell_id_left[key].append(i)
-						else:
-							key = (int( waterMoverMap_Main[i][0]), int(waterMoverMap_Main[i][1]))
-							if key not in self._watermovermap:
-								self._watermovermap[key] = []
-							self._watermovermap[key].append(i)
-			watermovertype = list(water_budget_nc.variables['waterMoverType'])
-			self._watermovertype = []
-			for i in range(len(watermovertype)):
-				temp = []
-				test = [w.decode("utf-8") for w in watermovertype[i]]
-				for j in range(len(test)):
-					temp.append(str(test[j][0]))
-				self._watermovertype.append(''.join(temp).strip())
-			watermovername = list(water_budget_nc.variables['waterMoverName'])
-			self._watermovername = []
-			for i in range(len(watermovername)):
-				temp = []
-				test_name = [w.decode("utf-8") for w in watermovername[i]]
-				try:
-					for j in range(len(test_name)):
-						temp.append(test_name[j][0])
-					self._watermovername.append(''.join(temp).strip())
-				except Exception as e:
-					print(e)
-		except:
-			pass
+		topology = None
+		if topology_cache != None:
+			topology = topology_cache.load(filename)
+		if topology != None and not self.has_current_coordinates(topology, coordinates_file):
+			topology = None
+		if topology == None:
+			topology = self.read_topology(water_budget_nc, coordinates_file)
+			if topology_cache != None:
+				topology_cache.save(filename, topology)
+		self.set_topology(topology)
 		try:
-			self._watermovervolume = list()
-			self._watermovervolume = list(water_budget_nc.variables['WaterMoverVolume'])
+			self._watermovervolume = WaterMoverVolume(filename, water_budget_nc.variables['WaterMoverVolume'])
 			self._watermovervolume_units = water_budget_nc.variables['WaterMoverVolume'].getncattr("units")
 		except:
-			self._watermovervolume = list()
 			self._watermovervolume_units = water_budget_nc.variables['FMWatermovers'].getncattr("units")
-			self._watermovervolume = list(water_budget_nc.variables['FMWatermovers'])
-		self._timestamps = list(water_budget_nc.variables['timestamps'])
+			self._watermovervolume = WaterMoverVolume(filename, water_budget_nc.variables['FMWatermovers'])
+		store = WaterMoverStore.find(filename)
+		if store != None:
+			print("using watermover store %s" % store.filename)
+			self._watermovervolume = store
+		self._timestamps = np.ma.filled(water_budget_nc.variables['timestamps'][:], 0)
 		timestamps = water_budget_nc.variables['timestamps']
 		#date2 = nc.num2date(timestamps[:],units=timestamps.units.replace('24','00'))
 		date, time = timestamps.units.split()[2:4]
@@ -80,25 +274,106 @@ class Transect_NetCDF:
 		self._base_time_in_secs = util.time_to_seconds(date, time)
 		self._time_fmt = '%m/%d/%Y %H:%M:%S'
 		self._date_fmt = '%m/%d/%Y'
-		print("inside Netcdf waterMoverMap_Main %d " % len(waterMoverMap_Main))
-		print("inside Netcdf water_budget_nc.variables['waterMoverMap'] %d " % len(water_budget_nc.variables['waterMoverMap']))
+		self.calendar = CalendarIndex(self._base_time, self._timestamps)
 		water_budget_nc.close()
 		
-		del waterMoverMap_Main
 		del water_budget_nc
 
-	def get_state_plane_coordinates(self, state_plane_coordinates):
-		easting_x = float(state_plane_coordinates[0])
-		northing_y = float(state_plane_coordinates[1])
-		return easting_x, northing_y
+	@staticmethod
+	def read_coordinates(water_budget_nc):
+		meshnodemap = np.asarray(water_budget_nc.variables['meshNodeMap'][:], dtype=np.int64)
+		locations = np.asarray(water_budget_nc.variables['locations'][:], dtype=np.float64)
+		return meshnodemap[:, 0] - 1, locations[meshnodemap[:, 1], :2]
+
+	@staticmethod
+	def read_secondary_coordinates(coordinates_file):
+		'''
+		Reads only meshNodeMap and locations from the secondary (--netcdf2) file.
+		The result is kept for the life of the process, so every run that
+		names the same unchanged file shares one read.
+		'''
+		stat = os.stat(coordinates_file)
+		key = (os.path.abspath(coordinates_file), stat.st_size, stat.st_mtime_ns)
+		if key not in Transect_NetCDF.__coordinates:
+			coordinates_nc = netCDF4.Dataset(coordinates_file, 'r')
+			try:
+				Transect_NetCDF.__coordinates[key] = Transect_NetCDF.read_coordinates(coordinates_nc)
+			finally:
+				coordinates_nc.close()
+		return Transect_NetCDF.__coordinates[key]
+
+	def has_current_coordinates(self, topology, coordinates_file):
+		if 'coordinates_fingerprint' in topology:
+			return bool(coordinates_file) and \
+				str(topology['coordinates_fingerprint']) == TopologyCache.get_fingerprint(coordinates_file)
+		return len(topology['node_ids']) != 0 or not coordinates_file
+
+	def read_topology(self, water_budget_nc, coordinates_file=None):
+		'''
+		Parses the mesh variables into the flat arrays the transect lookups are
+		built from. These arrays are what the topology cache stores. A file
+		without waterBodyMap or the WATERMOVER_VARIABLES gives a topology
+		without them; any other error is raised, so nothing half parsed is
+		cached.
+		'''
+		topology = dict()
+		if 'meshNodeMap' in water_budget_nc.variables and 'locations' in water_budget_nc.variables:
+			topology['node_ids'], topology['node_locations'] = self.read_coordinates(water_budget_nc)
+		elif coordinates_file:
+			topology['node_ids'], topology['node_locations'] = self.read_secondary_coordinates(coordinates_file)
+			topology['coordinates_fingerprint'] = np.array(TopologyCache.get_fingerprint(coordinates_file))
+		else:
+			topology['node_ids'] = np.zeros(0, dtype=np.int64)
+			topology['node_locations'] = np.zeros((0, 2), dtype=np.float64)
+		topology['tricons'] = np.asarray(water_budget_nc.variables['tricons'][:], dtype=np.int64)
+		variables = water_budget_nc.variables
+		if 'waterBodyMap' not in variables:
+			return topology
+		topology['waterbodymap'] = np.asarray(variables['waterBodyMap'][:], dtype=np.int64)
+		if not all([name in variables for name in WATERMOVER_VARIABLES]):
+			return topology
+		waterMoverMap_Main = np.asarray(variables['waterMoverMap'][:], dtype=np.int64)
+		print("inside Netcdf waterMoverMap_Main %d " % len(waterMoverMap_Main))
+		watermovermap, external_cell_id_left, external_cell_id_right = WaterMoverIndex.classify(waterMoverMap_Main)
+		topology.update(watermovermap.to_arrays('watermovermap'))
+		topology.update(external_cell_id_left.to_arrays('external_cell_id_left'))
+		topology.update(external_cell_id_right.to_arrays('external_cell_id_right'))
+		watermovertype = self.decode_char_array(variables['waterMoverType'])
+		watermovertype_table, topology['watermovertype_codes'] = np.unique(watermovertype, return_inverse=True)
+		topology['watermovertype_table'] = watermovertype_table
+		topology['watermovername'] = self.decode_char_array(variables['waterMoverName'])
+		return topology
+
+	def set_topology(self, topology):
+		self.topology = MeshTopology.get_shared(topology)
+		self.coordinates = self.topology.coordinates
+		self._waterbodymap = self.topology._waterbodymap
+		self._watermovermap = self.topology._watermovermap
+		self._external_cell_id_left = self.topology._external_cell_id_left
+		self._external_cell_id_right = self.topology._external_cell_id_right
+		self._watermovername = self.topology._watermovername
+
+	def decode_char_array(self, variable):
+		variable.set_auto_chartostring(False)
+		return np.char.strip(netCDF4.chartostring(np.ma.filled(variable[:], b'')))
+
+	def get_watermovertype(self, watermover):
+		return self.topology.get_watermovertype(watermover)
+
+	def get_watermovertype_code(self, watermovertype):
+		return self.topology.get_watermovertype_code(watermovertype)
 	def getStartDate(self):
-		return (self._base_time + datetime.timedelta(days=int(self._timestamps[0]))).strftime(self._date_fmt)
+		return self.calendar.format(0, self._date_fmt)
 	def getEndDate(self):
-		return (self._base_time + datetime.timedelta(days=int(self._timestamps[-1]))).strftime(self._date_fmt)
+		return self.calendar.format(-1, self._date_fmt)
 	def getTimestamp(self, i):
-		return (self._base_time + datetime.timedelta(days=int(self._timestamps[i]))).strftime(self._time_fmt)
+		return self.calendar.format(i, self._time_fmt)
 	def getTimestampLen(self):
 		return len(self._timestamps)
+	def read_watermover_volume(self, watermovers):
+		return self._watermovervolume.read_columns(watermovers)
+	def iter_watermover_volume(self, watermovers, chunk_length):
+		return self._watermovervolume.iter_chunks(watermovers, chunk_length)
 
 if __name__ == "__main__":
 	transect_netcdf = Transect_NetCDF("wbbudget.nc")
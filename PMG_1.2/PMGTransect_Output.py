@@ -1,6 +1,5 @@
 import time
 import numpy as np
-import math
 from dataclasses import dataclass
 from datetime import datetime
 
@@ -51,13 +50,6 @@ class ReportType:
 		return report_types
 
 class ProcessData:
-	@staticmethod
-	def node_match(node, tricon):
-		for i in range(len(tricon)-1):
-			if node[0] == int(tricon[i]) and node[1] == int(tricon[i+1]):
-				return 1
-		return 0
-
 	@staticmethod
 	def intSort(a, b):
 		if int(a) > int(b):
@@ -67,13 +59,6 @@ class ProcessData:
 		else:
 			return 0
 
-	@staticmethod
-	def find_node_pair(node, tricons, waterbodymap):
-		for i in range(len(tricons)):
-			if ProcessData.node_match(node, tricons[i]):
-				return int(waterbodymap[i])
-		return None
-
 	@staticmethod
 	def get_range_years(year, date_range):
 		(month1, day1, month2, day2) = date_range
@@ -83,17 +68,19 @@ class ProcessData:
 			return('%4d/%02d/%02d-%4d/%02d/%02d' % (year, month1, day1, year, month2, day2))
 
 	@staticmethod
-	def get_distance( nc, node_pair):
-		n1, n2 = node_pair
-		if ProcessData.find_node_pair(node_pair, nc._tricons_concat, nc._waterbodymap) \
-			and ProcessData.find_node_pair([node_pair[1], node_pair[0]], nc._tricons_concat, nc._waterbodymap)\
-			and ( n1 in nc.coordinates and n2 in nc.coordinates):
-			x1, y1 = nc.coordinates[n1]
-			x2, y2 = nc.coordinates[n2]
-			distance = math.sqrt((x2-x1)*(x2-x1)+(y2-y1)*(y2-y1))
-			return distance
-		else:
-			return 0
+	def get_range(date_range):
+		(month1, day1, month2, day2) = date_range
+		return('%02d/%02d-%02d/%02d' % (month1, day1, month2, day2))
+
+	@staticmethod
+	def get_wall_distances(nc, nodelist):
+		'''
+		Returns the wall lengths and transect length of a nodelist entry,
+		computed once by MeshTopology.get_wall_distances and kept on the entry.
+		'''
+		if 'wall_distances' not in nodelist:
+			nodelist.update(nc.topology.get_wall_distances(nodelist['node_pair']))
+		return nodelist['wall_distances'], nodelist['transect_distance']
 
 	@staticmethod
 	def cmp_to_key(mycmp):
@@ -222,27 +209,25 @@ class CSVOutput:
 		for i in range(len(data)):
 			outputfile.write('                               \n') 
 			outputfile.write('_________________________________________________________ \n')
-			outputfile.write('The list of nodes is = [%s]' % (' '.join(['%i'%node for node in data[i]['nodelist']['node']]))) 
-			if len(nc.coordinates.keys()) != 0:
-				total_distance = 0
+			outputfile.write('The list of nodes is = [%s]' % (' '.join(['%i'%node for node in data[i].nodelist['node']]))) 
+			if len(nc.coordinates) != 0:
+				(wall_distances, total_distance) = ProcessData.get_wall_distances(nc, data[i].nodelist)
 				line = ''
-				for nodepair in data[i]['nodelist']['node_pair']:
-					distance = ProcessData.get_distance(nc, nodepair)
-					total_distance = total_distance + distance
+				for nodepair, distance in zip(data[i].nodelist['node_pair'], wall_distances):
 					if line:
 						line = line + " "
 					line = line + "Distance(%s %s)=%.0f," % (nodepair[0]+1, nodepair[1]+1, distance)
 				outputfile.write('%s Transect=%.0f\n' % (line, total_distance)) 
-			line = ''.join(['(%s)' % (' '.join(['%d' % node for node in nodepair])) for nodepair in data[i]['nodelist']['node_pair']])
+			line = ''.join(['(%s)' % (' '.join(['%d' % node for node in nodepair])) for nodepair in data[i].nodelist['node_pair']])
 			outputfile.write('Wall  [%s]' % line) 
-			line = ' '.join([watermover_name for watermover_name in sorted(data[i]['nodelist']['watermover_names'].keys())])
+			line = ' '.join([watermover_name for watermover_name in sorted(data[i].nodelist['watermover_names'].keys())])
 			outputfile.write('Watermovers  [%s]\n' % line.strip()) 
 			outputfile.write('Timeperiod: %s - %s,' %  (nc. getStartDate(), nc.getEndDate())) 
 			outputfile.write('DATE, ') 
 			if report_type.seepage_report in seepage_report_button:
 				watermovers = report_type.get_seepage_report_fields()
 			else:
-				watermovers = sorted(data[i]['nodelist']['watermovers'].keys())
+				watermovers = sorted(data[i].nodelist['watermovers'].keys())
 			local_seepage_report_table = dict([(watermover, current_seepage_report_table[watermover]+' (%s)' % nc._watermovervolume_units) for watermover in current_seepage_report_table.keys()])
 			for watermover in watermovers:
 				outputfile.write('%-*s, ' % (max(COLUMN_WIDTH,len(local_seepage_report_table[watermover])), local_seepage_report_table[watermover]))
@@ -251,14 +236,17 @@ class CSVOutput:
 			for watermover in watermovers:
 				outputfile.write(('-'*max(COLUMN_WIDTH,len(local_seepage_report_table[watermover])))+', ')
 			outputfile.write('--------------------\n')
-			for year in sorted(data[i]['years'].keys(), key=ProcessData.cmp_to_key(ProcessData.intSort)):
-				outputfile.write('%d, '%(year)) 
+			result = data[i]
+			yearly = result.yearly
+			for p in range(len(yearly)):
+				outputfile.write('%d, '%(yearly.periods.years[p])) 
 				for watermover in watermovers:
-					if watermover in data[i]['years'][year]['values']:
-						outputfile.write('%*.*f, ' % (max(COLUMN_WIDTH, len(local_seepage_report_table[watermover])), DECIMAL_PLACES,  np.mean(data[i]['years'][year]['values'][watermover])))
+					j = result.get_column(watermover)
+					if j >= 0:
+						outputfile.write('%*.*f, ' % (max(COLUMN_WIDTH, len(local_seepage_report_table[watermover])), DECIMAL_PLACES,  yearly.means[p, j]))
 					else:
 						outputfile.write('%s, ' % (' '*max(COLUMN_WIDTH, len(local_seepage_report_table[watermover]))))
-				outputfile.write('%*.*f' % (COLUMN_WIDTH, DECIMAL_PLACES, np.mean(data[i]['years'][year]['all']))) 
+				outputfile.write('%*.*f' % (COLUMN_WIDTH, DECIMAL_PLACES, yearly.all_means[p])) 
 		outputfile.close()
 
 	@staticmethod
@@ -272,27 +260,25 @@ class CSVOutput:
 		for i in range(len(data)):
 			outputfile.write('                               \n') 
 			outputfile.write('_________________________________________________________ \n')
-			outputfile.write('The list of nodes is = [%s]' % (' '.join(['%i'%node for node in data[i]['nodelist']['node']]))) 
-			if len(nc.coordinates.keys()) != 0:
-				total_distance = 0
+			outputfile.write('The list of nodes is = [%s]' % (' '.join(['%i'%node for node in data[i].nodelist['node']]))) 
+			if len(nc.coordinates) != 0:
+				(wall_distances, total_distance) = ProcessData.get_wall_distances(nc, data[i].nodelist)
 				line = ''
-				for nodepair in data[i]['nodelist']['node_pair']:
-					distance = ProcessData.get_distance(nc, nodepair)
-					total_distance = total_distance + distance
+				for nodepair, distance in zip(data[i].nodelist['node_pair'], wall_distances):
 					if line:
 						line = line + " "
 					line = line + "Distance(%s %s)=%.0f," % (nodepair[0]+1, nodepair[1]+1, distance)
 				outputfile.write('%s Transect=%.0f\n' % (line, total_distance)) 
-			line = ''.join(['(%s)' % (' '.join(['%d' % node for node in nodepair])) for nodepair in data[i]['nodelist']['node_pair']])
+			line = ''.join(['(%s)' % (' '.join(['%d' % node for node in nodepair])) for nodepair in data[i].nodelist['node_pair']])
 			outputfile.write('Wall  [%s]' % line) 
-			line = ' '.join([watermover_name for watermover_name in sorted(data[i]['nodelist']['watermover_names'].keys())])
+			line = ' '.join([watermover_name for watermover_name in sorted(data[i].nodelist['watermover_names'].keys())])
 			outputfile.write('Watermovers  [%s]\n' % line.strip()) 
 			outputfile.write('Timeperiod: %s - %s,' %  (nc. getStartDate(), nc.getEndDate())) 
 			outputfile.write('SEASON DATES         , ') 
 			if report_type.seepage_report in seepage_report_button:
 				watermovers = report_type.get_seepage_report_fields()
 			else:
-				watermovers = sorted(data[i]['nodelist']['watermovers'].keys())
+				watermovers = sorted(data[i].nodelist['watermovers'].keys())
 			local_seepage_report_table = dict([(watermover, current_seepage_report_table[watermover]+' (%s)' % nc._watermovervolume_units) for watermover in current_seepage_report_table.keys()])
 			for watermover in watermovers:
 				outputfile.write('%-*s, ' % (max(COLUMN_WIDTH,len(local_seepage_report_table[watermover])), local_seepage_report_table[watermover]))
@@ -301,15 +287,22 @@ class CSVOutput:
 			for watermover in watermovers:
 				outputfile.write(('-'*max(COLUMN_WIDTH,len(local_seepage_report_table[watermover])))+', ')
 			outputfile.write('--------------------\n')
-			for year in sorted(data[i]['seasonal']['values']['years'].keys(), key=ProcessData.cmp_to_key(ProcessData.intSort)):
-				for date_range in sorted(data[i]['seasonal']['values']['years'][year].keys(), ProcessData.rangeSort):
-					outputfile.write( '%s, ' % ProcessData.get_range_years(year, date_range))
-					for watermover in watermovers:
-						if watermover in data[i]['seasonal']['values']['years'][year][date_range]['values']:
-							outputfile.write('%*.*f, ' % (max(COLUMN_WIDTH, len(local_seepage_report_table[watermover])), DECIMAL_PLACES, np.sum(data[i]['seasonal']['values']['years'][year][date_range]['values'][watermover]))) 
-						else:
-							outputfile.write('%s, ' % (' '*max(COLUMN_WIDTH, len(local_seepage_report_table[watermover])))) 
-					outputfile.write('%*.*f' % (COLUMN_WIDTH, DECIMAL_PLACES, np.sum(data[i]['seasonal']['values']['years'][year][date_range]['all']))) 
+			result = data[i]
+			date_ranges = sorted(result.seasons, key=ProcessData.cmp_to_key(ProcessData.rangeSort))
+			season_years = list()
+			for r in range(len(date_ranges)):
+				yearly = result.get_season(date_ranges[r]).yearly
+				season_years += [(yearly.periods.keys[p], r, p) for p in range(len(yearly))]
+			for (year, r, p) in sorted(season_years):
+				yearly = result.get_season(date_ranges[r]).yearly
+				outputfile.write( '%s, ' % ProcessData.get_range_years(year, date_ranges[r]))
+				for watermover in watermovers:
+					j = result.get_column(watermover)
+					if j >= 0:
+						outputfile.write('%*.*f, ' % (max(COLUMN_WIDTH, len(local_seepage_report_table[watermover])), DECIMAL_PLACES, yearly.sums[p, j]))
+					else:
+						outputfile.write('%s, ' % (' '*max(COLUMN_WIDTH, len(local_seepage_report_table[watermover]))))
+				outputfile.write('%*.*f' % (COLUMN_WIDTH, DECIMAL_PLACES, yearly.all_totals[p]))
 		outputfile.close()
 
 	@staticmethod
@@ -324,28 +317,26 @@ class CSVOutput:
 			for i in range(len(data)):
 				outputfile.write('                               ')
 				outputfile.write('_________________________________________________________ \n')
-				outputfile.write('The list of nodes is = [%s]' % (' '.join(['%i'%node for node in data[i]['nodelist']['node']]))) 
-				if len(nc.coordinates.keys()) != 0:
-					total_distance = 0
+				outputfile.write('The list of nodes is = [%s]' % (' '.join(['%i'%node for node in data[i].nodelist['node']]))) 
+				if len(nc.coordinates) != 0:
+					(wall_distances, total_distance) = ProcessData.get_wall_distances(nc, data[i].nodelist)
 					line = ''
-					for nodepair in data[i]['nodelist']['node_pair']:
-						distance = ProcessData.get_distance(nc, nodepair)
-						total_distance = total_distance + distance
+					for nodepair, distance in zip(data[i].nodelist['node_pair'], wall_distances):
 						if line:
 							line = line + " "
 						line = line + "Distance(%s %s)=%.0f," % (nodepair[0]+1, nodepair[1]+1, distance)
 					outputfile.write('%s Transect=%.0f\n' % (line, total_distance)) 
-				line = ''.join(['(%s)' % (' '.join(['%d' % node for node in nodepair])) for nodepair in data[i]['nodelist']['node_pair']])
+				line = ''.join(['(%s)' % (' '.join(['%d' % node for node in nodepair])) for nodepair in data[i].nodelist['node_pair']])
 				outputfile.write('Wall  [%s]' % line)
 				print("working")
-				line = ' '.join([watermover_name for watermover_name in sorted(data[i]['nodelist']['watermover_names'].keys())])
+				line = ' '.join([watermover_name for watermover_name in sorted(data[i].nodelist['watermover_names'].keys())])
 				outputfile.write('Watermovers  [%s]\n' % line.strip())
 				outputfile.write('Timeperiod: %s - %s,' %  (nc. getStartDate(), nc.getEndDate())) 
 				outputfile.write('DATE   , ')
 				if report_type.seepage_report in seepage_report_button:
 					watermovers = report_type.get_seepage_report_fields()
 				else:
-					watermovers = sorted(data[i]['nodelist']['watermovers'].keys())
+					watermovers = sorted(data[i].nodelist['watermovers'].keys())
 				local_seepage_report_table = dict([(watermover, current_seepage_report_table[watermover]+' (%s)' % nc._watermovervolume_units) for watermover in current_seepage_report_table.keys()])
 				for watermover in watermovers:
 					outputfile.write('%-*s, ' % (max(COLUMN_WIDTH,len(local_seepage_report_table[watermover])), local_seepage_report_table[watermover]))
@@ -354,15 +345,17 @@ class CSVOutput:
 				for watermover in watermovers:
 					outputfile.write(('-'*max(COLUMN_WIDTH,len(local_seepage_report_table[watermover])))+', ')
 				outputfile.write('--------------------\n')
-				for year in sorted(data[i]['years'].keys(), key=ProcessData.cmp_to_key(ProcessData.intSort)):
-					for month in sorted(data[i]['years'][year]['months'].keys(), key=ProcessData.cmp_to_key(ProcessData.intSort)):
-						outputfile.write('%02d/%d, '%(month, year))
-						for watermover in watermovers:
-							if watermover in data[i]['years'][year]['months'][month]['values']:
-								outputfile.write('%*.*f, ' % (max(COLUMN_WIDTH, len(local_seepage_report_table[watermover])), DECIMAL_PLACES, np.mean(data[i]['years'][year]['months'][month]['values'][watermover])))
-							else:
-								outputfile.write('%s, ' % (' '*max(COLUMN_WIDTH, len(local_seepage_report_table[watermover]))))
-						outputfile.write('%*.*f' % (COLUMN_WIDTH, DECIMAL_PLACES, np.sum(data[i]['years'][year]['months'][month]['all']))) 
+				result = data[i]
+				monthly = result.monthly
+				for p in range(len(monthly)):
+					outputfile.write('%02d/%d, '%(monthly.periods.months[p], monthly.periods.years[p]))
+					for watermover in watermovers:
+						j = result.get_column(watermover)
+						if j >= 0:
+							outputfile.write('%*.*f, ' % (max(COLUMN_WIDTH, len(local_seepage_report_table[watermover])), DECIMAL_PLACES, monthly.means[p, j]))
+						else:
+							outputfile.write('%s, ' % (' '*max(COLUMN_WIDTH, len(local_seepage_report_table[watermover]))))
+					outputfile.write('%*.*f' % (COLUMN_WIDTH, DECIMAL_PLACES, monthly.all_totals[p])) 
 		outputfile.close()
 
 	@staticmethod
@@ -376,27 +369,25 @@ class CSVOutput:
 		for i in range(len(data)):
 			outputfile.write('                               \n') 
 			outputfile.write('_________________________________________________________ \n')
-			outputfile.write('The list of nodes is = [%s]' % (' '.join(['%i'%node for node in data[i]['nodelist']['node']]))) 
-			if len(nc.coordinates.keys()) != 0:
-				total_distance = 0
+			outputfile.write('The list of nodes is = [%s]' % (' '.join(['%i'%node for node in data[i].nodelist['node']]))) 
+			if len(nc.coordinates) != 0:
+				(wall_distances, total_distance) = ProcessData.get_wall_distances(nc, data[i].nodelist)
 				line = ''
-				for nodepair in data[i]['nodelist']['node_pair']:
-					distance = ProcessData.get_distance(nc, nodepair)
-					total_distance = total_distance + distance
+				for nodepair, distance in zip(data[i].nodelist['node_pair'], wall_distances):
 					if line:
 						line = line + " "
 					line = line + "Distance(%s %s)=%.0f," % (nodepair[0]+1, nodepair[1]+1, distance)
 				outputfile.write('%s Transect=%.0f\n' % (line, total_distance)) 
-			line = ''.join(['(%s)' % (' '.join(['%d' % node for node in nodepair])) for nodepair in data[i]['nodelist']['node_pair']])
+			line = ''.join(['(%s)' % (' '.join(['%d' % node for node in nodepair])) for nodepair in data[i].nodelist['node_pair']])
 			outputfile.write('Wall  [%s]' % line) 
-			line = ' '.join([watermover_name for watermover_name in sorted(data[i]['nodelist']['watermover_names'].keys())])
+			line = ' '.join([watermover_name for watermover_name in sorted(data[i].nodelist['watermover_names'].keys())])
 			outputfile.write('Watermovers  [%s]\n' % line.strip()) 
 			outputfile.write('Timeperiod: %s - %s,' %  (nc. getStartDate(), nc.getEndDate())) 
 			outputfile.write('SEASON DATES, ') 
 			if report_type.seepage_report in seepage_report_button:
 				watermovers = report_type.get_seepage_report_fields()
 			else:
-				watermovers = sorted(data[i]['nodelist']['watermovers'].keys())
+				watermovers = sorted(data[i].nodelist['watermovers'].keys())
 			local_seepage_report_table = dict([(watermover, current_seepage_report_table[watermover]+' (%s)' % nc._watermovervolume_units) for watermover in current_seepage_report_table.keys()])
 			for watermover in watermovers:
 				outputfile.write('%-*s, ' % (max(COLUMN_WIDTH,len(local_seepage_report_table[watermover])), local_seepage_report_table[watermover])) 
@@ -405,14 +396,19 @@ class CSVOutput:
 			for watermover in watermovers:
 				outputfile.write(('-'*max(COLUMN_WIDTH,len(local_seepage_report_table[watermover])))+', ') 
 			outputfile.write('--------------------\n')
-			for date_range in sorted(data[i]['seasonal']['values']['ranges'].keys(), ProcessData.rangeSort):
-				outputfile.write(' %s, ' % ProcessData.get_range(date_range)) 
+			result = data[i]
+			for date_range in sorted(result.seasons, key=ProcessData.cmp_to_key(ProcessData.rangeSort)):
+				season = result.get_season(date_range).season
+				if len(season) == 0:
+					continue
+				outputfile.write(' %s, ' % ProcessData.get_range(date_range))
 				for watermover in watermovers:
-					if watermover in data[i]['seasonal']['values']['ranges'][date_range]['values']:
-						outputfile.write('%*.*f, ' % (max(COLUMN_WIDTH, len(local_seepage_report_table[watermover])), DECIMAL_PLACES,  np.mean(data[i]['seasonal']['values']['ranges'][date_range]['values'][watermover]))) 
+					j = result.get_column(watermover)
+					if j >= 0:
+						outputfile.write('%*.*f, ' % (max(COLUMN_WIDTH, len(local_seepage_report_table[watermover])), DECIMAL_PLACES, season.means[0, j]))
 					else:
-						outputfile.write('%s, ' % (' '*max(COLUMN_WIDTH, len(local_seepage_report_table[watermover])))) 
-				outputfile.write('%*.*f' % (COLUMN_WIDTH, DECIMAL_PLACES, np.mean(data[i]['seasonal']['values']['ranges'][date_range]['all']))) 
+						outputfile.write('%s, ' % (' '*max(COLUMN_WIDTH, len(local_seepage_report_table[watermover]))))
+				outputfile.write('%*.*f' % (COLUMN_WIDTH, DECIMAL_PLACES, season.all_means[0]))
 		outputfile.close()
 
 	@staticmethod
@@ -426,27 +422,25 @@ class CSVOutput:
 		for i in range(len(data)):
 			outputfile.write('                               \n') 
 			outputfile.write('_________________________________________________________ \n')
-			outputfile.write('The list of nodes is = [%s]' % (' '.join(['%i'%node for node in data[i]['nodelist']['node']]))) 
-			if len(nc.coordinates.keys()) != 0:
-				total_distance = 0
+			outputfile.write('The list of nodes is = [%s]' % (' '.join(['%i'%node for node in data[i].nodelist['node']]))) 
+			if len(nc.coordinates) != 0:
+				(wall_distances, total_distance) = ProcessData.get_wall_distances(nc, data[i].nodelist)
 				line = ''
-				for nodepair in data[i]['nodelist']['node_pair']:
-					distance = ProcessData.get_distance(nc, nodepair)
-					total_distance = total_distance + distance
+				for nodepair, distance in zip(data[i].nodelist['node_pair'], wall_distances):
 					if line:
 						line = line + " "
 					line = line + "Distance(%s %s)=%.0f," % (nodepair[0]+1, nodepair[1]+1, distance)
 				outputfile.write('%s Transect=%.0f\n' % (line, total_distance)) 
-			line = ''.join(['(%s)' % (' '.join(['%d' % node for node in nodepair])) for nodepair in data[i]['nodelist']['node_pair']])
+			line = ''.join(['(%s)' % (' '.join(['%d' % node for node in nodepair])) for nodepair in data[i].nodelist['node_pair']])
 			outputfile.write('Wall  [%s]' % line) 
-			line = ' '.join([watermover_name for watermover_name in sorted(data[i]['nodelist']['watermover_names'].keys())])
+			line = ' '.join([watermover_name for watermover_name in sorted(data[i].nodelist['watermover_names'].keys())])
 			outputfile.write('Watermovers  [%s]\n' % line.strip()) 
 			outputfile.write('Timeperiod: %s - %s,' %  (nc. getStartDate(), nc.getEndDate())) 
 			outputfile.write('DATE, ')
 			if report_type.seepage_report in seepage_report_button:
 				watermovers = report_type.get_seepage_report_fields()
 			else:
-				watermovers = sorted(data[i]['nodelist']['watermovers'].keys())
+				watermovers = sorted(data[i].nodelist['watermovers'].keys())
 			local_seepage_report_table = dict([(watermover, current_seepage_report_table[watermover]+' (%s)' % nc._watermovervolume_units) for watermover in current_seepage_report_table.keys()])
 			for watermover in watermovers:
 				outputfile.write('%-*s, ' % (max(COLUMN_WIDTH,len(local_seepage_report_table[watermover])), local_seepage_report_table[watermover]))
@@ -455,14 +449,17 @@ class CSVOutput:
 			for watermover in watermovers:
 				outputfile.write(('-'*max(COLUMN_WIDTH,len(local_seepage_report_table[watermover])))+', ') 
 			outputfile.write('--------------------\n')
-			for year in sorted(data[i]['years'].keys(), key=ProcessData.cmp_to_key(ProcessData.intSort)):
-				outputfile.write('%d, '%(year))
+			result = data[i]
+			yearly = result.yearly
+			for p in range(len(yearly)):
+				outputfile.write('%d, '%(yearly.periods.years[p]))
 				for watermover in watermovers:
-					if watermover in data[i]['years'][year]['values']:
-						outputfile.write('%*.*f, ' % (max(COLUMN_WIDTH, len(local_seepage_report_table[watermover])), DECIMAL_PLACES,  sum(data[i]['years'][year]['values'][watermover])))
+					j = result.get_column(watermover)
+					if j >= 0:
+						outputfile.write('%*.*f, ' % (max(COLUMN_WIDTH, len(local_seepage_report_table[watermover])), DECIMAL_PLACES,  yearly.totals[p, j]))
 					else:
 						outputfile.write('%s, ' % (' '*max(COLUMN_WIDTH, len(local_seepage_report_table[watermover])))) 
-				outputfile.write('%*.*f' % (COLUMN_WIDTH, DECIMAL_PLACES, np.sum(data[i]['years'][year]['all']))) 
+				outputfile.write('%*.*f' % (COLUMN_WIDTH, DECIMAL_PLACES, yearly.all_totals[p])) 
 		outputfile.close()
 		
 	@staticmethod
@@ -476,27 +473,25 @@ class CSVOutput:
 		for i in range(len(data)):
 			outputfile.write('                               \n') 
 			outputfile.write('_________________________________________________________ \n')
-			outputfile.write('The list of nodes is = [%s]' % (' '.join(['%i'%node for node in data[i]['nodelist']['node']]))) 
-			if len(nc.coordinates.keys()) != 0:
-				total_distance = 0
+			outputfile.write('The list of nodes is = [%s]' % (' '.join(['%i'%node for node in data[i].nodelist['node']]))) 
+			if len(nc.coordinates) != 0:
+				(wall_distances, total_distance) = ProcessData.get_wall_distances(nc, data[i].nodelist)
 				line = ''
-				for nodepair in data[i]['nodelist']['node_pair']:
-					distance = ProcessData.get_distance(nc, nodepair)
-					total_distance = total_distance + distance
+				for nodepair, distance in zip(data[i].nodelist['node_pair'], wall_distances):
 					if line:
 						line = line + " "
 					line = line + "Distance(%s %s)=%.0f," % (nodepair[0]+1, nodepair[1]+1, distance)
 				outputfile.write('%s Transect=%.0f\n' % (line, total_distance)) 
-			line = ''.join(['(%s)' % (' '.join(['%d' % node for node in nodepair])) for nodepair in data[i]['nodelist']['node_pair']])
+			line = ''.join(['(%s)' % (' '.join(['%d' % node for node in nodepair])) for nodepair in data[i].nodelist['node_pair']])
 			outputfile.write('Wall  [%s]' % line) 
-			line = ' '.join([watermover_name for watermover_name in sorted(data[i]['nodelist']['watermover_names'].keys())])
+			line = ' '.join([watermover_name for watermover_name in sorted(data[i].nodelist['watermover_names'].keys())])
 			outputfile.write('Watermovers  [%s]\n' % line.strip()) 
 			outputfile.write('Timeperiod: %s - %s,' %  (nc. getStartDate(), nc.getEndDate())) 
 			outputfile.write('MONTH, ') 
 			if report_type.seepage_report in seepage_report_button:
 				watermovers = report_type.get_seepage_report_fields()
 			else:
-				watermovers = sorted(data[i]['nodelist']['watermovers'].keys())
+				watermovers = sorted(data[i].nodelist['watermovers'].keys())
 			local_seepage_report_table = dict([(watermover, current_seepage_report_table[watermover]+' (%s)' % nc._watermovervolume_units) for watermover in current_seepage_report_table.keys()])
 			for watermover in watermovers:
 				outputfile.write('%-*s, ' % (max(COLUMN_WIDTH,len(local_seepage_report_table[watermover])), local_seepage_report_table[watermover]))
@@ -505,14 +500,17 @@ class CSVOutput:
 			for watermover in watermovers:
 				outputfile.write(('-'*max(COLUMN_WIDTH,len(local_seepage_report_table[watermover])))+', ')
 			outputfile.write( '--------------------')
-			for month in sorted(data[i]['months'].keys(), key=ProcessData.cmp_to_key(ProcessData.intSort)):
-				outputfile.write('   %02d, '%month)
+			result = data[i]
+			month_of_year = result.month_of_year
+			for p in range(len(month_of_year)):
+				outputfile.write('   %02d, '%month_of_year.periods.months[p])
 				for watermover in watermovers:
-					if watermover in data[i]['months'][month]['values']:
-						outputfile.write('%*.*f, ' % (max(COLUMN_WIDTH, len(local_seepage_report_table[watermover])), DECIMAL_PLACES,  np.mean(data[i]['months'][month]['values'][watermover]))) 
+					j = result.get_column(watermover)
+					if j >= 0:
+						outputfile.write('%*.*f, ' % (max(COLUMN_WIDTH, len(local_seepage_report_table[watermover])), DECIMAL_PLACES,  month_of_year.means[p, j])) 
 					else:
 						outputfile.write('%s, ' % (' '*max(COLUMN_WIDTH, len(local_seepage_report_table[watermover]))))
-				outputfile.write('%*.*f' % (COLUMN_WIDTH, DECIMAL_PLACES, np.mean(data[i]['months'][month]['all']))) 
+				outputfile.write('%*.*f' % (COLUMN_WIDTH, DECIMAL_PLACES, month_of_year.all_means[p])) 
 		outputfile.close()
 
 	@staticmethod
@@ -526,27 +524,25 @@ class CSVOutput:
 		for i in range(len(data)):
 			outputfile.write('                               ')
 			outputfile.write('_________________________________________________________')
-			outputfile.write('The list of nodes is = [%s]' % (' '.join(['%i'%node for node in data[i]['nodelist']['node']])))
-			if len(nc.coordinates.keys()) != 0:
-				total_distance = 0
+			outputfile.write('The list of nodes is = [%s]' % (' '.join(['%i'%node for node in data[i].nodelist['node']])))
+			if len(nc.coordinates) != 0:
+				(wall_distances, total_distance) = ProcessData.get_wall_distances(nc, data[i].nodelist)
 				line = ''
-				for nodepair in data[i]['nodelist']['node_pair']:
-					distance = ProcessData.get_distance(nc, nodepair)
-					total_distance = total_distance + distance
+				for nodepair, distance in zip(data[i].nodelist['node_pair'], wall_distances):
 					if line:
 						line += " "
 					line += "Distance(%s %s)=%.0f," % (nodepair[0]+1, nodepair[1]+1, distance)
 				outputfile.write('%s Transect=%.0f\n' % (line, total_distance))
-			line = ''.join(['(%s)' % (' '.join(['%d' % node for node in nodepair])) for nodepair in data[i]['nodelist']['node_pair']])
+			line = ''.join(['(%s)' % (' '.join(['%d' % node for node in nodepair])) for nodepair in data[i].nodelist['node_pair']])
 			outputfile.write('Wall  [%s]' % line )
-			line = ' '.join([watermover_name for watermover_name in sorted(data[i]['nodelist']['watermover_names'].keys())])
+			line = ' '.join([watermover_name for watermover_name in sorted(data[i].nodelist['watermover_names'].keys())])
 			outputfile.write('Watermovers  [%s]\n' % line )
 			outputfile.write( 'Timeperiod: %s - %s,' %  (nc. getStartDate(), nc.getEndDate()))
 			outputfile.write('DATE      , ')
 			if report_type.seepage_report in seepage_report_button:
 				watermovers = report_type.get_seepage_report_fields()
 			else:
-				watermovers = sorted(data[i]['nodelist']['watermovers'].keys())
+				watermovers = sorted(data[i].nodelist['watermovers'].keys())
 			local_seepage_report_table = dict([(watermover, current_seepage_report_table[watermover]+' (%s)' % nc._watermovervolume_units) for watermover in current_seepage_report_table.keys()])
 			for watermover in watermovers:
 				outputfile.write('%-*s, ' % (max(COLUMN_WIDTH,len(local_seepage_report_table[watermover])), local_seepage_report_table[watermover]))
@@ -555,16 +551,17 @@ class CSVOutput:
 			for watermover in watermovers:
 				outputfile.write('%s, ' % ('-'*max(COLUMN_WIDTH, len(local_seepage_report_table[watermover]))))
 			outputfile.write('--------------------')
-			for year in sorted(data[i]['years'].keys(), key=ProcessData.cmp_to_key(ProcessData.intSort)):
-				for month in sorted(data[i]['years'][year]['months'].keys(), key=ProcessData.cmp_to_key(ProcessData.intSort)):
-					for day in sorted(data[i]['years'][year]['months'][month]['days'].keys(), key=ProcessData.cmp_to_key(ProcessData.intSort)):
-						outputfile.write('%02d/%02d/%d, '%(month, day, year))
-						for watermover in watermovers:
-							if watermover in data[i]['years'][year]['months'][month]['days'][day]['values']:
-								outputfile.write('%*.*f, ' % (max(COLUMN_WIDTH, len(local_seepage_report_table[watermover])), DECIMAL_PLACES,  sum(data[i]['years'][year]['months'][month]['days'][day]['values'][watermover])))
-							else:
-								outputfile.write('%s, ' % (' '*max(COLUMN_WIDTH, len(local_seepage_report_table[watermover]))))
-						outputfile.write('%*.*f' % (COLUMN_WIDTH, DECIMAL_PLACES, np.sum(data[i]['years'][year]['months'][month]['days'][day]['all']))) 
+			result = data[i]
+			daily = result.daily
+			for p in range(len(daily)):
+				outputfile.write('%02d/%02d/%d, '%(daily.periods.months[p], daily.periods.days[p], daily.periods.years[p]))
+				for watermover in watermovers:
+					j = result.get_column(watermover)
+					if j >= 0:
+						outputfile.write('%*.*f, ' % (max(COLUMN_WIDTH, len(local_seepage_report_table[watermover])), DECIMAL_PLACES,  daily.totals[p, j]))
+					else:
+						outputfile.write('%s, ' % (' '*max(COLUMN_WIDTH, len(local_seepage_report_table[watermover]))))
+				outputfile.write('%*.*f' % (COLUMN_WIDTH, DECIMAL_PLACES, daily.all_totals[p])) 
 		outputfile.close()
 	
 	@staticmethod
@@ -578,20 +575,18 @@ class CSVOutput:
 		for i in range(len(data)):
 			outputfile.write('                               \n')
 			outputfile.write('_________________________________________________________\n')
-			outputfile.write('The list of nodes is = [%s] \n' % (' '.join(['%i'%node for node in data[i]['nodelist']['node']])))
-			if len(nc.coordinates.keys()) != 0:
-				total_distance = 0
+			outputfile.write('The list of nodes is = [%s] \n' % (' '.join(['%i'%node for node in data[i].nodelist['node']])))
+			if len(nc.coordinates) != 0:
+				(wall_distances, total_distance) = ProcessData.get_wall_distances(nc, data[i].nodelist)
 				line = ''
-				for nodepair in data[i]['nodelist']['node_pair']:
-					distance = ProcessData.get_distance(nc, nodepair)
-					total_distance = total_distance + distance
+				for nodepair, distance in zip(data[i].nodelist['node_pair'], wall_distances):
 					if line:
 						line = line + " "
 					line = line + "Distance(%s %s)=%.0f," % (nodepair[0]+1, nodepair[1]+1, distance)
 				outputfile.write('%s Transect=%.0f\n' % (line, total_distance))
-			line = ''.join(['(%s)' % (' '.join(['%d' % node for node in nodepair])) for nodepair in data[i]['nodelist']['node_pair']])
+			line = ''.join(['(%s)' % (' '.join(['%d' % node for node in nodepair])) for nodepair in data[i].nodelist['node_pair']])
 			outputfile.write('Wall  [%s]\n' % line)
-			line = ' '.join([watermover_name for watermover_name in sorted(data[i]['nodelist']['watermover_names'].keys())])
+			line = ' '.join([watermover_name for watermover_name in sorted(data[i].nodelist['watermover_names'].keys())])
 			outputfile.write('Watermovers  [%s]\n' % line.strip())
 			outputfile.write('Timeperiod: %s - %s,\n' %  (nc.getStartDate(), nc.getEndDate()))
 			outputfile.write('DATE   , ')
@@ -599,7 +594,7 @@ class CSVOutput:
 			if report_type.seepage_report in seepage_report_button:
 				watermovers = report_type.get_seepage_report_fields()
 			else:
-				watermovers = sorted(data[i]['nodelist']['watermovers'].keys())
+				watermovers = sorted(data[i].nodelist['watermovers'].keys())
 			local_seepage_report_table = dict([(watermover, current_seepage_report_table[watermover]+' (%s)' % nc._watermovervolume_units) for watermover in current_seepage_report_table.keys()])
 			for watermover in watermovers:
 				outputfile.write('%-*s, ' % (max(COLUMN_WIDTH,len(local_seepage_report_table[watermover])), local_seepage_report_table[watermover]))
@@ -608,15 +603,17 @@ class CSVOutput:
 			for watermover in watermovers:
 				outputfile.write(('-'*max(COLUMN_WIDTH,len(local_seepage_report_table[watermover])))+', ')
 			outputfile.write('--------------------')
-			for year in sorted(data[i]['years'].keys(), key=ProcessData.cmp_to_key(ProcessData.intSort)):
-				for month in sorted(data[i]['years'][year]['months'].keys(), key=ProcessData.cmp_to_key(ProcessData.intSort)):
-					outputfile.write('\n%02d/%d, '%(month, year))
-					for watermover in watermovers:
-						if watermover in data[i]['years'][year]['months'][month]['values']:
-							outputfile.write('%*.*f, ' % (max(COLUMN_WIDTH, len(local_seepage_report_table[watermover])), DECIMAL_PLACES, sum(data[i]['years'][year]['months'][month]['values'][watermover])))
-						else:
-							outputfile.write('%s, ' % (' '*max(COLUMN_WIDTH, len(local_seepage_report_table[watermover]))))
-					outputfile.write('%*.*f' % (COLUMN_WIDTH, DECIMAL_PLACES, np.sum(data[i]['years'][year]['months'][month]['all'])))
+			result = data[i]
+			monthly = result.monthly
+			for p in range(len(monthly)):
+				outputfile.write('\n%02d/%d, '%(monthly.periods.months[p], monthly.periods.years[p]))
+				for watermover in watermovers:
+					j = result.get_column(watermover)
+					if j >= 0:
+						outputfile.write('%*.*f, ' % (max(COLUMN_WIDTH, len(local_seepage_report_table[watermover])), DECIMAL_PLACES, monthly.totals[p, j]))
+					else:
+						outputfile.write('%s, ' % (' '*max(COLUMN_WIDTH, len(local_seepage_report_table[watermover]))))
+				outputfile.write('%*.*f' % (COLUMN_WIDTH, DECIMAL_PLACES, monthly.all_totals[p]))
 		outputfile.close()
 
 	@staticmethod	
@@ -0,0 +1,104 @@
+import numpy as np
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor
+from PMGTransect_NETCDF import WaterMoverVolumeBlock
+from PMGTransect_Flux import TransectFlux
+from PMGTransect_Aggregate import TransectResult, get_accumulators
+
+class SharedVolume:
+	'''
+	Watermover volume columns of a run in one multiprocessing.shared_memory
+	block, timesteps x watermovers in the dtype of the volume variable. It is
+	filled window by window from volume_chunks, so the columns are never held
+	twice, and worker processes map it in place with attach(). The block is
+	unlinked again if reading volume_chunks fails.
+	'''
+	def __init__(self, watermovers, timesteps, dtype, volume_chunks):
+		self.watermovers = np.unique(np.asarray(watermovers, dtype=np.int64))
+		self.shape = (timesteps, len(self.watermovers))
+		self.dtype = np.dtype(dtype)
+		self.memory = shared_memory.SharedMemory(create=True, size=max(1, timesteps * len(self.watermovers) * self.dtype.itemsize))
+		values = np.ndarray(self.shape, dtype=self.dtype, buffer=self.memory.buf)
+		try:
+			for volume_block in volume_chunks:
+				values[volume_block.start:volume_block.stop] = volume_block.values
+		except:
+			# a failed read must not leave the segment behind in /dev/shm
+			values = None
+			self.close()
+			raise
+		del values
+
+	def get_spec(self):
+		return (self.memory.name, self.shape, self.dtype.str, self.watermovers)
+
+	@staticmethod
+	def attach(spec):
+		'''
+		Returns the shared memory block of a get_spec() and a
+		WaterMoverVolumeBlock reading it in place.
+		'''
+		(name, shape, dtype, watermovers) = spec
+		memory = shared_memory.SharedMemory(name=name)
+		values = np.ndarray(shape, dtype=np.dtype(dtype), buffer=memory.buf)
+		return memory, WaterMoverVolumeBlock(watermovers, values)
+
+	def close(self):
+		self.memory.close()
+		self.memory.unlink()
+
+_worker = dict()
+
+def init_worker(spec, calendar, periods, seasons, accumulate, series, threads):
+	(_worker['memory'], _worker['volume']) = SharedVolume.attach(spec)
+	_worker['calendar'] = calendar
+	_worker['periods'] = periods
+	_worker['seasons'] = seasons
+	_worker['accumulate'] = accumulate
+	_worker['series'] = series
+	_worker['threads'] = threads
+
+def compute_transect(transect):
+	'''
+	Computes the TransectFlux of one (watermovers, segment_watermovers,
+	kernel) transect from the shared volume and aggregates it over the
+	periods and seasons of the worker, with accumulators when it
+	accumulates. Returns the to_arrays() of the TransectResult, and the flux
+	when the time series report needs it (None otherwise).
+	'''
+	(watermovers, segment_watermovers, kernel) = transect
+	flux = TransectFlux.compute(_worker['volume'], watermovers, segment_watermovers, kernel)
+	calendar = _worker['calendar']
+	if _worker['accumulate']:
+		accumulators = get_accumulators(calendar, _worker['periods'], _worker['seasons'], len(flux.watermover_names))
+		for accumulator in accumulators.values():
+			accumulator.add(flux.start, flux.volumes)
+		result = TransectResult(None, calendar, flux.watermover_names, None, _worker['seasons'], accumulators)
+	else:
+		result = TransectResult(None, calendar, flux.watermover_names, flux.volumes, _worker['seasons'], None, _worker['threads'])
+		for period in _worker['periods']:
+			result.get_aggregate(period)
+		for date_range in _worker['seasons'] or []:
+			result.get_season(date_range)
+	if not _worker['series']:
+		flux = None
+	return result.to_arrays(), flux
+
+class TransectPool:
+	'''
+	Computes and aggregates the fluxes of the transects of a run in a pool
+	of worker processes that all read one SharedVolume, so only the period
+	statistics come back (and the fluxes for the time series report when
+	series is set). map() returns the results in transect order, whatever
+	order the workers finish in.
+	'''
+	def __init__(self, shared_volume, workers, calendar, periods, seasons=None, accumulate=False, series=False, threads=1):
+		self.shared_volume = shared_volume
+		self.workers = workers
+		self.initargs = (shared_volume.get_spec(), calendar, periods, seasons, accumulate, series, threads)
+
+	def map(self, transects, kernel):
+		tasks = [(watermovers, segment_watermovers, kernel) for watermovers, segment_watermovers in transects]
+		chunksize = max(1, len(tasks) // (4 * self.workers))
+		with ProcessPoolExecutor(max_workers=self.workers, initializer=init_worker, initargs=self.initargs) as executor:
+			return list(executor.map(compute_transect, tasks, chunksize=chunksize))
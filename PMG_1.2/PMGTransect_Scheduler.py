@@ -0,0 +1,141 @@
+import os
+import queue
+import threading
+import numpy as np
+import netCDF4
+import PMG_Utilities as util
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from PMGTransect_Store import get_volume_variable
+
+MEMORY_FRACTION = 0.75
+TOPOLOGY_VARIABLES = ['tricons', 'waterBodyMap', 'waterMoverMap', 'locations', 'meshNodeMap']
+# the topology keeps the mesh arrays and about as much again in its indexes
+TOPOLOGY_FACTOR = 2
+# watermovers a wall selects: both directions of up to two watermover types
+WALL_WATERMOVERS = 4
+WATERMOVER_TYPES = 4
+# in, out and net flux series and the result series of each type
+TRANSECT_SERIES = 4
+
+def get_available_memory():
+	'''
+	MemAvailable from /proc/meminfo, or the free physical pages where there
+	is no /proc.
+	'''
+	try:
+		with open('/proc/meminfo') as meminfo:
+			for line in meminfo:
+				if line.startswith('MemAvailable:'):
+					return int(line.split()[1]) * 1024
+	except OSError:
+		pass
+	return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+
+def get_working_set(filename, nodelist, segmentlist, chunk_length=0):
+	'''
+	Expected peak memory in bytes of processing one alternative, from the
+	netCDF header only: the volume columns the transects select over the
+	timesteps held at once, the flux and result series of every transect
+	and the mesh topology.
+	'''
+	water_budget_nc = netCDF4.Dataset(filename, 'r')
+	try:
+		variable = get_volume_variable(water_budget_nc)
+		(timesteps, watermovers) = variable.shape
+		itemsize = np.dtype(variable.dtype).itemsize
+		mesh_bytes = 0
+		for name in TOPOLOGY_VARIABLES:
+			if name in water_budget_nc.variables:
+				mesh_bytes += int(np.prod(water_budget_nc.variables[name].shape)) * 8
+	finally:
+		water_budget_nc.close()
+	walls = sum([len(node['node_pair']) for node in nodelist])
+	columns = min(watermovers, WALL_WATERMOVERS * walls + 2 * len(segmentlist))
+	held = timesteps
+	if chunk_length:
+		held = min(chunk_length, timesteps)
+	return columns * held * itemsize + len(nodelist) * WATERMOVER_TYPES * TRANSECT_SERIES * timesteps * 8 + \
+		TOPOLOGY_FACTOR * mesh_bytes
+
+class AlternativeScheduler:
+	'''
+	Runs a function on every alternative of a study in worker processes, at
+	most max_workers at once and only as many as fit in memory_limit bytes
+	(MEMORY_FRACTION of the available memory by default) by their expected
+	working sets. Waiting alternatives are started first fit in study order
+	whenever one finishes; one alternative always runs, however large.
+	run() returns the results in the order of the jobs.
+	'''
+	def __init__(self, max_workers, memory_limit=None):
+		if memory_limit == None:
+			memory_limit = int(get_available_memory() * MEMORY_FRACTION)
+		self.max_workers = max_workers
+		self.memory_limit = memory_limit
+
+	def run(self, function, jobs):
+		'''
+		jobs is a list of (name, working set, argument); function(argument) is
+		called for each.
+		'''
+		results = [None] * len(jobs)
+		pending = list(range(len(jobs)))
+		running = dict()
+		memory_used = 0
+		with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+			while pending or running:
+				for i in list(pending):
+					if len(running) >= self.max_workers:
+						break
+					(name, working_set, argument) = jobs[i]
+					if running and memory_used + working_set > self.memory_limit:
+						continue
+					pending.remove(i)
+					running[executor.submit(function, argument)] = i
+					memory_used += working_set
+					print('%s: started %s, expected working set %.1f MB, %d running' % (util.get_current_time(), name, \
+						working_set / (1024.0 * 1024.0), len(running)))
+				(done, not_done) = wait(list(running.keys()), return_when=FIRST_COMPLETED)
+				for future in done:
+					i = running.pop(future)
+					(name, working_set, argument) = jobs[i]
+					memory_used -= working_set
+					results[i] = future.result()
+					print('%s: finished %s' % (util.get_current_time(), name))
+		return results
+
+class AlternativePipeline:
+	'''
+	Loads the alternatives of a study in order in a background thread while
+	the caller processes them, so opening and reading the next wbbudget file
+	overlaps the aggregation and reports of the current one. Iterating
+	yields (alternative, load(alternative)) in order. The thread runs at
+	most depth alternatives ahead of the one being processed, which bounds
+	the runs held in memory to depth + 1. The caller must do no netCDF I/O
+	of its own meanwhile, as the netCDF library is not thread safe.
+	'''
+	def __init__(self, alternatives, load, depth=1):
+		self.alternatives = alternatives
+		self.load = load
+		self.slots = threading.Semaphore(depth + 1)
+		self.loaded = queue.Queue()
+
+	def __load_all(self):
+		for alternative in self.alternatives:
+			self.slots.acquire()
+			try:
+				self.loaded.put((alternative, self.load(alternative), None))
+			except Exception as error:
+				self.loaded.put((alternative, None, error))
+				return
+
+	def __iter__(self):
+		thread = threading.Thread(target=self.__load_all, daemon=True)
+		thread.start()
+		for i in range(len(self.alternatives)):
+			(alternative, loaded, error) = self.loaded.get()
+			if error != None:
+				raise error
+			yield alternative, loaded
+			del loaded
+			self.slots.release()
+		thread.join()
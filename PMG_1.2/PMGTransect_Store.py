@@ -0,0 +1,70 @@
+import os
+import sys
+import numpy as np
+import netCDF4
+import PMG_Utilities as util
+from PMGTransect_NETCDF import WaterMoverStore, STORE_HEADER, STORE_MAGIC, STORE_VERSION, STORE_ALIGNMENT
+
+DEFAULT_CHUNK_LENGTH = 365
+VOLUME_VARIABLES = ['WaterMoverVolume', 'FMWatermovers']
+
+def get_volume_variable(water_budget_nc):
+	for name in VOLUME_VARIABLES:
+		if name in water_budget_nc.variables:
+			return water_budget_nc.variables[name]
+	raise KeyError("no watermover volume variable in %s" % water_budget_nc.filepath())
+
+def convert(filename, store_filename=None, chunk_length=DEFAULT_CHUNK_LENGTH):
+	'''
+	Writes the volume variable of a time-major wbbudget file into a
+	watermover-major store (see WaterMoverStore), reading chunk_length
+	timesteps at a time. The store is written to a temporary file and moved
+	into place when complete.
+	'''
+	if not store_filename:
+		store_filename = WaterMoverStore.get_store_filename(filename)
+	stat = os.stat(filename)
+	temp_filename = "%s.%d.tmp" % (store_filename, os.getpid())
+	water_budget_nc = netCDF4.Dataset(filename, 'r')
+	try:
+		variable = get_volume_variable(water_budget_nc)
+		(timesteps, watermovers) = variable.shape
+		dtype = np.dtype(variable.dtype).newbyteorder('<')
+		column_bytes = timesteps * dtype.itemsize
+		index_end = STORE_HEADER.size + watermovers * 8
+		data_offset = ((index_end + STORE_ALIGNMENT - 1) // STORE_ALIGNMENT) * STORE_ALIGNMENT
+		offsets = data_offset + np.arange(watermovers, dtype='<i8') * column_bytes
+		with open(temp_filename, 'wb') as store_file:
+			store_file.write(STORE_HEADER.pack(STORE_MAGIC, STORE_VERSION, dtype.str.encode("ascii"), \
+				watermovers, timesteps, stat.st_size, stat.st_mtime_ns, data_offset))
+			store_file.write(offsets.tobytes())
+			store_file.truncate(data_offset + watermovers * column_bytes)
+		data = np.memmap(temp_filename, dtype=dtype, mode='r+', offset=data_offset, shape=(watermovers, timesteps))
+		for start in range(0, timesteps, chunk_length):
+			stop = min(start + chunk_length, timesteps)
+			print('%s: transposing timesteps %d to %d of %d' % (util.get_current_time(), start + 1, stop, timesteps))
+			data[:, start:stop] = np.ma.filled(variable[start:stop, :], 0).T
+		data.flush()
+		del data
+		os.replace(temp_filename, store_filename)
+	finally:
+		water_budget_nc.close()
+		if os.path.exists(temp_filename):
+			os.remove(temp_filename)
+	return store_filename
+
+if __name__ == "__main__":
+	import argparse
+	program_name = os.path.splitext(os.path.basename(sys.argv[0]))[0]
+	parser = argparse.ArgumentParser(prog=program_name, description='''Writes the watermover volumes of a
+		wbbudget netCDF file into a watermover-major store next to it (<file>%s). The
+		Transect Tool reads from the store whenever it exists and matches the file.''' % WaterMoverStore.get_store_filename(''))
+	parser.add_argument('netcdf', nargs='+', help='wbbudget netCDF files to convert')
+	parser.add_argument('-c', '--chunk_length',
+					action='store',
+					type=int,
+					default=DEFAULT_CHUNK_LENGTH,
+					help='Number of timesteps read from the netCDF file at a time.')
+	args = parser.parse_args()
+	for netcdf in args.netcdf:
+		print('%s: created %s' % (util.get_current_time(), convert(netcdf, chunk_length=args.chunk_length)))
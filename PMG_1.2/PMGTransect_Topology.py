@@ -0,0 +1,397 @@
+import hashlib
+import numpy as np
+from PMGTransect_Output import ReportType
+
+EXTERNAL_CELL_ID_MINIMUM = 500000000
+CANAL_MINIMUM = 300000
+CANAL_MAXIMUM = 399999
+PAIR_KEY_BITS = 32
+PAIR_KEY_LIMIT = 1 << PAIR_KEY_BITS
+
+class WaterMoverIndex:
+	'''
+	Read-only mapping from a cell (or a (left, right) cell pair) to the
+	watermovers that reference it, stored in CSR layout: keys are sorted and
+	keys[i] owns watermovers[offsets[i]:offsets[i+1]]. Pair keys are packed
+	into one int64 as left << PAIR_KEY_BITS | right.
+	'''
+	def __init__(self, keys, watermovers, offsets, paired):
+		self.keys_array = keys
+		self.watermovers = watermovers
+		self.offsets = offsets
+		self.paired = paired
+
+	@staticmethod
+	def build(keys, mask, paired):
+		watermovers = np.nonzero(mask)[0]
+		order = np.argsort(keys[watermovers], kind='stable')
+		sorted_keys = keys[watermovers][order]
+		unique_keys, offsets = np.unique(sorted_keys, return_index=True)
+		offsets = np.append(offsets, len(sorted_keys))
+		return WaterMoverIndex(unique_keys, watermovers[order], offsets, paired)
+
+	@staticmethod
+	def classify(watermovermap):
+		'''
+		Splits the waterMoverMap rows into internal (cell, cell) movers and the
+		movers to or from an external cell, keyed by the internal cell.
+		'''
+		left = watermovermap[:, 0]
+		right = watermovermap[:, 1]
+		left_external = left >= EXTERNAL_CELL_ID_MINIMUM
+		right_external = right >= EXTERNAL_CELL_ID_MINIMUM
+		internal = WaterMoverIndex.build((left << PAIR_KEY_BITS) | right, ~left_external & ~right_external, True)
+		external_left = WaterMoverIndex.build(left, ~left_external & right_external, False)
+		external_right = WaterMoverIndex.build(right, left_external & ~right_external, False)
+		return internal, external_left, external_right
+
+	@staticmethod
+	def from_arrays(arrays, name, paired):
+		return WaterMoverIndex(arrays[name + '_keys'], arrays[name + '_watermovers'], arrays[name + '_offsets'], paired)
+
+	def to_arrays(self, name):
+		return {name + '_keys': self.keys_array, name + '_watermovers': self.watermovers, name + '_offsets': self.offsets}
+
+	def encode(self, key):
+		if self.paired:
+			(left, right) = key
+			if not (0 <= left < PAIR_KEY_LIMIT and 0 <= right < PAIR_KEY_LIMIT):
+				return None
+			return (int(left) << PAIR_KEY_BITS) | int(right)
+		return int(key)
+
+	def find(self, key):
+		try:
+			code = self.encode(key)
+		except (TypeError, ValueError):
+			return -1
+		if code == None:
+			return -1
+		i = int(np.searchsorted(self.keys_array, code))
+		if i < len(self.keys_array) and self.keys_array[i] == code:
+			return i
+		return -1
+
+	def keys(self):
+		if self.paired:
+			return list(zip((self.keys_array >> PAIR_KEY_BITS).tolist(), (self.keys_array & (PAIR_KEY_LIMIT - 1)).tolist()))
+		return self.keys_array.tolist()
+
+	def __contains__(self, key):
+		return self.find(key) >= 0
+
+	def __getitem__(self, key):
+		i = self.find(key)
+		if i < 0:
+			raise KeyError(key)
+		return self.watermovers[self.offsets[i]:self.offsets[i + 1]].tolist()
+
+	def __len__(self):
+		return len(self.keys_array)
+
+class MeshTopology:
+	'''
+	Mesh lookups built from the arrays of Transect_NetCDF.read_topology. All
+	alternatives of a study normally share one mesh, so instances are kept in
+	a registry keyed by a digest of those arrays and the watermovers resolved
+	for a transect are remembered on the instance, leaving only the volume
+	read to be done per run.
+	'''
+	__shared = dict()
+
+	@staticmethod
+	def get_mesh_identity(topology):
+		mesh_hash = hashlib.sha1()
+		for name in sorted(topology.keys()):
+			array = np.ascontiguousarray(topology[name])
+			mesh_hash.update(("%s:%s:%s" % (name, array.dtype.str, array.shape)).encode("utf-8"))
+			mesh_hash.update(array.tobytes())
+		return mesh_hash.hexdigest()
+
+	@staticmethod
+	def get_shared(topology):
+		mesh_identity = MeshTopology.get_mesh_identity(topology)
+		if mesh_identity in MeshTopology.__shared:
+			print("reusing mesh topology %s" % mesh_identity)
+		else:
+			MeshTopology.__shared[mesh_identity] = MeshTopology(topology, mesh_identity)
+		return MeshTopology.__shared[mesh_identity]
+
+	@staticmethod
+	def clear_shared():
+		MeshTopology.__shared.clear()
+
+	def __init__(self, topology, mesh_identity=None):
+		self.mesh_identity = mesh_identity
+		(self.node_ids, self.coordinates) = self.build_coordinates(topology['node_ids'], topology['node_locations'])
+		self._waterbodymap = topology.get('waterbodymap')
+		(self._edge_keys, self._edge_waterbodies) = self.build_edge_table(topology['tricons'], self._waterbodymap)
+		self._watermovermap = None
+		self._external_cell_id_left = None
+		self._external_cell_id_right = None
+		if 'watermovermap_keys' in topology:
+			self._watermovermap = WaterMoverIndex.from_arrays(topology, 'watermovermap', True)
+			self._external_cell_id_left = WaterMoverIndex.from_arrays(topology, 'external_cell_id_left', False)
+			self._external_cell_id_right = WaterMoverIndex.from_arrays(topology, 'external_cell_id_right', False)
+		self._watermovertype_codes = topology.get('watermovertype_codes')
+		self._watermovertype_table = list()
+		if 'watermovertype_table' in topology:
+			self._watermovertype_table = topology['watermovertype_table'].tolist()
+		self._watermovertype_lookup = dict((name, code) for code, name in enumerate(self._watermovertype_table))
+		self._watermovername = topology.get('watermovername')
+		self._adjacent_keys = None
+		self._seepage_movers = dict()
+		if self._watermovermap != None:
+			self._adjacent_keys = self.build_adjacency_index(self._watermovermap)
+			self._seepage_movers = self.build_seepage_table(self._watermovermap, self._watermovertype_codes)
+		self._transects = dict()
+
+	@staticmethod
+	def build_edge_table(tricons, waterbodymap):
+		'''
+		Returns the directed triangle edges (n1, n2), packed as
+		n1 << PAIR_KEY_BITS | n2 and sorted, with the waterbody of the triangle
+		each belongs to. Where an edge occurs more than once the first triangle
+		wins, as it did when walls were matched by scanning the triangles.
+		'''
+		if waterbodymap is None or len(tricons) == 0:
+			return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+		tricons = np.asarray(tricons, dtype=np.int64)[:len(waterbodymap)]
+		tails = tricons.ravel()
+		heads = np.roll(tricons, -1, axis=1).ravel()
+		waterbodies = np.repeat(np.asarray(waterbodymap, dtype=np.int64)[:len(tricons)], tricons.shape[1])
+		valid = (tails >= 0) & (tails < PAIR_KEY_LIMIT) & (heads >= 0) & (heads < PAIR_KEY_LIMIT)
+		keys = (tails[valid] << PAIR_KEY_BITS) | heads[valid]
+		edge_keys, first = np.unique(keys, return_index=True)
+		return edge_keys, waterbodies[valid][first]
+
+	def join_edges(self, tails, heads):
+		'''
+		Looks up the directed edges (tails[i], heads[i]) in the edge table in one
+		pass. Returns their waterbodies and a mask of the edges found.
+		'''
+		tails = np.asarray(tails, dtype=np.int64)
+		heads = np.asarray(heads, dtype=np.int64)
+		waterbodies = np.zeros(len(tails), dtype=np.int64)
+		found = (tails >= 0) & (tails < PAIR_KEY_LIMIT) & (heads >= 0) & (heads < PAIR_KEY_LIMIT)
+		if len(self._edge_keys) == 0:
+			return waterbodies, np.zeros(len(tails), dtype=bool)
+		keys = (tails << PAIR_KEY_BITS) | heads
+		positions = np.minimum(np.searchsorted(self._edge_keys, keys), len(self._edge_keys) - 1)
+		found &= self._edge_keys[positions] == keys
+		waterbodies[found] = self._edge_waterbodies[positions[found]]
+		return waterbodies, found
+
+	@staticmethod
+	def build_coordinates(node_ids, node_locations):
+		'''
+		Returns the node ids sorted with their state plane (easting, northing)
+		coordinates as an (N, 2) float array in the same order. A node id listed
+		twice keeps its last location.
+		'''
+		node_ids = np.asarray(node_ids, dtype=np.int64)
+		node_locations = np.asarray(node_locations, dtype=np.float64).reshape(len(node_ids), 2)
+		unique_ids, last = np.unique(node_ids[::-1], return_index=True)
+		return unique_ids, node_locations[::-1][last]
+
+	def get_node_positions(self, nodes):
+		'''
+		Returns the rows of coordinates holding the given node ids, -1 for nodes
+		without coordinates.
+		'''
+		nodes = np.asarray(nodes, dtype=np.int64)
+		if len(self.node_ids) == 0:
+			return np.full(len(nodes), -1, dtype=np.int64)
+		positions = np.minimum(np.searchsorted(self.node_ids, nodes), len(self.node_ids) - 1)
+		return np.where(self.node_ids[positions] == nodes, positions, -1)
+
+	def get_wall_distances(self, node_pairs):
+		'''
+		Returns the length of each wall (n1, n2) and their sum, the transect
+		length. A wall gets length 0 unless both of its directed edges are in
+		the mesh with a nonzero waterbody and both nodes have coordinates.
+		'''
+		distances = np.zeros(len(node_pairs), dtype=np.float64)
+		if len(node_pairs) == 0:
+			return {'wall_distances': [], 'transect_distance': 0}
+		pairs = np.asarray(node_pairs, dtype=np.int64).reshape(len(node_pairs), 2)
+		(forward, forward_found) = self.join_edges(pairs[:, 0], pairs[:, 1])
+		(backward, backward_found) = self.join_edges(pairs[:, 1], pairs[:, 0])
+		walls = forward_found & (forward != 0) & backward_found & (backward != 0)
+		first = self.get_node_positions(pairs[:, 0])
+		second = self.get_node_positions(pairs[:, 1])
+		measured = walls & (first >= 0) & (second >= 0)
+		delta = self.coordinates[second[measured]] - self.coordinates[first[measured]]
+		distances[measured] = np.sqrt(delta[:, 0] * delta[:, 0] + delta[:, 1] * delta[:, 1])
+		wall_distances = distances.tolist()
+		total_distance = 0
+		for distance in wall_distances:
+			total_distance = total_distance + distance
+		return {'wall_distances': wall_distances, 'transect_distance': total_distance}
+
+	def get_watermovertype(self, watermover):
+		return self._watermovertype_table[self._watermovertype_codes[watermover]]
+
+	def get_watermovertype_code(self, watermovertype):
+		return self._watermovertype_lookup.get(watermovertype, -1)
+
+	@staticmethod
+	def get_canal_keys(watermovermap):
+		'''
+		Flags the (left, right) keys of watermovermap that touch a canal cell,
+		with the range test get_adjacent_watermovers has always applied.
+		'''
+		left = watermovermap.keys_array >> PAIR_KEY_BITS
+		right = watermovermap.keys_array & (PAIR_KEY_LIMIT - 1)
+		return ((left >= CANAL_MINIMUM) & (right <= CANAL_MAXIMUM)) | ((right >= CANAL_MINIMUM) & (right <= CANAL_MAXIMUM))
+
+	@staticmethod
+	def build_adjacency_index(watermovermap):
+		'''
+		Maps each cell to the positions in watermovermap.keys_array of the canal
+		keys it appears in, in key order.
+		'''
+		positions = np.nonzero(MeshTopology.get_canal_keys(watermovermap))[0]
+		keys = watermovermap.keys_array[positions]
+		cells = np.concatenate([keys >> PAIR_KEY_BITS, keys & (PAIR_KEY_LIMIT - 1)])
+		entries = np.unique((cells << PAIR_KEY_BITS) | np.concatenate([positions, positions]))
+		unique_cells, offsets = np.unique(entries >> PAIR_KEY_BITS, return_index=True)
+		offsets = np.append(offsets, len(entries))
+		return WaterMoverIndex(unique_cells, entries & (PAIR_KEY_LIMIT - 1), offsets, False)
+
+	def build_seepage_table(self, watermovermap, watermovertype_codes):
+		'''
+		Maps each cell to the (LevSeepMarshToSegMover, LevSeepDryToSegMover)
+		watermovers leaving it through a canal key, None where there is none.
+		When a cell has several, the last in file order is kept (keys in the
+		order they first appear in waterMoverMap, then watermover order), which
+		is the one the pairing loop over the waterMoverMap keys settled on.
+		'''
+		if watermovertype_codes is None:
+			return dict()
+		report_type = ReportType()
+		key_positions = np.repeat(np.arange(len(watermovermap)), np.diff(watermovermap.offsets))
+		# the watermovers of a key are in file order, so its first one is where the key first appears
+		first_watermovers = watermovermap.watermovers[watermovermap.offsets[:-1]][key_positions]
+		order = np.lexsort((watermovermap.watermovers, first_watermovers))
+		canal = self.get_canal_keys(watermovermap)[key_positions][order]
+		cells = (watermovermap.keys_array >> PAIR_KEY_BITS)[key_positions][order]
+		watermovers = watermovermap.watermovers[order]
+		codes = np.asarray(watermovertype_codes)[watermovers]
+		seepage_movers = dict()
+		for slot, watermovertype in enumerate([report_type.marsh_to_seg, report_type.dry_to_seg]):
+			selected = canal & (codes == self.get_watermovertype_code(watermovertype))
+			for cell, k in zip(cells[selected].tolist(), watermovers[selected].tolist()):
+				if cell not in seepage_movers:
+					seepage_movers[cell] = [None, None]
+				seepage_movers[cell][slot] = k
+		return dict((cell, tuple(movers)) for cell, movers in seepage_movers.items())
+
+	def get_adjacent_watermovers(self, watermover):
+		(left, right) = watermover
+		positions = list()
+		for cell in (left, right):
+			if cell in self._adjacent_keys:
+				positions += self._adjacent_keys[cell]
+		return [(int(key >> PAIR_KEY_BITS), int(key & (PAIR_KEY_LIMIT - 1))) \
+			for key in self._watermovermap.keys_array[sorted(set(positions))]]
+
+	def get_seepage_movers(self, cell):
+		return self._seepage_movers.get(cell, (None, None))
+
+	def resolve_transect(self, node):
+		'''
+		Returns the watermovers crossing the walls of a nodelist entry (see
+		ProcessData.get_nodelist), computed once per mesh and node pairs.
+		'''
+		return self.resolve_transects([node])[0]
+
+	def resolve_transects(self, nodes):
+		'''
+		Resolves a batch of nodelist entries, typically every transect of a
+		config. The walls not resolved before are deduplicated and joined
+		against the edge table at once, then each transect is assembled from its
+		walls in order. Returns the transects in the order of nodes.
+		'''
+		pending = [node for node in nodes if tuple(node['node_pair']) not in self._transects]
+		wall_keys = [(left << PAIR_KEY_BITS) | right for node in pending for left, right in node['node_pair'] \
+			if 0 <= left < PAIR_KEY_LIMIT and 0 <= right < PAIR_KEY_LIMIT]
+		walls = dict()
+		if len(wall_keys) != 0:
+			wall_keys = np.unique(np.asarray(wall_keys, dtype=np.int64))
+			tails = wall_keys >> PAIR_KEY_BITS
+			heads = wall_keys & (PAIR_KEY_LIMIT - 1)
+			(lefts, left_found) = self.join_edges(tails, heads)
+			(rights, right_found) = self.join_edges(heads, tails)
+			for key, left, has_left, right, has_right in zip(wall_keys.tolist(), lefts.tolist(), left_found.tolist(), \
+				rights.tolist(), right_found.tolist()):
+				walls[key] = self.__resolve_wall(left if has_left else None, right if has_right else None)
+		for node in pending:
+			key = tuple(node['node_pair'])
+			if key in self._transects:
+				continue
+			transect = {'watermover_names':{}, 'watermovers':{}, 'watermover_in':[], 'watermover_out':[]}
+			transect.update(self.get_wall_distances(node['node_pair']))
+			for left, right in node['node_pair']:
+				if 0 <= left < PAIR_KEY_LIMIT and 0 <= right < PAIR_KEY_LIMIT:
+					(added, watermover_in, watermover_out) = walls[(left << PAIR_KEY_BITS) | right]
+				else:
+					(added, watermover_in, watermover_out) = self.__resolve_wall(None, None)
+				for k, direction in added:
+					self.__add_watermover(transect, k, direction)
+				transect['watermover_in'] += watermover_in
+				transect['watermover_out'] += watermover_out
+			self._transects[key] = transect
+		return [self._transects[tuple(node['node_pair'])] for node in nodes]
+
+	def __add_watermover(self, transect, k, direction):
+		watermover_type = self.get_watermovertype(k)
+		if watermover_type not in transect['watermovers']:
+			transect['watermovers'][watermover_type] = {'in':[], 'out':[]}
+		transect['watermovers'][watermover_type][direction].append(k)
+		transect['watermover_names'][self._watermovername[k]] = 1
+
+	def __resolve_wall(self, left, right):
+		'''
+		Returns the (watermover, direction) pairs a wall adds to a transect and
+		the watermovers it adds to watermover_in and watermover_out, given the
+		waterbodies left and right of it (None where there is no triangle).
+		'''
+		added = list()
+		watermover_in = list()
+		watermover_out = list()
+		if left != None and right != None:
+			watermover = (left, right)
+			watermover_reverse = (right, left)
+			if watermover in self._watermovermap:
+				for k in self._watermovermap[watermover]:
+					added.append((k, 'in'))
+				watermover_in += self._watermovermap[watermover]
+			if watermover_reverse in self._watermovermap:
+				for k in self._watermovermap[watermover_reverse]:
+					added.append((k, 'out'))
+				watermover_out += self._watermovermap[watermover_reverse]
+			(M2S_left, D2S_left) = self.get_seepage_movers(left)
+			(M2S_right, D2S_right) = (None, None)
+			if right != left:
+				(M2S_right, D2S_right) = self.get_seepage_movers(right)
+			M2S = D2S = None
+			if M2S_left and D2S_right:
+				M2S = M2S_left
+				D2S = D2S_right
+			elif M2S_right and D2S_left:
+				M2S = M2S_right
+				D2S = D2S_left
+			if D2S and M2S:
+				if str(left) in self._watermovername[M2S]:
+					added.append((M2S, 'in'))
+				else: # str(right) in self._watermovername[M2S]
+					added.append((M2S, 'out'))
+		elif left != None or right != None:
+			if left in self._external_cell_id_left:
+				for k in self._external_cell_id_left[left]:
+					added.append((k, 'in'))
+			elif right in self._external_cell_id_right:
+				for k in self._external_cell_id_right[right]:
+					added.append((k, 'out'))
+		return added, watermover_in, watermover_out
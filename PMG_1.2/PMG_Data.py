@@ -13,6 +13,8 @@ TARGET_FIELD = "target"
 RUN_NAME_FIELD = "run_name"
 NAME_FIELD = "name"
 RUN_PATHS_FIELD = "run_paths_files"
+SEASONS_FIELD = "seasons"
+SEASON_ATTRIBUTES = ["start_month", "start_day", "end_month", "end_day"]
 
 class SloughVegetationData:
 	def __init__(self, data):
@@ -36,6 +38,9 @@ class TransectData:
 		self.run_paths_files = data[RUN_PATHS_FIELD]
 		if "segments" in data:
 			self.segments = data["segments"]
+		self.seasons = list()
+		if SEASONS_FIELD in data:
+			self.seasons = [tuple(int(value) for value in season) for season in data[SEASONS_FIELD]]
 
 class PMGMainData:
 	def __setup_slough_vegetation_pmg(self, root_xml_data):
@@ -82,6 +87,20 @@ class PMGMainData:
 				run_paths_files.append(path_dict)
 		return run_paths_files
 
+	def __find_seasons(self, xml_tag_data):
+		seasons = list()
+		if xml_tag_data.find(SEASONS_FIELD) == None:
+			return None
+		for season in xml_tag_data.find(SEASONS_FIELD).iter("season"):
+			try:
+				(month1, day1, month2, day2) = [int(season.attrib[name]) for name in SEASON_ATTRIBUTES]
+			except Exception:
+				raise InputErrorMessage("season", traceback.format_exc(), ET.tostring(season, encoding="unicode"))
+			if not (1 <= month1 <= 12 and 1 <= month2 <= 12 and 1 <= day1 <= 31 and 1 <= day2 <= 31):
+				raise InputErrorMessage("season dates", traceback.format_exc(), ET.tostring(season, encoding="unicode"))
+			seasons.append((month1, day1, month2, day2))
+		return seasons
+
 	def __setup_transect_timing_pmg(self, root_xml_data):
 		transects_pmg_data = dict()
 		transect_timing = root_xml_data.find("transect_timing")
@@ -89,6 +108,7 @@ class PMGMainData:
 		end_date_attrib = root_xml_data.find("end_date").attrib
 		start_date = self.__create_datetime(start_date_attrib)
 		end_date =  self.__create_datetime(end_date_attrib)
+		seasons = self.__find_seasons(root_xml_data)
 		transects = root_xml_data.iter("transect")
 		for transect in transects:
 			transect_pmg_data = dict()
@@ -108,6 +128,11 @@ class PMGMainData:
 			transect_pmg_data["nodes"] = nodes_list
 			transect_pmg_data[TARGET_FIELD] = transect.find(TARGET_FIELD).text.strip()
 			transect_pmg_data[RUN_PATHS_FIELD] = self.__find_run_data(transect)
+			transect_seasons = self.__find_seasons(transect)
+			if transect_seasons == None:
+				transect_seasons = seasons
+			if transect_seasons:
+				transect_pmg_data[SEASONS_FIELD] = transect_seasons
 			transects_pmg_data[transect_attribs[RUN_NAME_FIELD]] = TransectData(transect_pmg_data)
 		return transects_pmg_data
 
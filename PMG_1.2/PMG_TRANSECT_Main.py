@@ -7,7 +7,15 @@ import getpass
 import math
 import statistics
 import traceback 
-from PMGTransect_NETCDF import Transect_NetCDF
+import gc
+import tempfile
+from PMGTransect_NETCDF import Transect_NetCDF, WaterMoverVolumeBlock
+from PMGTransect_Cache import TopologyCache, CACHE_DIR_ENV, DEFAULT_SIZE_LIMIT
+from PMGTransect_Aggregate import TransectResult, get_accumulators
+from PMGTransect_Flux import TransectFlux, TransectIncidence, KERNELS, DEFAULT_KERNEL, NUMBA_AVAILABLE
+from PMGTransect_Parallel import SharedVolume, TransectPool
+from PMGTransect_Store import DEFAULT_CHUNK_LENGTH
+from PMGTransect_Scheduler import AlternativeScheduler, AlternativePipeline, get_working_set
 import PMG_Data 
 import PMG_Utilities as util
 from PMG_Exceptions import TransectProccessErrorMessage
@@ -27,7 +35,8 @@ TIME_MAX = 5
 
 class LocalData:
 	def __init__(self, netCDF_file, nodelist, seepage_report_list, \
-		report_type_list, savedir=None, savelabel=None, segment_list=None) -> None:
+		report_type_list, savedir=None, savelabel=None, segment_list=None, chunk_length=0, topology_cache=None, \
+		coordinates_file=None, config_nodelist=None, kernel=DEFAULT_KERNEL, seasons=None, accumulate=False, workers=1, threads=1) -> None:
 		self.netCDF_file = netCDF_file
 		self.nodelist = nodelist
 		self.seepage_report_list = seepage_report_list
@@ -35,172 +44,236 @@ class LocalData:
 		self.savedir = savedir
 		self.savelabel = savelabel
 		self.segmentlist = segment_list
+		self.chunk_length = chunk_length
+		self.topology_cache = topology_cache
+		self.coordinates_file = coordinates_file
+		self.config_nodelist = config_nodelist
+		self.kernel = kernel
+		self.seasons = seasons
+		self.accumulate = accumulate
+		self.workers = workers
+		self.threads = threads
+
+class RowSpool:
+	'''
+	Time series report rows of the transects of a run, written window by
+	window to one temporary file and copied out transect by transect.
+	'''
+	def __init__(self, transects):
+		self.file = tempfile.TemporaryFile()
+		self.size = 0
+		self.segments = [list() for i in range(transects)]
+
+	def write(self, i, rows):
+		rows = rows.encode()
+		self.file.write(rows)
+		self.segments[i].append((self.size, len(rows)))
+		self.size += len(rows)
+
+	def copy(self, i, outputfile):
+		for offset, length in self.segments[i]:
+			self.file.seek(offset)
+			outputfile.write(self.file.read(length).decode())
+
+	def close(self):
+		self.file.close()
 
 class TransectTool:
 	def __init__(self, local_data):
 		self.local_data = local_data
-		self.nc = Transect_NetCDF(local_data.netCDF_file)
-
-
-
-	def get_adjacent_watermovers(self, watermover):
-		adjacent_watermovers = []
-		(left, right) = watermover
-		for key in self.nc._watermovermap.keys():
-			if left in key or right in key:
-				(key_left, key_right) = key
-				if (key_left >= CANAL_MINIMUM and key_right <= CANAL_MAXIMUM) or \
-				(key_right >= CANAL_MINIMUM and key_right <= CANAL_MAXIMUM):
-					adjacent_watermovers.append(key)
-		return adjacent_watermovers
-
-	def get_seasonal_data(self, seasonal_data_parameters):
-		seasonal_data = []
-		for seasonal_data_parameter in seasonal_data_parameters:
-			(group, month1_option, day1_option, month2_option, day2_option) = seasonal_data_parameter
-			month1 = month1_option.index(0)+1
-			day1 = day1_option.index(0)+1
-			month2 = month2_option.index(0)+1
-			day2 = day2_option.index(0)+1
-			seasonal_data.append((month1, day1, month2, day2))
-		return seasonal_data
-
-	def in_monthly_range(self, dates, month, day):
-			(month1, day1, month2, day2) = dates
-			if month1 <= month2:
-				if month > month1 and month < month2:
-					return True
-				elif month == month1 and month < month2:
-					if day >= day1:
-						return True
-					else:
-						return False
-				elif month == month1 and month == month2:
-					if day >= day1 and day <= day2:
-						return True
-					elif day1 > day2 and day <= day2:
-						return True
-					else:
-						return False
-				elif month == month2:
-					if day <= day2:
-						return True
-					else:
-						return False
-				else:
-					return False
-			else: # month1 > month2:
-				if month > month1 or month < month2:
-					return True
-				elif month == month1 and day >= day1:
-					return True
-				elif month == month2 and day <= day2:
-					return True
-				else:
-					return False
-
-	def timestamp_loop(self, message, watermovers, segment_watermovers, data, outputfile, print_count):
+		self.nc = Transect_NetCDF(local_data.netCDF_file, local_data.topology_cache, local_data.coordinates_file)
+		self.volume = None
+		self.loaded = False
+
+	def get_transect_watermovers(self, watermovers, segment_watermovers):
+		transect_watermovers = []
+		for watermover_type in watermovers.values():
+			transect_watermovers += watermover_type['in']
+			transect_watermovers += watermover_type['out']
+		if segment_watermovers:
+			transect_watermovers += segment_watermovers
+		return transect_watermovers
+
+	def get_volume_watermovers(self):
+		volume_watermovers = []
+		for node in self.local_data.nodelist:
+			volume_watermovers += self.get_transect_watermovers(node['watermovers'], None)
+		for segment in self.local_data.segmentlist.values():
+			if 'watermovers' in segment:
+				volume_watermovers += segment['watermovers']
+		return volume_watermovers
+
+	def get_volume_chunks(self, watermovers, segment_watermovers):
+		if self.local_data.chunk_length:
+			return self.nc.iter_watermover_volume(self.get_transect_watermovers(watermovers, segment_watermovers), \
+				self.local_data.chunk_length)
+		return iter([self.volume])
+
+	def get_segment_watermovers(self, node):
+		segment_watermovers = None
+		for node_pair in node['node_pair']:
+			if node_pair in self.local_data.segmentlist:
+				if segment_watermovers == None:
+					segment_watermovers = []
+				segment_watermovers += self.local_data.segmentlist[node_pair]['watermovers']
+		return segment_watermovers
+
+	def get_fluxes(self, watermovers, segment_watermovers):
+		return (TransectFlux.compute(volume_chunk, watermovers, segment_watermovers, self.local_data.kernel) \
+			for volume_chunk in self.get_volume_chunks(watermovers, segment_watermovers))
+
+	def get_transect_results(self, series):
+		'''
+		Computes every transect from one signed incidence matrix in a single
+		pass over the watermover volumes, window by window. Each window's
+		fluxes are folded into the series or accumulators of their transects,
+		and their time series report rows spooled when series is set, before
+		the next window is read. Returns the TransectResults in nodelist order
+		and the RowSpool (None without series).
+		'''
+		transects = [(node['watermovers'], self.get_segment_watermovers(node)) for node in self.local_data.nodelist]
+		incidence = TransectIncidence(transects)
+		if self.local_data.chunk_length:
+			volume_chunks = self.nc.iter_watermover_volume(incidence.watermovers, self.local_data.chunk_length)
+		else:
+			volume_chunks = (WaterMoverVolumeBlock(self.volume.watermovers, self.volume.values[start:start + DEFAULT_CHUNK_LENGTH], start) \
+				for start in range(0, len(self.volume.values), DEFAULT_CHUNK_LENGTH))
+		accumulators = [self.get_transect_accumulators(watermovers) for watermovers, segment_watermovers in transects]
+		volume_series = [list() for transect in transects]
+		spool = None
+		if series:
+			spool = RowSpool(len(transects))
+		for volume_block in volume_chunks:
+			print('%s: processing timesteps %d to %d of %d' % (util.get_current_time(), volume_block.start + 1, volume_block.stop, \
+				self.nc.getTimestampLen()))
+			for i, flux in enumerate(incidence.get_fluxes(volume_block)):
+				self.add_flux(accumulators[i], volume_series[i], flux)
+				if spool != None:
+					spool.write(i, self.format_rows(flux))
+		results = [self.get_result(node, accumulators[i], volume_series[i]) for i, node in enumerate(self.local_data.nodelist)]
+		return results, spool
+
+	def get_seasons(self):
+		report_type = ReportType()
+		if report_type.seasonal_average_report in self.local_data.report_type_list or \
+			report_type.seasonal_totals_report in self.local_data.report_type_list:
+			return self.local_data.seasons
+		return None
+
+	def format_rows(self, flux):
+		return ''.join([''.join(flux.format_row(t, self.nc.getTimestamp(t))) for t in range(flux.start, flux.stop)])
+
+	def get_parallel_results(self, series):
+		'''
+		Computes and aggregates the flux of every transect in
+		self.local_data.workers processes reading one shared memory copy of
+		the volume columns. Returns the TransectResults and, when series is
+		set, the fluxes for the time series report (else None for each), in
+		nodelist order.
+		'''
+		watermovers = self.get_volume_watermovers()
+		volume_chunks = self.nc.iter_watermover_volume(watermovers, self.local_data.chunk_length or DEFAULT_CHUNK_LENGTH)
+		shared_volume = SharedVolume(watermovers, self.nc.getTimestampLen(), self.nc._watermovervolume.dtype, volume_chunks)
+		try:
+			transects = [(node['watermovers'], self.get_segment_watermovers(node)) for node in self.local_data.nodelist]
+			pool = TransectPool(shared_volume, self.local_data.workers, self.nc.calendar, self.get_periods(), self.get_seasons(), \
+				self.local_data.accumulate, series, self.local_data.threads)
+			transect_arrays = pool.map(transects, self.local_data.kernel)
+		finally:
+			shared_volume.close()
+		results = list()
+		for node, (arrays, flux) in zip(self.local_data.nodelist, transect_arrays):
+			results.append(TransectResult.from_arrays(node, self.nc.calendar, sorted(node['watermovers'].keys()), arrays, \
+				self.get_seasons(), self.local_data.accumulate, self.local_data.threads))
+		return results, [flux for arrays, flux in transect_arrays]
+
+	def get_periods(self):
+		'''
+		The calendar periods the reports and the Continuity and Timing
+		processes read.
+		'''
 		report_type = ReportType()
+		periods = ['monthly', 'yearly', 'month_of_year']
+		if report_type.daily_report in self.local_data.report_type_list:
+			periods.append('daily')
+		return periods
+
+	def get_transect_accumulators(self, watermovers):
+		if self.local_data.accumulate:
+			return get_accumulators(self.nc.calendar, self.get_periods(), self.get_seasons(), len(watermovers))
+		return None
+
+	def add_flux(self, accumulators, volume_series, flux):
+		if accumulators != None:
+			for accumulator in accumulators.values():
+				accumulator.add(flux.start, flux.volumes)
+		else:
+			volume_series.append(np.ascontiguousarray(flux.volumes))
+
+	def get_result(self, nodelist, accumulators, volume_series):
+		watermover_names = sorted(nodelist['watermovers'].keys())
+		if accumulators != None:
+			return TransectResult(nodelist, self.nc.calendar, watermover_names, None, self.get_seasons(), accumulators, self.local_data.threads)
+		if len(volume_series) == 0:
+			volume_series.append(np.zeros((0, len(watermover_names))))
+		return TransectResult(nodelist, self.nc.calendar, watermover_names, np.concatenate(volume_series), self.get_seasons(), \
+			None, self.local_data.threads)
+
+	def timestamp_loop(self, message, nodelist, segment_watermovers, outputfile, print_count):
 		last_time = time.time() - TIME_MAX
-		for t in range(self.nc.getTimestampLen()):
-			current_time = time.time()
-			if  t in [0, self.nc.getTimestampLen()-1] or current_time - last_time >= TIME_MAX:
-				print('%s: %s, processed timestep %d of %d' % (util.get_current_time(), message, t+1, self.nc.getTimestampLen()))
-				last_time = current_time
-			timestamp = self.nc.getTimestamp(t)
-			watermovervolume = 0.0 
-			in_volume_total = 0.0
-			out_volume_total = 0.0
-			watermover_names = []
-			watermover_names = sorted(watermovers.keys())
-			for j in range(len(watermover_names)):
-				watermover_name = watermover_names[j]
-				in_volume = 0.0
-				out_volume = 0.0
-				volume = 0.0
-			
-				for k in watermovers[watermover_name]['in']:
-					#if use_self.nc_utils:
-					#	watermovervolume = self.nc_utils.get_watermover_volume(t, k)
-					#else:
-					watermovervolume = float(self.nc._watermovervolume[t][k])
-					in_volume += watermovervolume
-					in_volume_total += watermovervolume
-					volume += watermovervolume
-				for k in watermovers[watermover_name]['out']:
-					#if use_nc_utils:
-					#	watermovervolume = nc_utils.get_watermover_volume(t, k)
-					#else:
-					watermovervolume = float(self.nc._watermovervolume[t][k])
-					out_volume += watermovervolume
-					out_volume_total += watermovervolume
-					volume -= watermovervolume
-				if watermover_name == report_type.manning_circle and segment_watermovers:
-					for segment_watermover in segment_watermovers:
-						#if use_nc_utils:
-						#	volume += nc_utils.get_watermover_volume(t, segment_watermover)
-						#	else:
-						volume += float(self.nc._watermovervolume[t][segment_watermover])
-				(month, day, year) = [int(i) for i in timestamp.split()[0].split('/')]
-		
-				if year not in data['years']:
-					data['years'][year] = {'all': [], 'values': {}, 'months': {}}
-				if watermover_name not in data['years'][year]['values']:
-					data['years'][year]['values'][watermover_name] = []
-				data['years'][year]['all'].append(volume)
-				data['years'][year]['values'][watermover_name].append(volume)
-		
-				if month not in data['years'][year]['months']:
-					data['years'][year]['months'][month] = {'all': [], 'values': {}, 'days': {}}
-				if watermover_name not in data['years'][year]['months'][month]['values']:
-					data['years'][year]['months'][month]['values'][watermover_name] = []
-				data['years'][year]['months'][month]['all'].append(volume)
-				data['years'][year]['months'][month]['values'][watermover_name].append(volume)
-		
-				if day not in data['years'][year]['months'][month]['days']:
-					data['years'][year]['months'][month]['days'][day] = {'all': [], 'values': {}}
-				if watermover_name not in data['years'][year]['months'][month]['days'][day]['values']:
-					data['years'][year]['months'][month]['days'][day]['values'][watermover_name] = []
-				data['years'][year]['months'][month]['days'][day]['values'][watermover_name].append(volume)
-				data['years'][year]['months'][month]['days'][day]['all'].append(volume)
-		
-				if month not in data['months']:
-					data['months'][month] = {'all': [], 'values': {}}
-				if watermover_name not in data['months'][month]['values']:
-					data['months'][month]['values'][watermover_name] = []
-				data['months'][month]['all'].append(volume)
-				data['months'][month]['values'][watermover_name].append(volume)
-
-				if 'seasonal' in data:
-					for date_range in data['seasonal']['ranges']:
-						range_year = ProcessData.get_range_years(date_range, month, day, year)
-						if range_year not in data['seasonal']['values']['years']:
-							data['seasonal']['values']['years'][range_year] = {}
-						if date_range not in data['seasonal']['values']['years'][range_year]:
-							data['seasonal']['values']['years'][range_year][date_range] = {'all': [], 'values': {}}
-						if watermover_name not in data['seasonal']['values']['years'][range_year][date_range]['values']:
-							data['seasonal']['values']['years'][range_year][date_range]['values'][watermover_name] = []
-						if date_range not in data['seasonal']['values']['ranges']:
-							data['seasonal']['values']['ranges'][date_range] = {'all': [], 'values': {}}
-						if watermover_name not in data['seasonal']['values']['ranges'][date_range]['values']:
-							data['seasonal']['values']['ranges'][date_range]['values'][watermover_name] = []
-						if self.in_monthly_range(date_range, month, day):
-							data['seasonal']['values']['years'][range_year][date_range]['values'][watermover_name].append(volume)
-							data['seasonal']['values']['years'][range_year][date_range]['all'].append(volume)
-							data['seasonal']['values']['ranges'][date_range]['values'][watermover_name].append(volume)
-							data['seasonal']['values']['ranges'][date_range]['all'].append(volume)
-				if j == 0:
-					message1 = "%s,  %-15s,  %20.5f,  %20.5f,  %20.5f" % (timestamp, watermover_name, in_volume, out_volume, volume)
-					outputfile.write(message1)
-				else:
-					outputfile.write('                   ,  %-15s,  %20.5f,  %20.5f,  %20.5f' % (watermover_name, in_volume, out_volume, volume))
+		watermovers = nodelist['watermovers']
+		volume_series = []
+		accumulators = self.get_transect_accumulators(watermovers)
+		for flux in self.get_fluxes(watermovers, segment_watermovers):
+			self.add_flux(accumulators, volume_series, flux)
+			for t in range(flux.start, flux.stop):
+				current_time = time.time()
+				if  t in [0, self.nc.getTimestampLen()-1] or current_time - last_time >= TIME_MAX:
+					print('%s: %s, processed timestep %d of %d' % (util.get_current_time(), message, t+1, self.nc.getTimestampLen()))
+					last_time = current_time
+				outputfile.write(''.join(flux.format_row(t, self.nc.getTimestamp(t))))
+		return self.get_result(nodelist, accumulators, volume_series)
+
+	def load(self):
+		'''
+		The netCDF part of main(): finds the watermovers of the segments and
+		transects and reads their volumes unless they are streamed. It runs
+		once, ahead of main() when an AlternativePipeline prefetches the run.
+		The watermovers go into copies of the nodelist and segmentlist entries,
+		which the alternatives of a transect group share.
+		'''
+		if self.loaded:
+			return
+		if self.nc._watermovervolume == None:
+			raise Exception('First netcdf file has no watermovervolumes')
+		self.local_data.segmentlist = dict((key, dict(segment)) for key, segment in self.local_data.segmentlist.items())
+		segments = list(self.local_data.segmentlist.keys())
+
+		for i in range(len(segments)):
+			if self.local_data.segmentlist[segments[i]]['waterbody'] in self.nc._watermovermap:
+				self.local_data.segmentlist[segments[i]]['watermovers'] =  self.nc._watermovermap[self.local_data.segmentlist[segments[i]]['waterbody']]
+
+		if len(self.nc.coordinates) == 0:
+			print("error No coordinates ")
+		print('%s: finished loading netcdf' % (util.get_current_time()))
+		print('%s: started finding watermovers' % (util.get_current_time()))
+		if self.local_data.config_nodelist:
+			self.nc.topology.resolve_transects(self.local_data.config_nodelist)
+		transects = self.nc.topology.resolve_transects(self.local_data.nodelist)
+		self.local_data.nodelist = [dict(node) for node in self.local_data.nodelist]
+		for i in range(len(self.local_data.nodelist)):
+			self.local_data.nodelist[i].update(transects[i])
+		if not self.local_data.chunk_length and self.local_data.workers <= 1:
+			print('%s: started reading watermover volumes' % (util.get_current_time()))
+			self.volume = self.nc.read_watermover_volume(self.get_volume_watermovers())
+			print('%s: finished reading %d watermover volumes' % (util.get_current_time(), len(self.volume.watermovers)))
+		self.loaded = True
 
 	def main(self):
 		print("Start")
 		report_type = ReportType()
 		seepage_report_table_w_segs = report_type.get_seepage_report_table_w_segs()
 		print(seepage_report_table_w_segs)
-		seasonal_data = list()
 		if self.local_data.savedir:
 			outdir = self.local_data.savedir
 		elif self.local_data.savelabel:
@@ -218,89 +291,11 @@ class TransectTool:
 				sys.exit()
 		print(self.nc.getStartDate())
 		print('%s: Started loading netcdf' % (util.get_current_time()))
-		if self.nc._watermovervolume == None:
-			raise Exception('First netcdf file has no watermovervolumes')
-		segments = list(self.local_data.segmentlist.keys())
-
-		for i in range(len(segments)):
-			if self.local_data.segmentlist[segments[i]]['waterbody'] in self.nc._watermovermap:
-				self.local_data.segmentlist[segments[i]]['watermovers'] =  self.nc._watermovermap[segmentlist[segments[i]]['waterbody']]
-
+		self.load()
 		if self.local_data.segmentlist:
 			current_seepage_report_table = seepage_report_table_w_segs
 		else:
 				current_seepage_report_table = report_type.get_seepage_report_table()
-		if len(self.nc.coordinates.keys()) == 0:
-			print("error No coordinates ")
-		print('%s: finished loading netcdf' % (util.get_current_time()))
-		print('%s: started finding watermovers' % (util.get_current_time()))
-		for i in range(len(self.local_data.nodelist)):
-			for j in range(len(self.local_data.nodelist[i]['node_pair'])):
-				left = ProcessData.find_node_pair(self.local_data.nodelist[i]['node_pair'][j], self.nc._tricons_concat, self.nc._waterbodymap)
-				right = ProcessData.find_node_pair(self.local_data.nodelist[i]['node_pair_reverse'][j], self.nc._tricons_concat,  self.nc._waterbodymap)
-				if left != None and  right != None:
-					watermover = (left, right)
-					watermover_reverse = (right, left)
-					if watermover in self.nc._watermovermap:
-						for k in self.nc._watermovermap[watermover]:
-							if self.nc._watermovertype[k] not in self.local_data.nodelist[i]['watermovers']:
-								self.local_data.nodelist[i]['watermovers'][self.nc._watermovertype[k]] = {'in':[], 'out':[]}
-							self.local_data.nodelist[i]['watermovers'][self.nc._watermovertype[k]]['in'].append(k)
-							self.local_data.nodelist[i]['watermover_names'][self.nc._watermovername[k]] = 1
-						self.local_data.nodelist[i]['watermover_in'] += self.nc._watermovermap[watermover]
-					
-					if watermover_reverse in self.nc._watermovermap:
-						for k in self.nc._watermovermap[watermover_reverse]:
-							if self.nc._watermovertype[k] not in self.local_data.nodelist[i]['watermovers']:
-								self.local_data.nodelist[i]['watermovers'][self.nc._watermovertype[k]] = {'in':[], 'out':[]}
-							self.local_data.nodelist[i]['watermovers'][self.nc._watermovertype[k]]['out'].append(k)
-							self.local_data.nodelist[i]['watermover_names'][self.nc._watermovername[k]] = 1
-						self.local_data.nodelist[i]['watermover_out'] += self.nc._watermovermap[watermover_reverse]
-					adjacent_watermovers = self.get_adjacent_watermovers(watermover)
-					D2S_left = D2S_right = D2S = None
-					M2S_left = M2S_right = M2S = None
-					for adjacent_watermover in adjacent_watermovers:
-						for k in self.nc._watermovermap[adjacent_watermover]:
-							if self.nc._watermovertype[k] == 'LevSeepMarshToSegMover':
-								if adjacent_watermover[0] == left:
-									M2S_left = k
-								elif adjacent_watermover[0] == right:
-									M2S_right = k
-							elif self.nc._watermovertype[k] == 'LevSeepDryToSegMover':
-								if adjacent_watermover[0] == left:
-									D2S_left = k
-								elif adjacent_watermover[0] == right:
-									D2S_right = k
-					if M2S_left and D2S_right:
-						M2S = M2S_left
-						D2S = D2S_right
-					elif M2S_right and D2S_left:
-						M2S = M2S_right
-						D2S = D2S_left
-					if D2S and M2S:
-						if re.search("%s" % left, self.nc._watermovername[M2S]):
-							if self.nc._watermovertype[M2S] not in self.local_data.nodelist[i]['watermovers']:
-								self.local_data.nodelist[i]['watermovers'][self.nc._watermovertype[M2S]] = {'in':[], 'out':[]}
-							self.local_data.nodelist[i]['watermovers'][self.nc._watermovertype[M2S]]['in'].append(M2S)
-							self.local_data.nodelist[i]['watermover_names'][self.nc._watermovername[M2S]] = 1
-						else: # re.search("%s" % right, nc._watermovername[M2S]):
-							if self.nc._watermovertype[M2S] not in self.local_data.nodelist[i]['watermovers']:
-								self.local_data.nodelist[i]['watermovers'][self.nc._watermovertype[M2S]] = {'in':[], 'out':[]}
-							self.local_data.nodelist[i]['watermovers'][self.nc._watermovertype[M2S]]['out'].append(M2S)
-							self.local_data.nodelist[i]['watermover_names'][self.nc._watermovername[M2S]] = 1
-				elif left != None or right != None:
-					if left in self.nc._external_cell_id_left:
-						for k in self.nc._external_cell_id_left[left]:
-							if self.nc._watermovertype[k] not in self.local_data.nodelist[i]['watermovers']:
-								self.local_data.nodelist[i]['watermovers'][self.nc._watermovertype[k]] = {'in':[], 'out':[]}
-							self.local_data.nodelist[i]['watermovers'][self.nc._watermovertype[k]]['in'].append(k)
-							self.local_data.nodelist[i]['watermover_names'][self.nc._watermovername[k]] = 1
-					elif right in self.nc._external_cell_id_right:
-						for k in self.nc._external_cell_id_right[right]:
-							if self.nc._watermovertype[k] not in self.local_data.nodelist[i]['watermovers']:
-								self.local_data.nodelist[i]['watermovers'][self.nc._watermovertype[k]] = {'in':[], 'out':[]}
-							self.local_data.nodelist[i]['watermovers'][self.nc._watermovertype[k]]['out'].append(k)
-							self.local_data.nodelist[i]['watermover_names'][self.nc._watermovername[k]] = 1
 		print(outdir)
 		if self.local_data.savelabel:
 			filename = '%s/%s_dailyinout.csv' % (outdir, self.local_data.savelabel)
@@ -339,6 +334,15 @@ class TransectTool:
 		start_time = time.time()
 		len_nodelist = len(self.local_data.nodelist)
 		segment_watermovers = None
+		fluxes = [None] * len_nodelist
+		results = None
+		spool = None
+		if self.local_data.workers > 1:
+			print('%s: started computing transect fluxes in %d processes' % (util.get_current_time(), self.local_data.workers))
+			(results, fluxes) = self.get_parallel_results(report_type.series_report in self.local_data.report_type_list)
+		elif self.local_data.kernel == 'sparse':
+			print('%s: started computing transect fluxes' % (util.get_current_time()))
+			(results, spool) = self.get_transect_results(report_type.series_report in self.local_data.report_type_list)
 		print('%s: started processing nodes' % (util.get_current_time()))
 		for i in range(len_nodelist):
 			message = 'node %s of %s' % (i+1, len_nodelist)
@@ -349,28 +353,23 @@ class TransectTool:
 				print("%s: %s, last node took %f seconds, projected finish: %s" % (util.get_current_time(current_time), message, delta_time, util.get_current_time(projected_end_time)))
 			else:
 				print("%s: %s" % (util.get_current_time(current_time), message))
-			data[i] = {'nodelist': self.local_data.nodelist[i], 'months': {}, 'years': {}}
-			if report_type.seasonal_average_report in self.local_data.report_type_list or \
-				report_type.seasonal_totals_report in self.local_data.report_type_list:
-				data[i]['seasonal'] = {'ranges': self.get_seasonal_data(seasonal_data), 'values': {'years':{}, 'ranges':{}}}
+			nodelist = self.local_data.nodelist[i]
 			outputfile.write('                               ')
 			outputfile.write('_________________________________________________________')
-			outputfile.write( 'The list of nodes is = [%s]' % (' '.join(['%i'%node for node in data[i]['nodelist']['node']])))
-			if len(self.nc.coordinates.keys()) != 0:
-				total_distance = 0
+			outputfile.write( 'The list of nodes is = [%s]' % (' '.join(['%i'%node for node in nodelist['node']])))
+			if len(self.nc.coordinates) != 0:
+				(wall_distances, total_distance) = ProcessData.get_wall_distances(self.nc, nodelist)
 				line = ''
-				for nodepair in data[i]['nodelist']['node_pair']:
-					distance = ProcessData.get_distance(self.nc, nodepair)
-					total_distance = total_distance + distance
+				for nodepair, distance in zip(nodelist['node_pair'], wall_distances):
 					if line:
 						line = line + " "
 					line = line + "Distance(%s %s)=%.0f," % (nodepair[0]+1, nodepair[1]+1, distance)
 				outputfile.write('%s Transect=%.0f' % (line, total_distance))
 			line = ''	
-			for nodepair in data[i]['nodelist']['node_pair']:
+			for nodepair in nodelist['node_pair']:
 					line += ('(%s)' % ' '.join(['%d'%node for node in nodepair]))
 			outputfile.write('Wall  [%s]' % line)
-			watermover_names = sorted(data[i]['nodelist']['watermover_names'].keys())
+			watermover_names = sorted(nodelist['watermover_names'].keys())
 			line = ''
 			for watermover_name in watermover_names:
 				line += '"%s" ' % watermover_name
@@ -380,17 +379,20 @@ class TransectTool:
 			outputfile.write('----               ,  ----           ,  --------------------,  --------------------,  --------------------') 
 			last_month = None
 			last_year = None
-			if True in [self.local_data.nodelist[i]['node_pair'][j] in self.local_data.segmentlist.keys() for j in range(len(nodelist[i]['node_pair']))]:
-				segment_watermovers = []
-				for j in range(len(self.local_data.nodelist[i]['node_pair'])):
-					if self.local_data.nodelist[i]['node_pair'][j] in self.local_data.segmentlist.keys():
-						for segment_watermover in self.local_data.segmentlist[self.local_data.nodelist[i]['node_pair'][j]]['watermovers']:
-							segment_watermovers.append(segment_watermover)
-				self.timestamp_loop(message, self.local_data.nodelist[i]['watermovers'], segment_watermovers, data[i], outputfile, print_count)
+			segment_watermovers = self.get_segment_watermovers(self.local_data.nodelist[i])
+			if results != None:
+				data[i] = results[i]
+				if spool != None:
+					spool.copy(i, outputfile)
+				elif fluxes[i] != None:
+					outputfile.write(self.format_rows(fluxes[i]))
 			else:
-				self.timestamp_loop(message, self.local_data.nodelist[i]['watermovers'], None, data[i], outputfile, print_count)
+				data[i] = self.timestamp_loop(message, nodelist, segment_watermovers, outputfile, print_count)
+			fluxes[i] = None
 			last_time = current_time
 		outputfile.close()
+		if spool != None:
+			spool.close()
 		print('%s: finished processing nodes' % (util.get_current_time()))
 		if report_type.daily_report in self.local_data.report_type_list:
 			print('%s: generating daily report' % (util.get_current_time()))
@@ -400,29 +402,29 @@ class TransectTool:
 			print('%s: generating monthly averages report' % (util.get_current_time()))
 			CSVOutput.print_monthly_averages_report(filename2a, self.nc, data, self.local_data.seepage_report_list)
 			files.append(filename2a)
-		if report_type.monthly_totals_report in report_type_button:
+		if report_type.monthly_totals_report in self.local_data.report_type_list:
 			print('%s: generating monthly totals report' % (util.get_current_time()))
-			CSVOutput.print_monthly_totals_report(filename2b, self.nc, data, seepage_report_button)
+			CSVOutput.print_monthly_totals_report(filename2b, self.nc, data, self.local_data.seepage_report_list)
 			files.append(filename2b)
-		if report_type.average_month_report in report_type_button:
+		if report_type.average_month_report in self.local_data.report_type_list:
 			print('%s: generating average month report' % (util.get_current_time()))
-			CSVOutput.print_average_month_report(filename2c, self.nc, data, seepage_report_button)
+			CSVOutput.print_average_month_report(filename2c, self.nc, data, self.local_data.seepage_report_list)
 			files.append(filename2c)
-		if report_type.yearly_averages_report in report_type_button:
+		if report_type.yearly_averages_report in self.local_data.report_type_list:
 			print('%s: generating yearly averages report' % (util.get_current_time()))
-			CSVOutput.print_yearly_averages_report(filename3a, self.nc, data, seepage_report_button)
+			CSVOutput.print_yearly_averages_report(filename3a, self.nc, data, self.local_data.seepage_report_list)
 			files.append(filename3a)
-		if report_type.yearly_totals_report in report_type_button:
+		if report_type.yearly_totals_report in self.local_data.report_type_list:
 			print('%s: generating yearly totals report' % (util.get_current_time()))
-			CSVOutput.print_yearly_totals_report(filename3b, self.nc, data, seepage_report_button)
+			CSVOutput.print_yearly_totals_report(filename3b, self.nc, data, self.local_data.seepage_report_list)
 			files.append(filename3b)
-		if report_type.seasonal_average_report in report_type_button:
+		if report_type.seasonal_average_report in self.local_data.report_type_list:
 			print('%s: generating seasonal average report' % (util.get_current_time()))
-			CSVOutput.print_seasonal_average_report(filename4a, self.nc, data, seepage_report_button)
+			CSVOutput.print_seasonal_average_report(filename4a, self.nc, data, self.local_data.seepage_report_list)
 			files.append(filename4a)
-		if report_type.seasonal_totals_report in report_type_button:
+		if report_type.seasonal_totals_report in self.local_data.report_type_list:
 			print('%s: generating seasonal totals report' % (util.get_current_time()))
-			CSVOutput.print_seasonal_totals_report(filename4b, self.nc, data, seepage_report_button)
+			CSVOutput.print_seasonal_totals_report(filename4b, self.nc, data, self.local_data.seepage_report_list)
 			files.append(filename4b)
 		end_time = time.time()
 		print('%s: finished generating reports, total processing time %s' % (util.get_current_time(), util.get_total_time(end_time-start_time)))
@@ -436,13 +438,71 @@ class TransectTool:
 
 
 
+def load_alternative(alternative):
+	tool = TransectTool(alternative['local_data'])
+	tool.load()
+	return tool
+
+def process_alternative(alternative, tool=None):
+	'''
+	Writes the reports of one alternative (a wbbudget file of a transect
+	group) and returns its Continuity and Timing results, None for those not
+	requested. alternative holds the LocalData of the run and the targets;
+	tool is its TransectTool when it was loaded ahead.
+	'''
+	gc.collect()
+	wbbudget_name = alternative['name']
+	label = alternative['label']
+	local_data = alternative['local_data']
+	print("Model Run : %s" % wbbudget_name)
+	if tool == None:
+		tool = TransectTool(local_data)
+	tool.main()
+	result = {'continuity': None, 'timing': None}
+	if alternative['continuity']:
+		continuity_run_data= dict()
+		print("Processing Continuity")
+		list_data = Transect_Continuity_Process.process(tool.nc, tool.data)
+		main_data_dic = dict()
+		for data in list_data:
+			data_pd  = Transect_Continuity_Process.proccess_continuity(data,'TOTAL (FT^3)')
+			main_data_dic.update(data_pd)
+		alt_data = Transect_Continuity_Process.build_alt_data_cov(main_data_dic, alternative['parent_subt_names'], alternative['child_subt_names'])
+		continuity_run_data["runname"] = wbbudget_name
+		deviation_sum, deviation_ave, record_count = Transect_Continuity_Process.calculate_sum_of_differences(alternative['target_data'], alt_data)
+		print("%s deviation_sum : %d" % (wbbudget_name, deviation_sum))
+		continuity_run_data["data"] = alt_data
+		continuity_run_data["deviation_sum"]  = deviation_sum
+		continuity_run_data["deviation_ave"]  = deviation_ave
+		continuity_run_data["deviation_count"]  = record_count
+		continuity_run_data["index_score"]  = COV_THRESHOLD - deviation_ave
+		continuity_run_data["parent_subt_names"] = alternative['parent_subt_names']
+		result['continuity'] = continuity_run_data
+	if alternative['distribution']:
+		print("Processing Distribution")
+	if alternative['timing']:
+		print("Timing")
+		result['timing'] = list()
+		list_data = Transect_Timing_Process.process(tool.nc, tool.data)
+		for data2 in list_data:
+			deviation_data = Transect_Timing_Process.create_timing_data(alternative['target'], data2)
+			print_data, boxplot_data = Transect_Timing_Process.process_data_pdf_report(deviation_data)
+			report_name = "%s/%s_report.txt" % (local_data.savedir, label)
+			CSVOutput.print_timing_report(report_name, alternative['run_name'], wbbudget_name, print_data)
+			plot_filename = '%s/%s_timing.pdf' % (local_data.savedir, label)
+			plot_timing = PMG_Transect_Timing(wbbudget_name, alternative['run_name'], boxplot_data, plot_filename , label)
+			plot_timing.plot_timing_boxplot()
+			result['timing'].append(print_data)
+	del tool
+	return result
+
 if __name__ == "__main__":
 	if len(sys.argv) > 1:
 		class PMG_IO:
 			pass
 		import argparse
 		program_name = os.path.splitext(os.path.basename(sys.argv[0]))[0]
-		usage_string = '''%s [wbbudget netCDF file] [mesh node ID file] -2nsatdmMyYolf
+		usage_string = '''%s [wbbudget netCDF file] [mesh node ID file] -2nsatdmMyYolckf
 
 EXAMPLE: %s wbbudget.nc meshnodes.txt -l ALT5 -s -d''' % (program_name, program_name)
 		description = '''The Transect Tool provides a means to calculate flows across a transect using 
@@ -527,12 +587,73 @@ EXAMPLE: %s wbbudget.nc meshnodes.txt -l ALT5 -s -d''' % (program_name, program_
 						action='store',
 						default='',
 						help='This option forces the output files to have their file names preceded with the passed in label name.')
+		parser.add_argument('-c', '--chunk_length',
+						action='store',
+						type=int,
+						default=0,
+						help='Stream the watermover volumes in windows of this many timesteps instead of reading the whole run. '
+							+'Peak memory is then bounded by the window length.')
+		parser.add_argument('-k', '--kernel',
+						action='store',
+						choices=KERNELS,
+						default=DEFAULT_KERNEL,
+						help='Kernel summing the watermover volumes of each transect: numpy gathers whole volume columns, '
+							+'python is the original per-timestep loop and sparse computes every transect at once from a '
+							+'signed incidence matrix in one pass over the volumes, so --chunk_length reads the file once rather than '
+							+'once per transect. numba runs the per-timestep loop compiled '
+							+'with numba, which must be installed. All give the same volumes.')
+		parser.add_argument('--workers',
+						action='store',
+						type=int,
+						default=1,
+						help='Compute the transect fluxes in this many processes, all reading one shared memory copy of '
+							+'the watermover volumes. Results are merged in transect order, so the reports do not change.')
+		parser.add_argument('--threads',
+						action='store',
+						type=int,
+						default=1,
+						help='Compute the daily, monthly, yearly and seasonal aggregates of each transect in this many '
+							+'threads, each reducing a chunk of whole periods. The aggregates do not change.')
+		parser.add_argument('--alternatives',
+						action='store',
+						type=int,
+						default=1,
+						help='Process up to this many alternatives (run_paths_files) of a transect group at once in '
+							+'worker processes, fewer when their expected working sets do not fit in the available memory.')
+		parser.add_argument('--prefetch',
+						action='store',
+						type=int,
+						default=0,
+						help='Open the next alternatives and read their watermover volumes in a background thread, up to '
+							+'this many runs ahead of the one being reported (1 is double buffering). Not used with '
+							+'--chunk_length, --workers or --alternatives, whose runs read the netCDF files while computing.')
+		parser.add_argument('--accumulate',
+						action='store_true',
+						default=False,
+						help='Fold each window of volumes into running per-period statistics instead of keeping the '
+							+'daily series of every transect. Memory then grows with the number of periods; the reports '
+							+'agree with the default mode up to rounding.')
+		parser.add_argument('--cache_dir',
+						action='store',
+						default='',
+						help='Directory for the mesh topology cache. Defaults to $%s or ~/.cache/pmg_transect.' % CACHE_DIR_ENV)
+		parser.add_argument('--cache_size',
+						action='store',
+						type=int,
+						default=DEFAULT_SIZE_LIMIT // (1024 * 1024),
+						help='Size limit of the mesh topology cache in MB, least recently used entries are removed first.')
+		parser.add_argument('--no_cache',
+						action='store_true',
+						default=False,
+						help='Always parse the mesh topology from the netCDF file and do not write the cache.')
 		parser.add_argument('-f', '--force',
 						action='store_true',
 						default=False,
 						help='Force rewrite of existing files.  This flag is necessary if the output files already exists. NOTE: this attribute is no longer used.' 
 							+'It is included only to be backwards compatable.')
 		parser.parse_args(namespace = PMG_IO)
+		if PMG_IO.kernel == 'numba' and not NUMBA_AVAILABLE:
+			parser.error('--kernel numba needs numba, which is not installed')
 		
 		if PMG_IO.infile:	
 			report_type = ReportType()
@@ -559,14 +680,19 @@ EXAMPLE: %s wbbudget.nc meshnodes.txt -l ALT5 -s -d''' % (program_name, program_
 
 				if PMG_IO.outdirectory:
 					outdir = PMG_IO.outdirectory
-				import gc
 				input_type = "XML"
 				continuity_distribution = "Continuity"
 				username = getpass.getuser()
+				topology_cache = None
+				if not PMG_IO.no_cache:
+					topology_cache = TopologyCache(PMG_IO.cache_dir, PMG_IO.cache_size * 1024 * 1024)
 				pmg_data = PMG_Data.PMGMainData(PMG_IO.infile.name, input_type)
+				nodelists = dict((key, ProcessData.get_nodelist(value.nodes)) for key, value in pmg_data.data.items())
+				config_nodelist = [node for nodelist in nodelists.values() for node in nodelist]
 				for key, value in pmg_data.data.items():
 					transect_data = value
 					transect_group_data = dict()
+					(target, target_data_pd, parent_sub_transect_names, child_sub_transect_names) = (None, None, None, None)
 					transect_group_data["name"] = transect_data.run_name
 					c_outdir = outdir
 					if PMG_IO.Timing:
@@ -584,68 +710,52 @@ EXAMPLE: %s wbbudget.nc meshnodes.txt -l ALT5 -s -d''' % (program_name, program_
 							transect_group_data["COV_TYPE"] = continuity_distribution
 						except:
 							print("Please Review the Target")
-					nodelist = ProcessData.get_nodelist(transect_data.nodes)
+					nodelist = nodelists[key]
+					transect_report_types = list(report_type_button)
+					if transect_data.seasons:
+						for seasonal_report in [report_type.seasonal_average_report, report_type.seasonal_totals_report]:
+							if seasonal_report not in transect_report_types:
+								transect_report_types.append(seasonal_report)
 					segmentlist = dict()
 					if transect_data.segments:
 						segmentlist = ProcessData.get_segmentlist(transect_data.segments)
 						print(segmentlist)
 					alt_run_name = list()
+					alternatives = list()
 					for netCDF_path in transect_data.run_paths_files:
-						gc.collect()
 						wbbudget_name = netCDF_path["name"]
 						alt_run_name.append(wbbudget_name)
-						print("Model Run : %s" % wbbudget_name)
-						wbbudget_netcdf_path = netCDF_path["file_name"]
 						label = transect_data.run_name + "_" + wbbudget_name
-						local_data = LocalData(wbbudget_netcdf_path, nodelist,\
-							 seepage_report_button, report_type_button, outdir, label, segmentlist)
-						
-						tool = TransectTool(local_data)
+						local_data = LocalData(netCDF_path["file_name"], nodelist,\
+							 seepage_report_button, transect_report_types, outdir, label, segmentlist, PMG_IO.chunk_length, topology_cache, \
+							 PMG_IO.netcdf2, config_nodelist, PMG_IO.kernel, transect_data.seasons, PMG_IO.accumulate, PMG_IO.workers, PMG_IO.threads)
 						c_outdir = local_data.savedir
-						tool.main()
-						if PMG_IO.Continuity or PMG_IO.Distribution:
-							continuity_run_data= dict()
-							print("Processing Continuity")
-							list_data = Transect_Continuity_Process.process(tool.nc, tool.data)
-							main_data_dic = dict()
-							for data in list_data:
-								data_pd  = Transect_Continuity_Process.proccess_continuity(data,'TOTAL (FT^3)')
-			
-								main_data_dic.update(data_pd)
-							alt_data = Transect_Continuity_Process.build_alt_data_cov(main_data_dic, parent_sub_transect_names , child_sub_transect_names)
-						
-							continuity_run_data["runname"] = wbbudget_name
-							deviation_sum, deviation_ave, record_count = Transect_Continuity_Process.calculate_sum_of_differences(target_data_pd, alt_data)
-							print("%s deviation_sum : %d" % (wbbudget_name, deviation_sum))
-							continuity_run_data["data"] = alt_data
-							continuity_run_data["deviation_sum"]  = deviation_sum
-							continuity_run_data["deviation_ave"]  = deviation_ave
-							continuity_run_data["deviation_count"]  = record_count
-							continuity_run_data["index_score"]  = COV_THRESHOLD - deviation_ave
-							continuity_run_data["parent_subt_names"] = parent_sub_transect_names
-							transect_group_data[wbbudget_name] = continuity_run_data
-						if PMG_IO.Distribution:
-							print("Processing Distribution")
-						if PMG_IO.Timing:
-							print("Timing")
-							list_data = Transect_Timing_Process.process(tool.nc, tool.data)
-							for data2 in list_data:
-								#print(data2.nodes)
-								deviation_data = Transect_Timing_Process.create_timing_data(target, data2)
-								#print(deviation_data[1966])
-								print_data, boxplot_data = Transect_Timing_Process.process_data_pdf_report(deviation_data)
-								report_name = "%s/%s_report.txt" % (local_data.savedir, label)
-								CSVOutput.print_timing_report(report_name, transect_data.run_name, wbbudget_name, print_data)
-								plot_filename = '%s/%s_timing.pdf' % (local_data.savedir, label)
-								plot_timing = PMG_Transect_Timing(wbbudget_name, transect_data.run_name, boxplot_data, plot_filename , label)
-								plot_timing.plot_timing_boxplot()
-						#forcing a patch on a memory leak from orginal Transect Tool
-						for index in local_data.nodelist:
-							for key in index['watermovers'].keys():
-								index['watermovers'][key] = {'in':[], 'out':[]}
-
-						del local_data
-						del tool
+						alternatives.append({'name': wbbudget_name, 'label': label, 'run_name': transect_data.run_name, \
+							'local_data': local_data, 'timing': PMG_IO.Timing, 'continuity': PMG_IO.Continuity or PMG_IO.Distribution, \
+							'distribution': PMG_IO.Distribution, \
+							'target': target, 'target_data': target_data_pd, 'parent_subt_names': parent_sub_transect_names, \
+							'child_subt_names': child_sub_transect_names})
+					if PMG_IO.alternatives > 1 and len(alternatives) > 1:
+						scheduler = AlternativeScheduler(PMG_IO.alternatives)
+						jobs = [(alternative['name'], get_working_set(alternative['local_data'].netCDF_file, nodelist, segmentlist, \
+							PMG_IO.chunk_length), alternative) for alternative in alternatives]
+						print('%s: processing %d alternatives, at most %d at once within %.1f MB' % (util.get_current_time(), \
+							len(jobs), PMG_IO.alternatives, scheduler.memory_limit / (1024.0 * 1024.0)))
+						results = scheduler.run(process_alternative, jobs)
+					elif PMG_IO.prefetch > 0 and len(alternatives) > 1 and not PMG_IO.chunk_length and PMG_IO.workers <= 1:
+						results = list()
+						for alternative, tool in AlternativePipeline(alternatives, load_alternative, PMG_IO.prefetch):
+							results.append(process_alternative(alternative, tool))
+							del tool
+					else:
+						results = [process_alternative(alternative) for alternative in alternatives]
+					timing_run_data = dict()
+					for alternative, result in zip(alternatives, results):
+						if result['continuity'] != None:
+							transect_group_data[alternative['name']] = result['continuity']
+						if result['timing'] != None:
+							timing_run_data[alternative['name']] = result['timing']
+					transect_group_data["Timing_data"] = timing_run_data
 					if PMG_IO.Continuity or PMG_IO.Distribution:
 						print("Creating Continuity Reports")
 						transect_group_data["runames"] = alt_run_name
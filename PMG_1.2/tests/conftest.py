@@ -0,0 +1,121 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import netCDF4
+import pytest
+from PMGTransect_NETCDF import Transect_NetCDF
+from PMGTransect_Topology import MeshTopology
+
+EXTERNAL_CELL = 500000000
+CANAL_CELL = 300001
+
+def to_char_array(strings, length=40):
+	return np.array([string.ljust(length) for string in strings], 'S%d' % length).view('S1').reshape(len(strings), length)
+
+def get_mesh(nx, ny):
+	'''
+	A grid of nx x ny nodes cut into two triangles per square, with the
+	waterbody of each triangle.
+	'''
+	locations = np.array([[1000.0 * i + 3 * j, 900.0 * j + 2 * i] for j in range(ny) for i in range(nx)])
+	tricons = list()
+	for j in range(ny - 1):
+		for i in range(nx - 1):
+			(a, b, c, d) = (j * nx + i, j * nx + i + 1, (j + 1) * nx + i + 1, (j + 1) * nx + i)
+			tricons += [[a, b, c], [a, c, d]]
+	tricons = np.array(tricons)
+	return locations, tricons, np.arange(1, len(tricons) + 1) + 1000
+
+def get_watermovers(nx, tricons, waterbodymap, rng):
+	'''
+	(left, right, type) of the watermovers of a mesh: one or more movers
+	across each interior wall, a mover to or from an external cell across
+	each boundary wall, and levee seepage into three canal cells along the
+	walls of the second row of nodes, with several seepage movers on some
+	cells so that the last one counts.
+	'''
+	edges = dict()
+	for t, (a, b, c) in enumerate(tricons):
+		for edge in ((a, b), (b, c), (c, a)):
+			edges[edge] = t
+	watermovers = list()
+	for (u, v), t in edges.items():
+		if (v, u) in edges and u < v:
+			(left, right) = (waterbodymap[t], waterbodymap[edges[(v, u)]])
+			if rng.random() < 0.5:
+				(left, right) = (right, left)
+			watermovers.append((left, right, 'ManningCircle'))
+			if rng.random() < 0.4:
+				watermovers.append((right, left, 'DarcyCircle'))
+			if rng.random() < 0.1:
+				watermovers.append((left, right, 'LevSeepMarshToDryMover'))
+		elif (v, u) not in edges:
+			if rng.random() < 0.5:
+				watermovers.append((waterbodymap[t], EXTERNAL_CELL + t, 'DarcyCircle'))
+			else:
+				watermovers.append((EXTERNAL_CELL + t, waterbodymap[t], 'ManningCircle'))
+	for k, (u, v) in enumerate([(nx + 1, nx + 2), (nx + 2, nx + 3), (nx + 3, nx + 4)]):
+		(left, right) = (waterbodymap[edges[(u, v)]], waterbodymap[edges[(v, u)]])
+		watermovers.append((left, CANAL_CELL + k, 'LevSeepMarshToSegMover'))
+		watermovers.append((right, CANAL_CELL + k, 'LevSeepDryToSegMover'))
+		watermovers.append((right, CANAL_CELL + (k + 1) % 3, 'LevSeepDryToSegMover'))
+	watermovers.append((CANAL_CELL, CANAL_CELL + 1, 'ManningCircle'))
+	watermovers.append((CANAL_CELL + 1, CANAL_CELL + 2, 'ManningCircle'))
+	return [watermovers[i] for i in rng.permutation(len(watermovers))]
+
+def write_wbbudget(filename, nx=8, ny=6, timesteps=60, seed=0, base_time='1999-01-01 00:00:00'):
+	'''
+	Writes a small wbbudget file with the variables Transect_NetCDF reads and
+	returns its (left, right, type) watermovers.
+	'''
+	rng = np.random.default_rng(seed)
+	(locations, tricons, waterbodymap) = get_mesh(nx, ny)
+	watermovers = get_watermovers(nx, tricons, waterbodymap, rng)
+	water_budget_nc = netCDF4.Dataset(filename, 'w', format='NETCDF4_CLASSIC')
+	water_budget_nc.createDimension('nodes', nx * ny)
+	water_budget_nc.createDimension('two', 2)
+	water_budget_nc.createDimension('three', 3)
+	water_budget_nc.createDimension('triangles', len(tricons))
+	water_budget_nc.createDimension('watermovers', len(watermovers))
+	water_budget_nc.createDimension('strlen', 40)
+	water_budget_nc.createDimension('time', None)
+	water_budget_nc.createVariable('locations', 'f8', ('nodes', 'two'))[:] = locations
+	water_budget_nc.createVariable('meshNodeMap', 'i4', ('nodes', 'two'))[:] = \
+		np.stack([np.arange(1, nx * ny + 1), np.arange(nx * ny)], 1)
+	water_budget_nc.createVariable('tricons', 'i4', ('triangles', 'three'))[:] = tricons
+	water_budget_nc.createVariable('waterBodyMap', 'i4', ('triangles',))[:] = waterbodymap
+	water_budget_nc.createVariable('waterMoverMap', 'i4', ('watermovers', 'two'))[:] = \
+		np.array([[left, right] for left, right, _ in watermovers])
+	water_budget_nc.createVariable('waterMoverType', 'S1', ('watermovers', 'strlen'))[:] = \
+		to_char_array([watermover_type for _, _, watermover_type in watermovers])
+	water_budget_nc.createVariable('waterMoverName', 'S1', ('watermovers', 'strlen'))[:] = \
+		to_char_array(['wm_%d_%d' % (left, right) for left, right, _ in watermovers])
+	volume = water_budget_nc.createVariable('WaterMoverVolume', 'f4', ('time', 'watermovers'))
+	volume.units = 'ft^3'
+	volume[:] = rng.normal(0, 1000, size=(timesteps, len(watermovers))).astype(np.float32)
+	timestamps = water_budget_nc.createVariable('timestamps', 'f8', ('time',))
+	timestamps.units = 'days since %s' % base_time
+	timestamps[:] = np.arange(1, timesteps + 1)
+	water_budget_nc.close()
+	return watermovers
+
+@pytest.fixture
+def wbbudget(tmp_path):
+	filename = str(tmp_path / 'wbbudget.nc')
+	write_wbbudget(filename)
+	yield filename
+	MeshTopology.clear_shared()
+
+@pytest.fixture
+def topology(wbbudget):
+	'''
+	The arrays Transect_NetCDF.read_topology parses from the wbbudget file.
+	'''
+	transect_nc = Transect_NetCDF(wbbudget)
+	water_budget_nc = netCDF4.Dataset(wbbudget, 'r')
+	topology = transect_nc.read_topology(water_budget_nc)
+	water_budget_nc.close()
+	return topology
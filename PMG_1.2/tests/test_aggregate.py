@@ -0,0 +1,173 @@
+import numpy as np
+import pytest
+import PMGTransect_Aggregate
+from PMGTransect_Aggregate import PeriodAccumulator, PeriodAggregate, SeasonAccumulator, SeasonAggregate, segment_sums
+from PMGTransect_Calendar import CalendarIndex
+from PMGTransect_Flux import get_random_volumes
+
+PERIODS = ['daily', 'monthly', 'yearly', 'month_of_year']
+
+def get_calendar(days, start=0):
+	return CalendarIndex('1999-01-01', np.arange(start, start + days))
+
+def get_volumes(days, types, seed):
+	volumes = get_random_volumes((days, types), seed).astype(np.float64)
+	volumes[::7, 0] = 0.0
+	return volumes
+
+def assert_same_aggregates(aggregate, expected):
+	assert len(aggregate) == len(expected)
+	for name in ['totals', 'sums', 'means', 'all_totals', 'all_means']:
+		assert getattr(aggregate, name).tobytes() == getattr(expected, name).tobytes()
+
+@pytest.mark.parametrize('period', PERIODS)
+@pytest.mark.parametrize('threads', [2, 3, 8])
+def test_threaded_aggregates_match_one_thread(monkeypatch, period, threads):
+	monkeypatch.setattr(PMGTransect_Aggregate, 'MIN_SPLIT_TIMESTEPS', 16)
+	calendar = get_calendar(1500)
+	volumes = get_volumes(1500, 3, 0)
+	periods = calendar.get_periods(period)
+	aggregate = PeriodAggregate(periods, volumes, threads)
+	assert len(aggregate.get_splits(threads)) > 1
+	assert_same_aggregates(aggregate, PeriodAggregate(periods, volumes))
+
+@pytest.mark.parametrize('threads', [1, 4])
+def test_threaded_season_matches_one_thread(monkeypatch, threads):
+	monkeypatch.setattr(PMGTransect_Aggregate, 'MIN_SPLIT_TIMESTEPS', 16)
+	calendar = get_calendar(3000)
+	volumes = get_volumes(3000, 2, 1)
+	season = calendar.get_season((11, 15, 2, 10))
+	aggregate = SeasonAggregate(season, volumes, threads)
+	expected = SeasonAggregate(season, volumes)
+	assert_same_aggregates(aggregate.yearly, expected.yearly)
+	assert_same_aggregates(aggregate.season, expected.season)
+
+def test_splits_cover_whole_periods(monkeypatch):
+	monkeypatch.setattr(PMGTransect_Aggregate, 'MIN_SPLIT_TIMESTEPS', 100)
+	periods = get_calendar(1000).get_periods('monthly')
+	splits = PeriodAggregate(periods, get_volumes(1000, 1, 2), 4).get_splits(4)
+	assert splits[0][0] == 0 and splits[-1][1] == len(periods)
+	assert all([last == first for (f, last), (first, l) in zip(splits[:-1], splits[1:])])
+	assert 1 < len(splits) <= 4
+	# no more splits than MIN_SPLIT_TIMESTEPS allows
+	assert len(PeriodAggregate(periods, get_volumes(1000, 1, 2), 20).get_splits(20)) <= 10
+	monkeypatch.setattr(PMGTransect_Aggregate, 'MIN_SPLIT_TIMESTEPS', 4096)
+	assert PeriodAggregate(periods, get_volumes(1000, 1, 2), 4).get_splits(4) == [(0, len(periods))]
+
+def test_totals_are_the_time_order_sums_of_bincount():
+	calendar = get_calendar(800)
+	volumes = get_volumes(800, 2, 3)
+	volumes[:40, 1] = -0.0
+	for period in PERIODS:
+		periods = calendar.get_periods(period)
+		aggregate = PeriodAggregate(periods, volumes)
+		for j in range(2):
+			expected = np.bincount(periods.codes, weights=volumes[:, j], minlength=len(periods))
+			assert aggregate.totals[:, j].tobytes() == expected.tobytes()
+
+def test_segment_sums_are_the_sums_np_sum_gives():
+	rng = np.random.default_rng(4)
+	counts = rng.integers(0, 40, 300)
+	counts[::9] = 0
+	counts[5] = 600
+	starts = np.cumsum(counts) - counts
+	values = get_random_volumes(int(counts.sum()), 4).astype(np.float64)
+	sums = segment_sums(values, starts, counts)
+	expected = np.array([np.sum(values[start:start + count]) for start, count in zip(starts, counts)])
+	assert sums.tobytes() == expected.tobytes()
+	assert segment_sums(values, starts[:0], counts[:0]).tolist() == []
+
+@pytest.mark.parametrize('period', PERIODS)
+def test_aggregates_match_numpy(period):
+	calendar = get_calendar(1200, 30)
+	volumes = get_volumes(1200, 3, 5)
+	periods = calendar.get_periods(period)
+	aggregate = PeriodAggregate(periods, volumes)
+	assert len(aggregate) == len(periods)
+	for p in range(len(periods)):
+		period_volumes = volumes[periods.codes == p]
+		for j in range(3):
+			column = np.ascontiguousarray(period_volumes[:, j])
+			assert aggregate.sums[p, j] == np.sum(column)
+			assert aggregate.means[p, j] == np.mean(column)
+		assert aggregate.all_totals[p] == np.sum(period_volumes)
+		assert aggregate.all_means[p] == np.mean(period_volumes)
+		assert np.allclose(aggregate.totals[p], aggregate.sums[p], rtol=1e-12, atol=1e-6)
+
+def test_aggregate_of_no_types():
+	periods = get_calendar(100).get_periods('monthly')
+	aggregate = PeriodAggregate(periods, np.zeros((100, 0)))
+	assert len(aggregate) == 0
+	assert aggregate.totals.shape == (len(periods), 0)
+
+def test_aggregate_arrays_round_trip():
+	periods = get_calendar(400).get_periods('monthly')
+	aggregate = PeriodAggregate(periods, get_volumes(400, 2, 6))
+	assert_same_aggregates(PeriodAggregate.from_arrays(periods, aggregate.to_arrays()), aggregate)
+
+def accumulate(accumulator, volumes, chunk_lengths):
+	start = 0
+	for chunk_length in chunk_lengths:
+		accumulator.add(start, volumes[start:start + chunk_length])
+		start += chunk_length
+	accumulator.add(start, volumes[start:])
+	return accumulator
+
+def get_offset_volumes(days, seed):
+	'''
+	Volumes of three types, the last far from zero, which the textbook
+	variance formula (the mean of the squares less the square of the mean)
+	would lose to cancellation.
+	'''
+	rng = np.random.default_rng(seed)
+	volumes = rng.normal(0, 1000, (days, 3))
+	volumes[:, 1] = rng.normal(0, 1e-3, days)
+	volumes[:, 2] += 1e7
+	return volumes
+
+@pytest.mark.parametrize('period', PERIODS)
+def test_accumulator_matches_numpy(period):
+	calendar = get_calendar(1200, 40)
+	volumes = get_offset_volumes(1200, 7)
+	periods = calendar.get_periods(period)
+	accumulator = accumulate(PeriodAccumulator(periods, 3, 1200), volumes, [1, 37, 100, 400])
+	assert len(accumulator) == len(periods)
+	assert accumulator.counts.tolist() == periods.counts.tolist()
+	for p in range(len(periods)):
+		period_volumes = volumes[periods.codes == p]
+		assert np.allclose(accumulator.totals[p], np.sum(period_volumes, axis=0), rtol=1e-12)
+		assert np.allclose(accumulator.means[p], np.mean(period_volumes, axis=0), rtol=1e-12)
+		assert accumulator.mins[p].tolist() == np.min(period_volumes, axis=0).tolist()
+		assert accumulator.maxs[p].tolist() == np.max(period_volumes, axis=0).tolist()
+		assert np.allclose(accumulator.get_variances()[p], np.var(period_volumes, axis=0), rtol=1e-8, atol=1e-20)
+		if len(period_volumes) > 1:
+			assert np.allclose(accumulator.get_variances(1)[p], np.var(period_volumes, axis=0, ddof=1), rtol=1e-8, atol=1e-20)
+		else:
+			assert np.isnan(accumulator.get_variances(1)[p]).all()
+		assert np.allclose(accumulator.all_totals[p], np.sum(period_volumes), rtol=1e-12)
+		assert np.allclose(accumulator.all_means[p], np.mean(period_volumes), rtol=1e-12)
+
+def test_accumulator_chunks_do_not_matter():
+	periods = get_calendar(900).get_periods('monthly')
+	volumes = get_offset_volumes(900, 8)
+	whole = accumulate(PeriodAccumulator(periods, 3, 900), volumes, [])
+	for chunk_lengths in [[1] * 899, [30] * 29, [450]]:
+		accumulator = accumulate(PeriodAccumulator(periods, 3, 900), volumes, chunk_lengths)
+		assert np.allclose(accumulator.totals, whole.totals, rtol=1e-12)
+		assert np.allclose(accumulator.means, whole.means, rtol=1e-12)
+		assert np.allclose(accumulator.get_variances(), whole.get_variances(), rtol=1e-8)
+		assert accumulator.mins.tolist() == whole.mins.tolist()
+		assert accumulator.maxs.tolist() == whole.maxs.tolist()
+
+def test_season_accumulator_matches_season_aggregate():
+	calendar = get_calendar(2000)
+	volumes = get_offset_volumes(2000, 9)
+	season = calendar.get_season((11, 15, 2, 10))
+	accumulator = accumulate(SeasonAccumulator(season, 3, 2000), volumes, [100] * 19)
+	aggregate = SeasonAggregate(season, volumes)
+	for accumulated, expected in [(accumulator.yearly, aggregate.yearly), (accumulator.season, aggregate.season)]:
+		assert accumulated.counts.tolist() == expected.counts.tolist()
+		for name in ['totals', 'sums', 'means', 'all_totals', 'all_means']:
+			assert np.allclose(getattr(accumulated, name), getattr(expected, name), rtol=1e-12)
+	in_season = volumes[season.timesteps]
+	assert np.allclose(accumulator.season.get_variances()[0], np.var(in_season, axis=0), rtol=1e-8)
@@ -0,0 +1,85 @@
+import os
+import shutil
+import numpy as np
+import PMGTransect_Cache
+from conftest import write_wbbudget
+from PMGTransect_Cache import TopologyCache
+from PMGTransect_NETCDF import Transect_NetCDF
+from PMGTransect_Topology import MeshTopology
+
+def assert_same_topology(topology, expected):
+	assert sorted(topology.keys()) == sorted(expected.keys())
+	for name in expected:
+		assert topology[name].dtype == expected[name].dtype
+		assert np.array_equal(topology[name], expected[name])
+
+def test_cache_round_trip(tmp_path, wbbudget, topology):
+	cache = TopologyCache(str(tmp_path / 'cache'))
+	assert cache.load(wbbudget) == None
+	cache.save(wbbudget, topology)
+	assert os.listdir(str(tmp_path / 'cache')) == [os.path.basename(cache.get_path(wbbudget))]
+	assert_same_topology(cache.load(wbbudget), topology)
+
+def test_cache_directory_from_environment(tmp_path, monkeypatch):
+	monkeypatch.setenv(PMGTransect_Cache.CACHE_DIR_ENV, str(tmp_path))
+	assert TopologyCache().cache_dir == str(tmp_path)
+	assert TopologyCache(str(tmp_path / 'other')).cache_dir == str(tmp_path / 'other')
+
+def test_fingerprint(tmp_path, wbbudget):
+	fingerprint = TopologyCache.get_fingerprint(wbbudget)
+	copy = str(tmp_path / 'copy.nc')
+	shutil.copy2(wbbudget, copy)
+	assert TopologyCache.get_fingerprint(copy) == fingerprint
+	stat = os.stat(wbbudget)
+	os.utime(wbbudget, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))
+	assert TopologyCache.get_fingerprint(wbbudget) != fingerprint
+	# same size and mtime, different header
+	with open(copy, 'r+b') as netcdf_file:
+		netcdf_file.seek(1000)
+		byte = netcdf_file.read(1)
+		netcdf_file.seek(1000)
+		netcdf_file.write(bytes([byte[0] ^ 1]))
+	os.utime(copy, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+	assert os.stat(copy).st_size == stat.st_size
+	assert TopologyCache.get_fingerprint(copy) != fingerprint
+
+def test_stale_entry_is_discarded(tmp_path, wbbudget, topology):
+	cache = TopologyCache(str(tmp_path / 'cache'))
+	cache.save(wbbudget, topology)
+	write_wbbudget(wbbudget, nx=5, ny=5)
+	assert cache.load(wbbudget) == None
+	assert not os.path.exists(cache.get_path(wbbudget))
+
+def test_unreadable_entry(tmp_path, wbbudget):
+	cache = TopologyCache(str(tmp_path / 'cache'))
+	os.makedirs(cache.cache_dir)
+	with open(cache.get_path(wbbudget), 'wb') as entry:
+		entry.write(b'not an npz file')
+	assert cache.load(wbbudget) == None
+
+def test_least_recently_used_entries_are_evicted(tmp_path, topology):
+	filenames = [str(tmp_path / ('wbbudget_%d.nc' % i)) for i in range(3)]
+	for filename in filenames:
+		write_wbbudget(filename)
+	cache = TopologyCache(str(tmp_path / 'cache'))
+	cache.save(filenames[0], topology)
+	entry_size = os.path.getsize(cache.get_path(filenames[0]))
+	cache.size_limit = 2 * entry_size + entry_size // 2
+	cache.save(filenames[1], topology)
+	os.utime(cache.get_path(filenames[0]), (1000, 1000))
+	os.utime(cache.get_path(filenames[1]), (2000, 2000))
+	# loading the older entry makes it the most recently used
+	assert cache.load(filenames[0]) != None
+	cache.save(filenames[2], topology)
+	assert os.path.exists(cache.get_path(filenames[0]))
+	assert not os.path.exists(cache.get_path(filenames[1]))
+	assert os.path.exists(cache.get_path(filenames[2]))
+
+def test_netcdf_reads_topology_through_cache(tmp_path, wbbudget, topology):
+	cache = TopologyCache(str(tmp_path / 'cache'))
+	first = Transect_NetCDF(wbbudget, cache).topology
+	assert os.path.exists(cache.get_path(wbbudget))
+	MeshTopology.clear_shared()
+	second = Transect_NetCDF(wbbudget, cache).topology
+	assert second is not first
+	assert second.mesh_identity == first.mesh_identity == MeshTopology.get_mesh_identity(topology)
@@ -0,0 +1,122 @@
+import datetime
+import numpy as np
+import pytest
+from PMGTransect_Calendar import CalendarIndex, SeasonIndex
+
+BASE_TIME = datetime.datetime(1999, 1, 1)
+
+def get_timestamps(seed, days=1500):
+	'''
+	Increasing day offsets with gaps and fractions, from before the base time
+	to past the 2000 leap day.
+	'''
+	rng = np.random.default_rng(seed)
+	return np.cumsum(rng.integers(0, 4, days)) - 40 + rng.random(days) * 0.99
+
+def get_dates(timestamps):
+	return [BASE_TIME + datetime.timedelta(days=int(np.trunc(timestamp))) for timestamp in timestamps]
+
+def get_period_key(date, period):
+	return {'daily': date.year * 10000 + date.month * 100 + date.day, 'monthly': date.year * 100 + date.month, \
+		'yearly': date.year, 'month_of_year': date.month}[period]
+
+def test_calendar_dates():
+	timestamps = get_timestamps(0)
+	calendar = CalendarIndex(BASE_TIME, timestamps)
+	dates = get_dates(timestamps)
+	assert len(calendar) == len(dates)
+	assert calendar.years.tolist() == [date.year for date in dates]
+	assert calendar.months.tolist() == [date.month for date in dates]
+	assert calendar.days.tolist() == [date.day for date in dates]
+	assert calendar.days_of_year.tolist() == [date.timetuple().tm_yday for date in dates]
+	assert (2000, 2, 29) in zip(calendar.years.tolist(), calendar.months.tolist(), calendar.days.tolist())
+	for t in [0, 100, len(dates) - 1]:
+		assert calendar.get_datetime(t) == dates[t]
+		assert calendar.format(t, '%m/%d/%Y %H:%M:%S') == dates[t].strftime('%m/%d/%Y %H:%M:%S')
+
+@pytest.mark.parametrize('period', ['daily', 'monthly', 'yearly', 'month_of_year'])
+def test_periods(period):
+	timestamps = get_timestamps(1)
+	calendar = CalendarIndex(BASE_TIME, timestamps)
+	periods = calendar.get_periods(period)
+	assert calendar.get_periods(period) is periods
+	period_keys = [get_period_key(date, period) for date in get_dates(timestamps)]
+	keys = sorted(set(period_keys))
+	assert periods.keys == keys
+	assert len(periods) == len(keys)
+	assert periods.codes.tolist() == [keys.index(key) for key in period_keys]
+	assert periods.counts.tolist() == [period_keys.count(key) for key in keys]
+	expected_order = [t for key in keys for t in range(len(period_keys)) if period_keys[t] == key]
+	assert periods.order.tolist() == expected_order
+	for p, key in enumerate(keys):
+		timesteps = periods.order[periods.starts[p]:periods.starts[p] + periods.counts[p]].tolist()
+		assert [period_keys[t] for t in timesteps] == [key] * periods.counts[p]
+		first = period_keys.index(key)
+		assert (periods.years[p], periods.months[p], periods.days[p]) == \
+			(calendar.years[first], calendar.months[first], calendar.days[first])
+
+def test_unknown_period():
+	with pytest.raises(ValueError):
+		CalendarIndex(BASE_TIME, np.arange(10)).get_periods('weekly')
+
+def get_range_year(date, date_range):
+	'''
+	The year a season running over the new year ends in, or the year of the
+	date for any other season.
+	'''
+	(month1, day1, month2, day2) = date_range
+	if (month1 > month2 or (month1 == month2 and day1 > day2)) and (date.month, date.day) >= (month1, day1):
+		return date.year + 1
+	return date.year
+
+@pytest.mark.parametrize('date_range', [(3, 1, 9, 30), (11, 15, 2, 10), (12, 1, 1, 31), (3, 5, 3, 20), (3, 20, 3, 5), \
+	(2, 29, 2, 29), (1, 1, 12, 31), (6, 10, 7, 5)])
+def test_seasons(date_range):
+	timestamps = get_timestamps(2)
+	calendar = CalendarIndex(BASE_TIME, timestamps)
+	season = calendar.get_season(date_range)
+	assert calendar.get_season(date_range) is season
+	assert season.date_range == date_range
+	dates = get_dates(timestamps)
+	inside = [SeasonIndex.in_range(date_range, date.month, date.day) for date in dates]
+	assert season.mask.tolist() == inside
+	assert season.timesteps.tolist() == [t for t in range(len(dates)) if inside[t]]
+	range_years = [get_range_year(date, date_range) for date in dates]
+	assert season.range_years.tolist() == range_years
+	years = sorted(set([range_years[t] for t in season.timesteps.tolist()]))
+	assert season.yearly.keys == years
+	assert season.yearly.counts.tolist() == [[range_years[t] for t in season.timesteps.tolist()].count(year) for year in years]
+	# codes and order refer to positions in season.timesteps
+	assert [range_years[t] for t in season.timesteps[season.yearly.order].tolist()] == \
+		[year for year, count in zip(years, season.yearly.counts.tolist()) for i in range(count)]
+	assert season.season.counts.tolist() == [len(season.timesteps)]
+	if len(season.timesteps):
+		first = season.timesteps[0]
+		assert (season.yearly.years[0], season.yearly.months[0], season.yearly.days[0]) == \
+			(calendar.years[first], calendar.months[first], calendar.days[first])
+
+def test_season_in_range():
+	# over the new year
+	assert SeasonIndex.in_range((11, 15, 2, 10), 11, 15)
+	assert SeasonIndex.in_range((11, 15, 2, 10), 1, 31)
+	assert SeasonIndex.in_range((11, 15, 2, 10), 2, 10)
+	assert not SeasonIndex.in_range((11, 15, 2, 10), 11, 14)
+	assert not SeasonIndex.in_range((11, 15, 2, 10), 2, 11)
+	# within one month
+	assert SeasonIndex.in_range((3, 5, 3, 20), 3, 5)
+	assert SeasonIndex.in_range((3, 5, 3, 20), 3, 20)
+	assert not SeasonIndex.in_range((3, 5, 3, 20), 3, 21)
+	assert not SeasonIndex.in_range((3, 5, 3, 20), 4, 10)
+	# a reversed range within one month keeps only the days up to day2 of that month
+	assert SeasonIndex.in_range((3, 20, 3, 5), 3, 1)
+	assert not SeasonIndex.in_range((3, 20, 3, 5), 3, 25)
+	assert not SeasonIndex.in_range((3, 20, 3, 5), 4, 1)
+
+def test_season_over_the_new_year():
+	# 1999-11-20, 2000-02-01 and 2000-11-20
+	calendar = CalendarIndex(BASE_TIME, [323, 396, 689])
+	season = calendar.get_season((11, 15, 2, 10))
+	assert season.range_years.tolist() == [2000, 2000, 2001]
+	assert season.yearly.keys == [2000, 2001]
+	assert season.yearly.counts.tolist() == [2, 1]
+	assert (season.yearly.years[0], season.yearly.months[0], season.yearly.days[0]) == (1999, 11, 20)
@@ -0,0 +1,108 @@
+import numpy as np
+import pytest
+import PMGTransect_Flux
+from PMGTransect_Flux import TransectFlux, TransectIncidence, KERNELS, NUMBA_AVAILABLE, get_kernel_fluxes, get_random_transects, get_random_volumes, same_volumes
+from PMGTransect_NETCDF import WaterMoverVolumeBlock
+from PMGTransect_Output import ReportType
+
+report_type = ReportType()
+AVAILABLE_KERNELS = [kernel for kernel in KERNELS if kernel != 'numba' or NUMBA_AVAILABLE]
+
+def get_volume_block(timesteps, watermovers, seed, start=0):
+	return WaterMoverVolumeBlock(np.arange(watermovers, dtype=np.int64), get_random_volumes((timesteps, watermovers), seed), start)
+
+def get_small_transects():
+	'''
+	Two transects over six watermovers: one with a ManningCircle that takes
+	segment movers and a type without movers, one sharing watermovers with
+	the first.
+	'''
+	first = {report_type.darcy_circle: {'in': [0, 2], 'out': [1]}, \
+		report_type.manning_circle: {'in': [3], 'out': [4, 5]}, \
+		report_type.marsh_to_dry: {'in': [], 'out': []}}
+	second = {report_type.darcy_circle: {'in': [1], 'out': [0, 2, 5]}}
+	return [(first, [5, 1]), (second, None)]
+
+def assert_same_fluxes(fluxes, expected):
+	assert len(fluxes) == len(expected)
+	for flux, expected_flux in zip(fluxes, expected):
+		assert flux.watermover_names == expected_flux.watermover_names
+		assert (flux.start, flux.stop) == (expected_flux.start, expected_flux.stop)
+		assert same_volumes(flux.in_volumes, expected_flux.in_volumes)
+		assert same_volumes(flux.out_volumes, expected_flux.out_volumes)
+		assert same_volumes(flux.volumes, expected_flux.volumes)
+		assert same_volumes(flux.total, expected_flux.total)
+
+def test_python_kernel_volumes():
+	volume_block = get_volume_block(5, 6, 0)
+	values = volume_block.values.astype(np.float64)
+	(first, second) = get_kernel_fluxes(volume_block, get_small_transects(), 'python')
+	assert first.watermover_names == sorted([report_type.darcy_circle, report_type.manning_circle, report_type.marsh_to_dry])
+	darcy = first.watermover_names.index(report_type.darcy_circle)
+	manning = first.watermover_names.index(report_type.manning_circle)
+	empty = first.watermover_names.index(report_type.marsh_to_dry)
+	assert np.allclose(first.in_volumes[:, darcy], values[:, 0] + values[:, 2])
+	assert np.allclose(first.volumes[:, darcy], values[:, 0] + values[:, 2] - values[:, 1])
+	assert np.allclose(first.out_volumes[:, manning], values[:, 4] + values[:, 5])
+	assert np.allclose(first.volumes[:, manning], values[:, 3] - values[:, 4] - values[:, 5] + values[:, 5] + values[:, 1])
+	assert not first.volumes[:, empty].any()
+	assert np.allclose(first.total, first.volumes.sum(axis=1))
+	assert np.allclose(second.volumes[:, 0], values[:, 1] - values[:, 0] - values[:, 2] - values[:, 5])
+
+@pytest.mark.parametrize('kernel', AVAILABLE_KERNELS)
+def test_kernels_match_python_on_small_incidence(kernel):
+	volume_block = get_volume_block(9, 6, 1)
+	transects = get_small_transects()
+	assert_same_fluxes(get_kernel_fluxes(volume_block, transects, kernel), get_kernel_fluxes(volume_block, transects, 'python'))
+
+@pytest.mark.parametrize('kernel', AVAILABLE_KERNELS)
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_kernels_match_python_on_random_transects(kernel, seed):
+	volume_block = get_volume_block(40, 60, seed)
+	transects = get_random_transects(volume_block.watermovers, 6, seed)
+	assert_same_fluxes(get_kernel_fluxes(volume_block, transects, kernel), get_kernel_fluxes(volume_block, transects, 'python'))
+
+@pytest.mark.parametrize('kernel', AVAILABLE_KERNELS)
+def test_kernels_on_a_window(kernel):
+	volume_block = get_volume_block(12, 30, 3, start=100)
+	transects = get_random_transects(volume_block.watermovers, 4, 3)
+	fluxes = get_kernel_fluxes(volume_block, transects, kernel)
+	assert all([(flux.start, flux.stop) == (100, 112) for flux in fluxes])
+	assert_same_fluxes(fluxes, get_kernel_fluxes(volume_block, transects, 'python'))
+
+@pytest.mark.parametrize('kernel', AVAILABLE_KERNELS)
+def test_kernels_give_positive_zero_for_zero_out_movers(kernel):
+	# the net row of the darcy circle has only out movers, both 0.0 at the
+	# first timestep: 0.0 - 0.0 - 0.0 is +0.0, which prints as 0.00000
+	volume_block = WaterMoverVolumeBlock(np.arange(3, dtype=np.int64), np.array([[0.0, 0.0, 1.0], [2.0, 0.0, 0.0]], dtype=np.float32))
+	transects = [({report_type.darcy_circle: {'in': [], 'out': [0, 1]}, report_type.manning_circle: {'in': [2], 'out': []}}, None)]
+	(flux,) = get_kernel_fluxes(volume_block, transects, kernel)
+	assert flux.volumes[0, 0] == 0.0 and not np.signbit(flux.volumes[0, 0])
+	assert not np.signbit(flux.total[0])
+	assert_same_fluxes([flux], get_kernel_fluxes(volume_block, transects, 'python'))
+
+def test_incidence_windows_match_whole_block():
+	volume_block = get_volume_block(23, 30, 4)
+	transects = get_random_transects(volume_block.watermovers, 5, 4)
+	incidence = TransectIncidence(transects)
+	whole = incidence.get_fluxes(volume_block)
+	windows = [incidence.get_fluxes(WaterMoverVolumeBlock(volume_block.watermovers, volume_block.values[start:start + 7], start)) \
+		for start in range(0, 23, 7)]
+	for i in range(len(transects)):
+		assert same_volumes(np.concatenate([window[i].volumes for window in windows]), whole[i].volumes)
+		assert same_volumes(np.concatenate([window[i].in_volumes for window in windows]), whole[i].in_volumes)
+		assert same_volumes(np.concatenate([window[i].out_volumes for window in windows]), whole[i].out_volumes)
+
+def test_incidence_rows():
+	incidence = TransectIncidence(get_small_transects())
+	# three rows (in, out, net) per type: three types, then one
+	assert incidence.rows == 3 * 3 + 3
+	assert incidence.first_rows == [0, 9]
+	assert incidence.watermovers.tolist() == [0, 1, 2, 3, 4, 5]
+
+def test_numba_kernel_needs_numba(monkeypatch):
+	monkeypatch.setattr(PMGTransect_Flux, 'NUMBA_AVAILABLE', False)
+	with pytest.raises(ValueError):
+		TransectFlux.get_kernel('numba')
+	with pytest.raises(ValueError):
+		get_kernel_fluxes(get_volume_block(3, 6, 0), get_small_transects(), 'numba')
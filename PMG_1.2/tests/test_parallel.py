@@ -0,0 +1,110 @@
+import numpy as np
+import pytest
+from multiprocessing import shared_memory
+from PMGTransect_Aggregate import TransectResult, get_accumulators
+from PMGTransect_Calendar import CalendarIndex
+from PMGTransect_Flux import TransectFlux, get_random_transects, get_random_volumes, same_volumes
+from PMGTransect_NETCDF import WaterMoverVolumeBlock
+from PMGTransect_Parallel import SharedVolume, TransectPool
+
+PERIODS = ['daily', 'monthly', 'yearly', 'month_of_year']
+SEASONS = [(11, 15, 2, 10), (4, 1, 9, 30)]
+
+def get_volume_chunks(watermovers, values, chunk_length, failed_chunk=None):
+	for i, start in enumerate(range(0, len(values), chunk_length)):
+		if i == failed_chunk:
+			raise OSError('volume read failed')
+		yield WaterMoverVolumeBlock(watermovers, values[start:start + chunk_length], start)
+
+@pytest.fixture
+def segments(monkeypatch):
+	'''
+	Records the names of the shared memory segments created.
+	'''
+	names = list()
+	SharedMemory = shared_memory.SharedMemory
+	class RecordedSharedMemory(SharedMemory):
+		def __init__(self, *args, **kwargs):
+			SharedMemory.__init__(self, *args, **kwargs)
+			names.append(self.name)
+	monkeypatch.setattr(shared_memory, 'SharedMemory', RecordedSharedMemory)
+	return names
+
+def assert_unlinked(name):
+	with pytest.raises(FileNotFoundError):
+		shared_memory.SharedMemory(name=name)
+
+def test_shared_volume(segments):
+	watermovers = np.array([2, 5, 9], dtype=np.int64)
+	values = get_random_volumes((50, 3), 0)
+	shared_volume = SharedVolume([9, 2, 5, 2], 50, np.float32, get_volume_chunks(watermovers, values, 16))
+	(memory, volume_block) = SharedVolume.attach(shared_volume.get_spec())
+	assert volume_block.watermovers.tolist() == [2, 5, 9]
+	assert (volume_block.start, volume_block.stop) == (0, 50)
+	assert same_volumes(volume_block.values, values)
+	del volume_block
+	memory.close()
+	shared_volume.close()
+	assert_unlinked(segments[0])
+
+@pytest.mark.parametrize('failed_chunk', [0, 2])
+def test_failed_fill_unlinks_shared_volume(segments, failed_chunk):
+	watermovers = np.arange(4, dtype=np.int64)
+	with pytest.raises(OSError):
+		SharedVolume(watermovers, 50, np.float32, get_volume_chunks(watermovers, get_random_volumes((50, 4), 1), 16, failed_chunk))
+	assert len(segments) == 1
+	assert_unlinked(segments[0])
+
+def get_serial_results(volume_block, transects, calendar, accumulate):
+	results = list()
+	for watermovers, segment_watermovers in transects:
+		flux = TransectFlux.compute(volume_block, watermovers, segment_watermovers)
+		if accumulate:
+			accumulators = get_accumulators(calendar, PERIODS, SEASONS, len(flux.watermover_names))
+			for accumulator in accumulators.values():
+				accumulator.add(flux.start, flux.volumes)
+			results.append((TransectResult(None, calendar, flux.watermover_names, None, SEASONS, accumulators), flux))
+		else:
+			results.append((TransectResult(None, calendar, flux.watermover_names, flux.volumes, SEASONS), flux))
+	return results
+
+def assert_same_statistics(aggregate, expected, names):
+	assert len(aggregate) == len(expected)
+	for name in names:
+		assert getattr(aggregate, name).tobytes() == getattr(expected, name).tobytes()
+
+@pytest.mark.parametrize('accumulate', [False, True])
+def test_pool_results_match_serial_results(accumulate):
+	watermovers = np.arange(40, dtype=np.int64)
+	values = get_random_volumes((800, 40), 2)
+	calendar = CalendarIndex('1999-01-01', np.arange(1, 801))
+	transects = get_random_transects(watermovers, 7, 3)
+	shared_volume = SharedVolume(watermovers, 800, np.float32, get_volume_chunks(watermovers, values, 300))
+	try:
+		pool = TransectPool(shared_volume, 2, calendar, PERIODS, SEASONS, accumulate, True)
+		transect_arrays = pool.map(transects, 'numpy')
+	finally:
+		shared_volume.close()
+	expected = get_serial_results(WaterMoverVolumeBlock(watermovers, values), transects, calendar, accumulate)
+	names = ['totals', 'sums', 'means', 'all_totals', 'all_means']
+	if accumulate:
+		names += ['counts', 'm2', 'mins', 'maxs']
+	for (arrays, flux), (expected_result, expected_flux) in zip(transect_arrays, expected):
+		assert same_volumes(flux.volumes, expected_flux.volumes)
+		result = TransectResult.from_arrays(None, calendar, flux.watermover_names, arrays, SEASONS, accumulate)
+		for period in PERIODS:
+			assert_same_statistics(result.get_aggregate(period), expected_result.get_aggregate(period), names)
+		for date_range in SEASONS:
+			assert_same_statistics(result.get_season(date_range).yearly, expected_result.get_season(date_range).yearly, names)
+			assert_same_statistics(result.get_season(date_range).season, expected_result.get_season(date_range).season, names)
+
+def test_pool_leaves_out_fluxes_without_series():
+	watermovers = np.arange(10, dtype=np.int64)
+	calendar = CalendarIndex('1999-01-01', np.arange(1, 101))
+	shared_volume = SharedVolume(watermovers, 100, np.float32, get_volume_chunks(watermovers, get_random_volumes((100, 10), 4), 100))
+	try:
+		transect_arrays = TransectPool(shared_volume, 2, calendar, ['monthly']).map(get_random_transects(watermovers, 3, 5), 'numpy')
+	finally:
+		shared_volume.close()
+	assert [flux for arrays, flux in transect_arrays] == [None, None, None]
+	assert [list(arrays.keys()) for arrays, flux in transect_arrays] == [['monthly']] * 3
@@ -0,0 +1,109 @@
+import re
+import time
+import netCDF4
+import pytest
+from PMG_TRANSECT_Main import LocalData, TransectTool
+from PMGTransect_Output import ProcessData
+from PMGTransect_Scheduler import AlternativePipeline, AlternativeScheduler, get_working_set
+
+def run_alternative(argument):
+	time.sleep(0.05)
+	return argument * argument
+
+def run_jobs(capsys, scheduler, working_sets):
+	jobs = [(name, working_set, i) for i, (name, working_set) in enumerate(working_sets)]
+	results = scheduler.run(run_alternative, jobs)
+	assert results == [i * i for i in range(len(jobs))]
+	return re.findall(r'(started|finished) (\w+)', capsys.readouterr().out)
+
+def test_waiting_alternatives_start_first_fit(capsys):
+	# b does not fit next to a, c and d do and start before it
+	events = run_jobs(capsys, AlternativeScheduler(4, 100), [('a', 60), ('b', 50), ('c', 30), ('d', 10)])
+	assert [name for event, name in events if event == 'started'] == ['a', 'c', 'd', 'b']
+	assert events[:3] == [('started', 'a'), ('started', 'c'), ('started', 'd')]
+
+def test_alternative_over_the_limit_runs_alone(capsys):
+	events = run_jobs(capsys, AlternativeScheduler(4, 100), [('a', 500), ('b', 10), ('c', 10)])
+	assert events[:2] == [('started', 'a'), ('finished', 'a')]
+	assert sorted(events[2:]) == [('finished', 'b'), ('finished', 'c'), ('started', 'b'), ('started', 'c')]
+
+def test_running_alternatives_are_limited_to_max_workers(capsys):
+	events = run_jobs(capsys, AlternativeScheduler(2, 1000), [('a', 1), ('b', 1), ('c', 1), ('d', 1)])
+	running = 0
+	for event, name in events:
+		running += 1 if event == 'started' else -1
+		assert running <= 2
+	assert [name for event, name in events if event == 'started'] == ['a', 'b', 'c', 'd']
+
+def test_working_set(wbbudget):
+	water_budget_nc = netCDF4.Dataset(wbbudget, 'r')
+	(timesteps, watermovers) = water_budget_nc.variables['WaterMoverVolume'].shape
+	water_budget_nc.close()
+	nodelist = ProcessData.get_nodelist([[1, 2, 3], [10, 11]])
+	# float32 volumes; the fixture mesh has 48 nodes and 70 triangles
+	itemsize = 4
+	topology_bytes = 2 * 8 * (70 * 3 + 70 + watermovers * 2 + 48 * 2 + 48 * 2)
+	series_bytes = 2 * 4 * 4 * timesteps * 8
+	# 3 walls select up to 12 watermovers
+	assert get_working_set(wbbudget, nodelist, {}) == 12 * timesteps * itemsize + series_bytes + topology_bytes
+	assert get_working_set(wbbudget, nodelist, {}, 25) == 12 * 25 * itemsize + series_bytes + topology_bytes
+	nodelist = ProcessData.get_nodelist([list(range(1, 49))])
+	assert get_working_set(wbbudget, nodelist, {}) == watermovers * timesteps * itemsize + 4 * 4 * timesteps * 8 + \
+		topology_bytes
+
+def wait_for(condition, timeout=5.0):
+	deadline = time.time() + timeout
+	while not condition() and time.time() < deadline:
+		time.sleep(0.01)
+	return condition()
+
+@pytest.mark.parametrize('depth', [1, 2])
+def test_pipeline_loads_ahead_in_order(depth):
+	loaded = list()
+	def load(alternative):
+		loaded.append(alternative)
+		return alternative * alternative
+	alternatives = list(range(6))
+	results = list()
+	for i, (alternative, result) in enumerate(AlternativePipeline(alternatives, load, depth)):
+		assert wait_for(lambda: len(loaded) == min(len(alternatives), i + depth + 1))
+		# the loader waits for this alternative to be processed before going further
+		time.sleep(0.05)
+		assert len(loaded) == min(len(alternatives), i + depth + 1)
+		results.append((alternative, result))
+	assert loaded == alternatives
+	assert results == [(alternative, alternative * alternative) for alternative in alternatives]
+
+def test_pipeline_raises_load_errors_in_order():
+	def load(alternative):
+		if alternative == 2:
+			raise OSError('unable to open alternative 2')
+		return alternative
+	processed = list()
+	with pytest.raises(OSError):
+		for alternative, result in AlternativePipeline([0, 1, 2, 3], load):
+			processed.append(result)
+	assert processed == [0, 1]
+
+def test_load_copies_shared_entries(wbbudget):
+	water_budget_nc = netCDF4.Dataset(wbbudget, 'r')
+	(left, right) = water_budget_nc.variables['waterMoverMap'][0].tolist()
+	water_budget_nc.close()
+	nodelist = ProcessData.get_nodelist([[10, 11, 12, 13], [1, 2, 10]])
+	segmentlist = {(9, 10): {'waterbody': (left, right)}}
+	tools = list()
+	for label in ['first', 'second']:
+		tool = TransectTool(LocalData(wbbudget, nodelist, [], [], None, label, segmentlist))
+		tool.load()
+		tools.append(tool)
+	assert [node['watermovers'] for node in nodelist] == [{}, {}]
+	assert segmentlist == {(9, 10): {'waterbody': (left, right)}}
+	(first, second) = tools
+	for i in range(len(nodelist)):
+		assert first.local_data.nodelist[i] is not nodelist[i]
+		assert first.local_data.nodelist[i] is not second.local_data.nodelist[i]
+		assert first.local_data.nodelist[i]['node_pair'] == nodelist[i]['node_pair']
+		assert first.local_data.nodelist[i]['watermovers'] == first.nc.topology.resolve_transect(nodelist[i])['watermovers']
+	assert first.local_data.nodelist[0]['watermovers'] != {}
+	assert first.local_data.segmentlist[(9, 10)]['watermovers'] == first.nc._watermovermap[(left, right)]
+	assert first.local_data.segmentlist[(9, 10)] is not second.local_data.segmentlist[(9, 10)]
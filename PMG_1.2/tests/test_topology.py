@@ -0,0 +1,178 @@
+import netCDF4
+import numpy as np
+import pytest
+from PMGTransect_Output import ProcessData
+from PMGTransect_Topology import MeshTopology, WaterMoverIndex, CANAL_MINIMUM, CANAL_MAXIMUM, EXTERNAL_CELL_ID_MINIMUM, \
+	PAIR_KEY_LIMIT
+
+SEEPAGE_TYPES = ['LevSeepMarshToSegMover', 'LevSeepDryToSegMover']
+
+def get_watermover_dicts(watermovermap):
+	'''
+	The waterMoverMap dictionaries as Transect_NetCDF used to build them, one
+	row at a time in file order.
+	'''
+	internal = dict()
+	external_left = dict()
+	external_right = dict()
+	for i, (left, right) in enumerate(watermovermap.tolist()):
+		if left >= EXTERNAL_CELL_ID_MINIMUM:
+			if right < EXTERNAL_CELL_ID_MINIMUM:
+				external_right.setdefault(right, []).append(i)
+		elif right >= EXTERNAL_CELL_ID_MINIMUM:
+			external_left.setdefault(left, []).append(i)
+		else:
+			internal.setdefault((left, right), []).append(i)
+	return internal, external_left, external_right
+
+def get_random_watermovermap(rows, seed):
+	rng = np.random.default_rng(seed)
+	cells = np.concatenate([rng.integers(0, 30, 20), EXTERNAL_CELL_ID_MINIMUM + rng.integers(0, 3, 4), [EXTERNAL_CELL_ID_MINIMUM - 1]])
+	return rng.choice(cells, size=(rows, 2)).astype(np.int64)
+
+def assert_same_index(index, expected):
+	assert len(index) == len(expected)
+	assert sorted(index.keys()) == sorted(expected.keys())
+	for key, watermovers in expected.items():
+		assert key in index
+		assert index[key] == watermovers
+
+@pytest.mark.parametrize('seed', range(5))
+def test_index_matches_dicts(seed):
+	watermovermap = get_random_watermovermap(400, seed)
+	for index, expected in zip(WaterMoverIndex.classify(watermovermap), get_watermover_dicts(watermovermap)):
+		assert_same_index(index, expected)
+
+def test_index_of_wbbudget_matches_dicts(wbbudget):
+	water_budget_nc = netCDF4.Dataset(wbbudget, 'r')
+	watermovermap = np.asarray(water_budget_nc.variables['waterMoverMap'][:], dtype=np.int64)
+	water_budget_nc.close()
+	expected = get_watermover_dicts(watermovermap)
+	assert all([len(index) for index in expected])
+	for index, expected_index in zip(WaterMoverIndex.classify(watermovermap), expected):
+		assert_same_index(index, expected_index)
+
+def test_index_misses():
+	(internal, external_left, external_right) = WaterMoverIndex.classify(np.array([[1, 2], [1, 2], [2, EXTERNAL_CELL_ID_MINIMUM]]))
+	assert internal[(1, 2)] == [0, 1]
+	assert external_left[2] == [2]
+	for key in [(2, 1), (1, 3), (-1, 2), (1, PAIR_KEY_LIMIT), None, 'a']:
+		assert key not in internal
+		assert internal.find(key) == -1
+	with pytest.raises(KeyError):
+		internal[(2, 1)]
+	assert 1 not in external_left
+	assert 3 not in external_left
+	assert len(external_right) == 0
+	assert external_right.keys() == []
+
+def test_index_arrays_round_trip():
+	watermovermap = get_random_watermovermap(200, 9)
+	arrays = dict()
+	for name, index in zip(['internal', 'left', 'right'], WaterMoverIndex.classify(watermovermap)):
+		arrays.update(index.to_arrays(name))
+	for name, paired, expected in zip(['internal', 'left', 'right'], [True, False, False], get_watermover_dicts(watermovermap)):
+		assert_same_index(WaterMoverIndex.from_arrays(arrays, name, paired), expected)
+
+def get_seepage_movers(watermovermap, watermovertypes):
+	'''
+	The (LevSeepMarshToSegMover, LevSeepDryToSegMover) of each cell as the
+	loop over the canal keys of the waterMoverMap dictionary settled them:
+	the last one in key order, then file order.
+	'''
+	seepage_movers = dict()
+	for (left, right), watermovers in get_watermover_dicts(watermovermap)[0].items():
+		if not ((left >= CANAL_MINIMUM and right <= CANAL_MAXIMUM) or (CANAL_MINIMUM <= right <= CANAL_MAXIMUM)):
+			continue
+		for k in watermovers:
+			if watermovertypes[k] in SEEPAGE_TYPES:
+				seepage_movers.setdefault(left, [None, None])[SEEPAGE_TYPES.index(watermovertypes[k])] = k
+	return seepage_movers
+
+def get_adjacent_watermovers(watermovermap, watermover):
+	(left, right) = watermover
+	return [key for key in get_watermover_dicts(watermovermap)[0].keys() if (left in key or right in key) and \
+		((key[0] >= CANAL_MINIMUM and key[1] <= CANAL_MAXIMUM) or (CANAL_MINIMUM <= key[1] <= CANAL_MAXIMUM))]
+
+def read_watermovers(wbbudget):
+	water_budget_nc = netCDF4.Dataset(wbbudget, 'r')
+	watermovermap = np.asarray(water_budget_nc.variables['waterMoverMap'][:], dtype=np.int64)
+	watermovertypes = [str(name).strip() for name in netCDF4.chartostring(water_budget_nc.variables['waterMoverType'][:])]
+	water_budget_nc.close()
+	return watermovermap, watermovertypes
+
+def test_seepage_table_keeps_the_last_mover(wbbudget, topology):
+	(watermovermap, watermovertypes) = read_watermovers(wbbudget)
+	expected = get_seepage_movers(watermovermap, watermovertypes)
+	mesh_topology = MeshTopology(topology)
+	# the fixture gives some cells two LevSeepDryToSegMovers into different canals
+	assert len(expected) > 3
+	for cell in set(watermovermap.ravel().tolist()):
+		assert mesh_topology.get_seepage_movers(cell) == tuple(expected.get(cell, [None, None]))
+
+def test_seepage_table_order(topology):
+	# cell 7 seeps into canals 300002 and 300001: the last LevSeepDryToSegMover in the file (2) is under the key
+	# seen first, so the one under the second key (1) is kept
+	watermovermap = np.array([[7, 300002], [7, 300001], [7, 300002], [8, 300001], [7, 300001]], dtype=np.int64)
+	watermovertypes = ['LevSeepDryToSegMover', 'LevSeepDryToSegMover', 'LevSeepDryToSegMover', 'LevSeepDryToSegMover', \
+		'LevSeepMarshToSegMover']
+	(internal, external_left, external_right) = WaterMoverIndex.classify(watermovermap)
+	(table, codes) = np.unique(watermovertypes, return_inverse=True)
+	topology = dict(topology)
+	for name, index in [('watermovermap', internal), ('external_cell_id_left', external_left), \
+		('external_cell_id_right', external_right)]:
+		topology.update(index.to_arrays(name))
+	topology.update({'watermovertype_codes': codes, 'watermovertype_table': table})
+	mesh_topology = MeshTopology(topology)
+	assert mesh_topology.get_seepage_movers(7) == (4, 1)
+	assert mesh_topology.get_seepage_movers(8) == (None, 3)
+	assert mesh_topology.get_seepage_movers(300001) == (None, None)
+	assert tuple(get_seepage_movers(watermovermap, watermovertypes)[7]) == (4, 1)
+
+def test_adjacent_watermovers(wbbudget, topology):
+	(watermovermap, watermovertypes) = read_watermovers(wbbudget)
+	mesh_topology = MeshTopology(topology)
+	for watermover in get_watermover_dicts(watermovermap)[0].keys():
+		assert mesh_topology.get_adjacent_watermovers(watermover) == sorted(get_adjacent_watermovers(watermovermap, watermover))
+
+def get_random_nodelist(seed, transects=30, nx=8, ny=6):
+	'''
+	Transects of up to eight steps between neighbouring nodes of the fixture
+	mesh (1 based), with some steps to nodes off the mesh or across it, and
+	the transect along the walls into the canals.
+	'''
+	rng = np.random.default_rng(seed)
+	nodes_list = [[nx + 2, nx + 3, nx + 4, nx + 5], [nx + 5, nx + 4, nx + 3, nx + 2]]
+	for n in range(transects):
+		(i, j) = (int(rng.integers(0, nx)), int(rng.integers(0, ny)))
+		nodes = [j * nx + i + 1]
+		for step in range(int(rng.integers(1, 9))):
+			(di, dj) = [(1, 0), (-1, 0), (0, 1), (0, -1), (1, 1), (-1, -1)][int(rng.integers(0, 6))]
+			(i, j) = (min(max(i + di, 0), nx - 1), min(max(j + dj, 0), ny - 1))
+			nodes.append(j * nx + i + 1)
+		if rng.random() < 0.2:
+			nodes.insert(int(rng.integers(0, len(nodes))), int(rng.choice([0, nx * ny + 5, nx * ny * 3])))
+		nodes_list.append(nodes)
+	return ProcessData.get_nodelist(nodes_list + nodes_list[:5])
+
+def test_batch_resolution_matches_one_node_at_a_time(topology):
+	nodelist = get_random_nodelist(0)
+	mesh_topology = MeshTopology(topology)
+	transects = mesh_topology.resolve_transects(nodelist[:10])
+	transects += mesh_topology.resolve_transects(nodelist[10:])
+	expected_topology = MeshTopology(topology)
+	for node, transect in zip(nodelist, transects):
+		expected = expected_topology.resolve_transect(node)
+		assert transect == expected
+		assert list(transect['watermovers'].keys()) == list(expected['watermovers'].keys())
+		assert list(transect['watermover_names'].keys()) == list(expected['watermover_names'].keys())
+	types = set([name for transect in transects for name in transect['watermovers'].keys()])
+	assert set(['ManningCircle', 'DarcyCircle', 'LevSeepMarshToSegMover']) <= types
+	assert any([distance == 0 for transect in transects for distance in transect['wall_distances']])
+
+def test_batch_resolution_is_remembered(topology):
+	nodelist = get_random_nodelist(1)
+	mesh_topology = MeshTopology(topology)
+	transects = mesh_topology.resolve_transects(nodelist)
+	assert all([first is second for first, second in zip(mesh_topology.resolve_transects(nodelist), transects)])
+	assert mesh_topology.resolve_transects([]) == []
@@ -0,0 +1,114 @@
+import os
+import netCDF4
+import numpy as np
+import pytest
+import PMGTransect_Store
+from conftest import write_wbbudget
+from PMGTransect_Flux import TransectIncidence
+from PMGTransect_NETCDF import Transect_NetCDF, WaterMoverStore, WaterMoverVolume, WaterMoverVolumeBlock, STORE_HEADER
+from PMGTransect_Output import ReportType
+
+report_type = ReportType()
+
+def get_block():
+	watermovers = np.array([3, 7, 8, 20], dtype=np.int64)
+	return WaterMoverVolumeBlock(watermovers, np.arange(12, dtype=np.float32).reshape(3, 4), 5)
+
+def test_block_columns():
+	block = get_block()
+	assert block.get_columns([20, 3, 8]).tolist() == [3, 0, 2]
+	assert block.get_columns([]).tolist() == []
+	assert block.get_column(7) == 1
+	assert block.get_volume(6, 8) == 6.0
+
+@pytest.mark.parametrize('watermovers', [[5], [3, 4], [21], [0], [20, 100]])
+def test_block_columns_of_missing_watermovers(watermovers):
+	with pytest.raises(KeyError):
+		get_block().get_columns(watermovers)
+
+def test_block_column_of_missing_watermover():
+	with pytest.raises(KeyError):
+		get_block().get_column(5)
+	with pytest.raises(KeyError):
+		get_block().get_volume(5, 5)
+
+def test_incidence_of_missing_watermover():
+	incidence = TransectIncidence([({report_type.darcy_circle: {'in': [3, 9], 'out': [7]}}, None)])
+	with pytest.raises(KeyError):
+		incidence.multiply(get_block())
+
+def read_volumes(wbbudget):
+	water_budget_nc = netCDF4.Dataset(wbbudget, 'r')
+	volumes = np.ma.filled(water_budget_nc.variables['WaterMoverVolume'][:], 0)
+	water_budget_nc.close()
+	return volumes
+
+def assert_same_block(block, expected):
+	assert block.watermovers.tolist() == expected.watermovers.tolist()
+	assert block.start == expected.start
+	assert block.values.dtype == expected.values.dtype
+	assert np.array_equal(block.values, expected.values)
+
+def test_store_round_trip(wbbudget):
+	store_filename = PMGTransect_Store.convert(wbbudget, chunk_length=7)
+	assert store_filename == WaterMoverStore.get_store_filename(wbbudget)
+	assert sorted(os.listdir(os.path.dirname(wbbudget))) == ['wbbudget.nc', os.path.basename(store_filename)]
+	volumes = read_volumes(wbbudget)
+	store = WaterMoverStore.find(wbbudget)
+	assert store.shape == volumes.shape
+	assert np.array_equal(store.data.T, volumes)
+	for watermover in [0, 5, volumes.shape[1] - 1]:
+		assert np.array_equal(store.get_column(watermover), volumes[:, watermover])
+	block = store.read_columns([9, 2, 40, 2], 11, 30)
+	assert block.watermovers.tolist() == [2, 9, 40]
+	assert np.array_equal(block.values, volumes[11:30, [2, 9, 40]])
+
+def test_store_reads_consecutive_watermovers_without_copying(wbbudget):
+	store = WaterMoverStore(PMGTransect_Store.convert(wbbudget))
+	block = store.read_columns([4, 6, 5, 7], 3)
+	assert np.shares_memory(block.values, store.data)
+	assert np.array_equal(block.values, read_volumes(wbbudget)[3:, 4:8])
+	assert not np.shares_memory(store.read_columns([4, 6, 7]).values, store.data)
+
+def test_store_chunks_match_netcdf(wbbudget):
+	store = WaterMoverStore(PMGTransect_Store.convert(wbbudget))
+	water_budget_nc = netCDF4.Dataset(wbbudget, 'r')
+	volume = WaterMoverVolume(wbbudget, water_budget_nc.variables['WaterMoverVolume'])
+	water_budget_nc.close()
+	watermovers = [1, 3, 4, 30, 31, 90, 2]
+	blocks = list(store.iter_chunks(watermovers, 25))
+	expected = list(volume.iter_chunks(watermovers, 25))
+	assert [block.start for block in blocks] == [0, 25, 50]
+	for block, expected_block in zip(blocks, expected):
+		assert_same_block(block, expected_block)
+
+def test_netcdf_uses_current_store(wbbudget):
+	assert WaterMoverStore.find(wbbudget) == None
+	PMGTransect_Store.convert(wbbudget)
+	assert isinstance(Transect_NetCDF(wbbudget)._watermovervolume, WaterMoverStore)
+	# rewriting the wbbudget file leaves the store stale
+	write_wbbudget(wbbudget, timesteps=61)
+	assert WaterMoverStore.find(wbbudget) == None
+	assert isinstance(Transect_NetCDF(wbbudget)._watermovervolume, WaterMoverVolume)
+
+def rewrite_header(store_filename, **fields):
+	names = ['magic', 'version', 'dtype', 'watermovers', 'timesteps', 'source_size', 'source_mtime', 'data_offset']
+	with open(store_filename, 'r+b') as store_file:
+		header = dict(zip(names, STORE_HEADER.unpack(store_file.read(STORE_HEADER.size))))
+		header.update(fields)
+		store_file.seek(0)
+		store_file.write(STORE_HEADER.pack(*[header[name] for name in names]))
+
+@pytest.mark.parametrize('fields', [{'magic': b'NETCDF'}, {'version': 2}, {'data_offset': 8192}])
+def test_store_header_validation(wbbudget, fields):
+	store_filename = PMGTransect_Store.convert(wbbudget)
+	rewrite_header(store_filename, **fields)
+	with pytest.raises(ValueError):
+		WaterMoverStore(store_filename)
+	assert WaterMoverStore.find(wbbudget) == None
+
+def test_garbled_store_is_ignored(wbbudget):
+	store_filename = WaterMoverStore.get_store_filename(wbbudget)
+	with open(store_filename, 'wb') as store_file:
+		store_file.write(b'PMG')
+	assert WaterMoverStore.find(wbbudget) == None